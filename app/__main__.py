@@ -0,0 +1,8 @@
+"""
+Music-DL v2 sin interfaz gráfica: python -m app batch urls.txt
+"""
+
+import sys
+from app.cli import main
+
+sys.exit(main())
@@ -0,0 +1,296 @@
+# Modo sin interfaz gráfica (cron, servidores sin pantalla)
+# Este módulo nunca importa PyQt6 y yt_dlp solo se importa cuando un trabajo empieza
+import time
+
+_process_start = time.perf_counter() # Referencia para medir el tiempo de arranque
+
+import argparse
+import contextlib
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.core import config
+from app.core import ingest
+from app.core import jobs
+from app.core import library
+from app.core import metadata_cache
+from app.core import progress
+from app.core import service
+from app.core import workers
+from app.core.downloader import AlbumDownloader, SUPPORTED_FORMATS, parse_formats
+
+
+# Lee los formatos de salida separados por comas ("flac,mp3")
+def format_list(text: str) -> str:
+    formats = parse_formats(text)
+    unknown = [_format for _format in formats if _format not in SUPPORTED_FORMATS]
+    if not formats or unknown:
+        raise argparse.ArgumentTypeError(
+            f"formato no válido: {', '.join(unknown) or text} (opciones: {', '.join(SUPPORTED_FORMATS)})"
+        )
+    return ",".join(formats)
+
+
+# Carga la configuración de la aplicación y aplica los valores de la línea de comandos
+def load_settings(args) -> dict:
+    with open(config.app_config(), "r") as config_file:
+        settings = json.load(config_file)
+    if args.track_workers:
+        settings["track_workers"] = args.track_workers
+    if args.transcode_workers:
+        settings["transcode_workers"] = args.transcode_workers
+    if args.sync is not None:
+        settings["incremental_sync"] = args.sync
+    if args.profile:
+        settings["profile_jobs"] = True
+    if args.limit_kbps is not None:
+        settings["bandwidth_limit_kbps"] = args.limit_kbps
+    if args.backend:
+        settings["worker_backend"] = args.backend
+    if args.lazy is not None:
+        settings["lazy_playlist"] = args.lazy
+    if args.replaygain is not None:
+        settings["replaygain"] = args.replaygain
+    return settings
+
+
+# Descarga un álbum y devuelve su resumen (nunca lanza excepciones)
+# Con worker_backend "process" el álbum se descarga en un proceso de trabajo
+def run_album(url: str, args, settings: dict) -> dict:
+    started = time.perf_counter()
+    downloader = None
+    summary = {"url": url, "extractor_calls": 0, "first_request_at": None}
+    try:
+        if settings["worker_backend"] == "process":
+            result = workers.get_process_pool(settings, args.jobs).run(url, args.format, args.genre, args.out, url)
+        else:
+            downloader = AlbumDownloader(url, args.format, args.genre, args.out, settings)
+            result = downloader.run()
+        summary["extractor_calls"] = result["extractor_calls"]
+        summary.update({
+            "status": "error" if result["failed"] else "ok",
+            "album": result["album"],
+            "artist": result["artist"],
+            "tracks": result["tracks"],
+            "failed": result["failed"],
+            "missing": result["missing"],
+            "skipped": result["skipped"],
+            "fast_path": result["fast_path"],
+            "save_as": result["save_as"],
+            "formats": result["formats"],
+            "phases": result["phases"],
+            "first_track_seconds": result["first_track_seconds"],
+        })
+    except Exception as e:
+        summary.update({"status": "error", "error": str(e)})
+    if downloader is not None: # También cuando el trabajo falla
+        summary["extractor_calls"] = downloader.extractor_calls
+        summary["first_request_at"] = downloader.first_request_at
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+# Escribe una foto del bus de progreso como una línea JSON en stderr
+def print_progress(snapshot: dict) -> None:
+    albums = {str(key): album for key, album in snapshot["albums"].items()}
+    sys.stderr.write(json.dumps({"progress": {"albums": albums, "global": snapshot["global"]}}, ensure_ascii=False) + "\n")
+
+
+# Los álbumes de la fuente (archivo de URLs, álbum, artista o canal) se descargan a medida que se descubren
+# Como mucho hay 2 * jobs álbumes esperando un hilo, el resto del catálogo aún no se leyó
+# Con la sincronización incremental se omiten los álbumes ya completos en la carpeta de destino
+def command_batch(args) -> int:
+    settings = load_settings(args)
+    args.out = (args.out or settings["app_output_path"]).replace("\\", "/")
+
+    # Publica el progreso agrupado en stderr (una línea JSON por foto)
+    if args.progress:
+        progress.get_progress_bus(settings).subscribe(print_progress)
+
+    # La salida de los trabajos va a stderr, stdout queda solo para el resumen
+    futures = []
+    present = 0
+    seen = set() # Claves de los álbumes ya descubiertos (un álbum puede aparecer en varias pestañas)
+    slots = threading.BoundedSemaphore(2 * args.jobs)
+    with contextlib.redirect_stdout(sys.stderr):
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            for url in ingest.iter_album_urls(args.urls):
+                key = metadata_cache.cache_key(url)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if settings["incremental_sync"] and ingest.album_present(settings, url, args.out, args.format):
+                    present += 1
+                    continue
+                slots.acquire()
+                future = pool.submit(run_album, url, args, settings)
+                future.add_done_callback(lambda done: slots.release())
+                futures.append(future)
+            albums = [future.result() for future in futures]
+        if settings["worker_backend"] == "process":
+            workers.get_process_pool(settings, args.jobs).close()
+
+    # Tiempo desde el arranque hasta la primera petición de red
+    first_requests = [album.pop("first_request_at") for album in albums]
+    first_requests = [moment for moment in first_requests if moment is not None]
+    summary = {
+        "albums": albums,
+        "ok": sum(album["status"] == "ok" for album in albums),
+        "errors": sum(album["status"] != "ok" for album in albums),
+        "present": present, # Álbumes omitidos porque ya están completos en la carpeta de destino
+        "startup_ms": round((min(first_requests) - _process_start) * 1000, 1) if first_requests else None,
+        "elapsed_seconds": round(time.perf_counter() - _process_start, 3),
+    }
+    json.dump(summary, sys.stdout, ensure_ascii=False)
+    sys.stdout.write("\n")
+    return 0 if summary["errors"] == 0 else 1
+
+
+# Agrega a la cola de descargas de la interfaz gráfica los álbumes de una fuente, a medida que se descubren
+# Escribe cada álbum en stderr (una línea JSON) y el total por resultado en stdout
+def command_ingest(args) -> int:
+    with open(config.app_config(), "r") as config_file:
+        settings = json.load(config_file)
+    save = (args.out or settings["app_output_path"]).replace("\\", "/")
+
+    counts = {ingest.QUEUED: 0, ingest.IN_QUEUE: 0, ingest.PRESENT: 0}
+    with contextlib.redirect_stdout(sys.stderr):
+        albums = ingest.enqueue_albums(args.source, save, args.genre, args.format, settings, jobs.PRIORITIES[args.priority])
+        for album in albums:
+            counts[album["status"]] += 1
+            sys.stderr.write(json.dumps(album, ensure_ascii=False) + "\n")
+    json.dump(counts, sys.stdout)
+    sys.stdout.write("\n")
+    return 0
+
+
+# Servicio de descargas: API HTTP/JSON sobre la cola y, con --workers, trabajadores en este mismo proceso
+def command_serve(args) -> int:
+    with open(config.app_config(), "r") as config_file:
+        settings = json.load(config_file)
+    if args.lease:
+        settings["lease_seconds"] = args.lease
+    if args.backend:
+        settings["worker_backend"] = args.backend
+    job_service = service.JobService(settings, args.host or settings["service_host"], args.port or settings["service_port"])
+    workers_count = settings["max_threads"] if args.workers is None else args.workers
+    worker = None
+    if workers_count:
+        worker = service.Worker(job_service, settings, args.name or service.worker_name(), workers_count)
+        threading.Thread(target=worker.run, name="worker", daemon=True).start()
+    try:
+        job_service.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if worker is not None:
+            worker.stop()
+        job_service.stop()
+    return 0
+
+
+# Trabajador de otro equipo: reclama trabajos del servicio por la API
+def command_worker(args) -> int:
+    with open(config.app_config(), "r") as config_file:
+        settings = json.load(config_file)
+    if args.backend:
+        settings["worker_backend"] = args.backend
+    url = args.server or settings["service_url"] or f"http://{settings['service_host']}:{settings['service_port']}"
+    client = service.ServiceClient(url, settings["service_token"] if args.token is None else args.token)
+    worker = service.Worker(client, settings, args.name or service.worker_name(), args.jobs, args.out)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+
+def command_library(args) -> int:
+    with open(config.app_config(), "r") as config_file:
+        settings = json.load(config_file)
+    database_path = settings["db_library"]
+
+    if args.action == "rebuild": # Reconstrucción incremental desde el disco
+        result = library.rebuild(database_path, (args.root or settings["app_output_path"]).replace("\\", "/"))
+    elif args.action == "search":
+        started = time.perf_counter()
+        tracks = library.search(database_path, args.text, args.limit)
+        result = {"tracks": tracks, "query_ms": round((time.perf_counter() - started) * 1000, 2)}
+    else: # duplicates
+        result = library.duplicates(database_path)
+
+    json.dump(result, sys.stdout, ensure_ascii=False)
+    sys.stdout.write("\n")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app", description="Music-DL v2 sin interfaz gráfica")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", help="Descarga los álbumes de un archivo de URLs, un artista o un canal")
+    batch.add_argument("urls", help="Archivo con una URL por línea (- para la entrada estándar) o una URL de álbum, artista o canal")
+    batch.add_argument("--format", default="flac", type=format_list,
+                       help="Formato de salida; varios separados por comas (flac,mp3) se descargan una sola vez")
+    batch.add_argument("--genre", default="", help="Género musical")
+    batch.add_argument("--out", help="Carpeta de destino (por defecto la carpeta Output)")
+    batch.add_argument("--jobs", type=int, default=3, help="Álbumes simultáneos")
+    batch.add_argument("--track-workers", type=int, help="Pistas simultáneas (compartido por todos los álbumes)")
+    batch.add_argument("--transcode-workers", type=int, help="Conversiones de FFmpeg simultáneas")
+    batch.add_argument("--sync", action=argparse.BooleanOptionalAction, default=None,
+                       help="Solo descarga las pistas nuevas o modificadas (por defecto según la configuración)")
+    batch.add_argument("--lazy", action=argparse.BooleanOptionalAction, default=None,
+                       help="Empieza a descargar antes de resolver todas las pistas de la lista (por defecto según la configuración)")
+    batch.add_argument("--replaygain", action=argparse.BooleanOptionalAction, default=None,
+                       help="Mide la sonoridad y escribe las etiquetas ReplayGain (requiere NumPy; por defecto según la configuración)")
+    batch.add_argument("--progress", action="store_true", help="Escribe el progreso en stderr como líneas JSON")
+    batch.add_argument("--limit-kbps", type=int,
+                       help="Límite de ancho de banda de todas las descargas en kilobits por segundo (0 = sin límite)")
+    batch.add_argument("--backend", choices=["thread", "process"],
+                       help="Descarga cada álbum en un hilo o en un proceso aparte (por defecto según la configuración)")
+    batch.add_argument("--profile", action="store_true", help="Guarda un perfil de cProfile de cada álbum en Logs/profiles")
+    batch.set_defaults(handler=command_batch)
+
+    ingest_parser = commands.add_parser("ingest", help="Agrega a la cola de descargas los álbumes de un artista, un canal o un archivo de URLs")
+    ingest_parser.add_argument("source", help="URL de álbum, artista o canal, o archivo con una URL por línea (- para la entrada estándar)")
+    ingest_parser.add_argument("--format", default="flac", type=format_list, help="Formato de salida; varios separados por comas (flac,mp3)")
+    ingest_parser.add_argument("--genre", default="", help="Género musical")
+    ingest_parser.add_argument("--out", help="Carpeta de destino (por defecto la carpeta Output)")
+    ingest_parser.add_argument("--priority", choices=list(jobs.PRIORITIES), default="Normal", help="Prioridad de los trabajos")
+    ingest_parser.set_defaults(handler=command_ingest)
+
+    serve = commands.add_parser("serve", help="Servicio de descargas con API HTTP/JSON (la interfaz y los trabajadores son clientes)")
+    serve.add_argument("--host", help="Dirección donde escucha (por defecto service_host)")
+    serve.add_argument("--port", type=int, help="Puerto (por defecto service_port)")
+    serve.add_argument("--workers", type=int, help="Álbumes simultáneos en este equipo (por defecto max_threads, 0 = solo trabajadores remotos)")
+    serve.add_argument("--name", help="Nombre del trabajador local")
+    serve.add_argument("--lease", type=float, help="Segundos de concesión de cada trabajo (por defecto lease_seconds)")
+    serve.add_argument("--backend", choices=["thread", "process"], help="Descarga cada álbum en un hilo o en un proceso aparte")
+    serve.set_defaults(handler=command_serve)
+
+    worker_parser = commands.add_parser("worker", help="Trabajador que descarga los álbumes de la cola de un servicio")
+    worker_parser.add_argument("--server", help="URL del servicio (por defecto service_url)")
+    worker_parser.add_argument("--token", help="Clave de la API (por defecto service_token)")
+    worker_parser.add_argument("--jobs", type=int, default=3, help="Álbumes simultáneos")
+    worker_parser.add_argument("--name", help="Nombre del trabajador (por defecto equipo y un sufijo aleatorio)")
+    worker_parser.add_argument("--out", help="Carpeta de destino en este equipo (por defecto la de cada trabajo)")
+    worker_parser.add_argument("--backend", choices=["thread", "process"], help="Descarga cada álbum en un hilo o en un proceso aparte")
+    worker_parser.set_defaults(handler=command_worker)
+
+    library_parser = commands.add_parser("library", help="Biblioteca local de pistas descargadas")
+    library_actions = library_parser.add_subparsers(dest="action", required=True)
+    rebuild = library_actions.add_parser("rebuild", help="Actualiza la biblioteca leyendo los álbumes del disco")
+    rebuild.add_argument("root", nargs="?", help="Carpeta a recorrer (por defecto la carpeta Output)")
+    search = library_actions.add_parser("search", help="Busca por título, artista, álbum o género")
+    search.add_argument("text", help="Texto a buscar")
+    search.add_argument("--limit", type=int, default=50, help="Número máximo de resultados")
+    library_actions.add_parser("duplicates", help="Pistas que aparecen en más de un álbum")
+    library_parser.set_defaults(handler=command_library)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
@@ -0,0 +1,118 @@
+# Importación de módulos necesarios para el funcionamiento
+import os
+import sqlite3
+from datetime import datetime
+
+
+# Versión del esquema de la base de datos del archivo de descargas
+SCHEMA_VERSION = 1
+
+
+def _connect(database_path: str) -> sqlite3.Connection:
+    return sqlite3.connect(database_path, timeout=30)
+
+
+# Crea la base de datos del archivo de descargas
+# Guarda, por carpeta de destino y formato, las pistas ya descargadas y la fecha de modificación de cada álbum
+def create_database_archive(database_path: str) -> str:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    if cur.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return database_path
+
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tracks (
+            destination TEXT NOT NULL,
+            format TEXT NOT NULL,
+            video_id TEXT NOT NULL,
+            album_id TEXT,
+            date TEXT,
+            path TEXT NOT NULL,
+            downloaded_at TEXT,
+            PRIMARY KEY (destination, format, video_id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS albums (
+            destination TEXT NOT NULL,
+            format TEXT NOT NULL,
+            album_id TEXT NOT NULL,
+            modified_date TEXT,
+            PRIMARY KEY (destination, format, album_id)
+        )
+    """)
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    conn.close()
+    return database_path
+
+
+# Devuelve las pistas archivadas de un álbum: {video_id: {"date", "path"}}
+def get_album_tracks(database_path: str, destination: str, _format: str, album_id: str) -> dict:
+    conn = _connect(database_path)
+    rows = conn.execute(
+        "SELECT video_id, date, path FROM tracks WHERE destination = ? AND format = ? AND album_id = ?",
+        (destination, _format, album_id)
+    ).fetchall()
+    conn.close()
+    return {video_id: {"date": date, "path": path} for video_id, date, path in rows}
+
+
+# Devuelve la fecha de modificación guardada de un álbum (None si nunca se sincronizó)
+def get_album_date(database_path: str, destination: str, _format: str, album_id: str) -> str | None:
+    conn = _connect(database_path)
+    row = conn.execute(
+        "SELECT modified_date FROM albums WHERE destination = ? AND format = ? AND album_id = ?",
+        (destination, _format, album_id)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+# Registra una pista descargada y convertida
+def add_track(database_path: str, destination: str, _format: str, video_id: str,
+              album_id: str, date: str, path: str) -> None:
+    conn = _connect(database_path)
+    conn.execute(
+        "INSERT OR REPLACE INTO tracks (destination, format, video_id, album_id, date, path, downloaded_at) VALUES (?,?,?,?,?,?,?)",
+        (destination, _format, video_id, album_id, date, path, datetime.now().strftime("%d-%m-%Y, %H:%M:%S"))
+    )
+    conn.commit()
+    conn.close()
+
+
+# Cambia la ruta de las pistas movidas a la carpeta del álbum (paths relaciona cada ID con su ruta nueva)
+def update_track_paths(database_path: str, destination: str, _format: str, paths: dict) -> None:
+    if not paths:
+        return
+    conn = _connect(database_path)
+    conn.executemany(
+        "UPDATE tracks SET path = ? WHERE destination = ? AND format = ? AND video_id = ?",
+        [(path, destination, _format, video_id) for video_id, path in paths.items()]
+    )
+    conn.commit()
+    conn.close()
+
+
+# Guarda la fecha de modificación de un álbum sincronizado por completo
+def set_album_date(database_path: str, destination: str, _format: str, album_id: str, modified_date: str) -> None:
+    conn = _connect(database_path)
+    conn.execute(
+        "INSERT OR REPLACE INTO albums (destination, format, album_id, modified_date) VALUES (?,?,?,?)",
+        (destination, _format, album_id, modified_date)
+    )
+    conn.commit()
+    conn.close()
+
+
+# Devuelve las pistas que faltan por descargar
+# Una pista se omite si está en el archivo, su fecha no cambió y el archivo sigue en el disco
+def pending_songs(songs: list[dict], archived: dict) -> list[dict]:
+    pending = []
+    for song in songs:
+        track = archived.get(song["id"])
+        if track is None or track["date"] != song["date"] or not os.path.exists(track["path"]):
+            pending.append(song)
+    return pending
@@ -0,0 +1,131 @@
+# Importación de módulos necesarios para el funcionamiento
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from app.core import bandwidth
+from app.core import http_client
+
+
+# Caché de portadas en disco direccionado por contenido
+# Cada imagen se guarda una sola vez con el nombre de su hash (SHA-256), aunque varias URLs
+# (ediciones deluxe, discos de un mismo álbum) apunten a la misma imagen
+# Cuando se supera el tamaño máximo se eliminan las imágenes usadas hace más tiempo (LRU)
+class ArtworkCache:
+    # scheduler: planificador de ancho de banda compartido con las descargas (None = sin límite)
+    def __init__(self, cache_path: str, max_bytes: int, scheduler=None) -> None:
+        self.cache_path = cache_path
+        self.scheduler = scheduler
+        self.objects_path = os.path.join(cache_path, "objects")
+        self.max_bytes = max_bytes
+        self.database_path = os.path.join(cache_path, "artwork.db3")
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_path, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS objects_lru ON objects (last_used)")
+        conn.commit()
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.database_path, timeout=30)
+
+    # Ruta del archivo de una imagen según su hash
+    def object_file(self, digest: str) -> str:
+        return os.path.join(self.objects_path, digest[:2], f"{digest}.jpg")
+
+    # Devuelve la ruta de la imagen guardada para una URL o None si no está en caché
+    def lookup(self, url: str) -> str | None:
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute("SELECT hash FROM urls WHERE url = ?", (url,)).fetchone()
+            path = None
+            if row is not None and os.path.exists(self.object_file(row[0])):
+                conn.execute("UPDATE objects SET last_used = ? WHERE hash = ?", (time.time(), row[0]))
+                conn.commit()
+                path = self.object_file(row[0])
+            conn.close()
+            return path
+
+    # Guarda una imagen descargada y la asocia a su URL
+    # Si otra URL ya guardó la misma imagen, se reutiliza el mismo archivo
+    def store(self, url: str, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_file(digest)
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_file = f"{path}.{threading.get_ident()}.tmp"
+                with open(temp_file, "wb") as image:
+                    image.write(content)
+                os.replace(temp_file, path)
+
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (url, digest))
+            conn.execute("INSERT OR REPLACE INTO objects (hash, size, last_used) VALUES (?, ?, ?)",
+                         (digest, len(content), time.time()))
+            conn.commit()
+            self._evict(conn)
+            conn.close()
+        return path
+
+    # Elimina las imágenes usadas hace más tiempo hasta quedar por debajo del tamaño máximo
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, size in conn.execute("SELECT hash, size FROM objects ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            if os.path.exists(self.object_file(digest)):
+                os.remove(self.object_file(digest))
+            conn.execute("DELETE FROM urls WHERE hash = ?", (digest,))
+            conn.execute("DELETE FROM objects WHERE hash = ?", (digest,))
+            total -= size
+        conn.commit()
+
+    # Devuelve la ruta de la imagen de una URL, descargándola solo si no está en caché
+    def fetch(self, url: str) -> str | None:
+        path = self.lookup(url)
+        if path is not None:
+            return path
+        content = http_client.download(url, self.scheduler)
+        if content is None:
+            return None
+        return self.store(url, content)
+
+    # Copia la imagen de una URL a la ruta indicada
+    # Se usa un enlace duro cuando es posible (no ocupa espacio extra ni se copia el archivo)
+    def copy_to(self, url: str, target: str) -> str | None:
+        path = self.fetch(url)
+        if path is None:
+            return None
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(path, target)
+        except OSError: # Otro sistema de archivos o sin soporte de enlaces duros
+            shutil.copyfile(path, target)
+        return target
+
+
+# Caché compartido por todos los álbumes
+_artwork_cache = None
+_artwork_cache_lock = threading.Lock()
+
+
+# Devuelve el caché de portadas compartido con los valores de la configuración
+def get_artwork_cache(settings: dict) -> ArtworkCache:
+    global _artwork_cache
+    with _artwork_cache_lock:
+        if _artwork_cache is None:
+            _artwork_cache = ArtworkCache(
+                os.path.join(settings["app_cache_path"], "artwork"),
+                settings["artwork_cache_size_mb"] * 1024 * 1024,
+                bandwidth.get_bandwidth_scheduler(settings)
+            )
+        return _artwork_cache
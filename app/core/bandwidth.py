@@ -0,0 +1,182 @@
+# Importación de módulos necesarios para el funcionamiento
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+
+# Segundos entre cada lectura del archivo de configuración (ajustes sin reiniciar los trabajos)
+RELOAD_INTERVAL = 5
+
+
+# Limita los bytes por segundo de todas las descargas juntas (cubeta de fichas)
+# Cada descarga "gasta" los bytes que recibe; si se gasta más de lo permitido, espera
+# rate es en bytes por segundo (0 = sin límite) y se puede cambiar en cualquier momento
+class TokenBucket:
+    def __init__(self, rate: float = 0) -> None:
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate: float) -> None:
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            self.tokens = min(self.tokens, self.burst)
+
+    # Ráfaga máxima: un segundo de transferencia (mínimo 64 KB)
+    @property
+    def burst(self) -> float:
+        return max(self.rate, 64 * 1024)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+
+    # Gasta bytes y espera lo necesario para no superar el límite
+    # Las fichas pueden quedar en negativo (bloques más grandes que la ráfaga); la espera lo compensa
+    def consume(self, size: int) -> None:
+        with self.lock:
+            if not self.rate:
+                return
+            self._refill()
+            self.tokens -= size
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Reparte el ancho de banda entre todas las descargas del proceso (pistas y portadas)
+# - bandwidth_limit_kbps: límite global en kilobits por segundo (0 = sin límite)
+# - host_connections: conexiones simultáneas por servidor (0 = sin límite)
+# - bandwidth_schedule: franjas horarias con otros valores, p. ej.
+#   [{"start": "23:00", "end": "07:00", "limit_kbps": 0, "host_connections": 8}]
+# Los valores se vuelven a leer del archivo de configuración cada pocos segundos,
+# así se pueden cambiar sin reiniciar las descargas en curso
+class BandwidthScheduler:
+    def __init__(self, settings: dict) -> None:
+        self.bucket = TokenBucket()
+        self.condition = threading.Condition()
+        self.connections = {} # Conexiones abiertas por servidor
+        self.config_path = settings.get("app_config")
+        self.config_mtime = None # Solo se aplican los cambios hechos al archivo después de crear el planificador
+        if self.config_path and os.path.exists(self.config_path):
+            self.config_mtime = os.stat(self.config_path).st_mtime
+        self.checked = 0.0
+        self.limit_kbps = 0
+        self.host_connections = 0
+        self.schedule = []
+        self.active = None # Valores en vigor (límite, conexiones)
+        self.configure(settings.get("bandwidth_limit_kbps", 0), settings.get("host_connections", 0),
+                       settings.get("bandwidth_schedule", []))
+
+    # Cambia los valores en tiempo de ejecución (None = sin cambios)
+    def configure(self, limit_kbps: int | None = None, host_connections: int | None = None,
+                  schedule: list | None = None) -> None:
+        with self.condition:
+            if limit_kbps is not None:
+                self.limit_kbps = limit_kbps
+            if host_connections is not None:
+                self.host_connections = host_connections
+            if schedule is not None:
+                self.schedule = schedule
+            self.active = None
+        self.refresh(force=True)
+
+    # Devuelve el límite y las conexiones de la franja horaria actual (o los valores por defecto)
+    def current_values(self, now: datetime | None = None) -> tuple[int, int]:
+        clock = (now or datetime.now()).strftime("%H:%M")
+        for window in self.schedule:
+            start, end = window.get("start", "00:00"), window.get("end", "24:00")
+            inside = start <= clock < end if start <= end else (clock >= start or clock < end)
+            if inside:
+                return (window.get("limit_kbps", self.limit_kbps),
+                        window.get("host_connections", self.host_connections))
+        return self.limit_kbps, self.host_connections
+
+    # Vuelve a leer el archivo de configuración si cambió y aplica la franja horaria actual
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.checked < RELOAD_INTERVAL:
+            return
+        self.checked = now
+        self._reload_config()
+
+        values = self.current_values()
+        with self.condition:
+            if values == self.active:
+                return
+            self.active = values
+            self.condition.notify_all() # Puede haber más conexiones disponibles
+        self.bucket.set_rate(values[0] * 1000 / 8)
+
+    def _reload_config(self) -> None:
+        if not self.config_path:
+            return
+        try:
+            mtime = os.stat(self.config_path).st_mtime
+            if mtime == self.config_mtime:
+                return
+            with open(self.config_path, "r") as config_file:
+                settings = json.load(config_file)
+        except (OSError, ValueError):
+            return
+        self.config_mtime = mtime
+        with self.condition:
+            self.limit_kbps = settings.get("bandwidth_limit_kbps", self.limit_kbps)
+            self.host_connections = settings.get("host_connections", self.host_connections)
+            self.schedule = settings.get("bandwidth_schedule", self.schedule)
+
+    # Gasta los bytes recibidos de una descarga (espera si se supera el límite)
+    def consume(self, size: int) -> None:
+        if size > 0:
+            self.refresh()
+            self.bucket.consume(size)
+
+    # Ocupa una conexión con el servidor de la URL mientras dura el bloque
+    # Si el servidor ya tiene todas sus conexiones ocupadas, espera a que se libere una
+    @contextlib.contextmanager
+    def connection(self, url: str):
+        self.refresh()
+        host = host_key(url)
+        with self.condition:
+            while self.active[1] and self.connections.get(host, 0) >= self.active[1]:
+                self.condition.wait(timeout=RELOAD_INTERVAL)
+                self.refresh() # Una franja horaria nueva puede permitir más conexiones
+            self.connections[host] = self.connections.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.connections[host] -= 1
+                self.condition.notify_all()
+
+
+# Devuelve el servidor de una URL agrupado por dominio
+# Los servidores de YouTube cambian en cada pista (rr1---sn-xxx.googlevideo.com) y cuentan como uno solo
+def host_key(url: str) -> str:
+    host = urlparse(url).hostname or ""
+    labels = host.split(".")
+    if len(labels) > 2 and not host.replace(".", "").isdigit():
+        return ".".join(labels[-2:])
+    return host
+
+
+# Planificador compartido por todos los trabajos
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+# Devuelve el planificador compartido con los valores de la configuración
+def get_bandwidth_scheduler(settings: dict) -> BandwidthScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BandwidthScheduler(settings)
+        return _scheduler
@@ -2,72 +2,123 @@
 import json
 import sqlite3
 import os
+import threading
+from app.core import archive
+from app.core import jobs
+from app.core import library
 
 
-# Esta función crea la base de datos de formatos de audio popular
-# Si la base de datos ya existe, no hace nada
-def create_database_formats(database_path: str) -> str:
-    # Lista de formatos de audio populares
-    popular_formats = ["mp3", "flac", "wav", "aac", "ogg", "m4a"]
-
-    # Establece conexión con la base de datos
-    conn = sqlite3.connect(database_path)
-    cur = conn.cursor()
-    # Crea la tabla de formatos si no existe
-    cur.execute("CREATE TABLE IF NOT EXISTS formats (format TEXT UNIQUE)")
-    # Inserta cada formato en la base de datos
-    for _format in popular_formats:
-        cur.execute("INSERT OR IGNORE INTO formats (format) VALUES (?)", (_format,))
-    # Guarda los cambios y cierra la conexión
-    conn.commit()
-    conn.close()
-    return database_path
-
-
-# Crea la base de datos de géneros
-def create_database_genres(database_path: str) -> str:
-    # Lista de géneros populares
-    popular_genres = ["Pop", "Rock", "Hip-Hop", "Electrónica",
-                      "Reggaetón", "Jazz", "Blues", "R&B",
-                      "Country", "Metal", "Clásica", "Funk",
-                      "Soul", "Indie", "Latina", "Dubstep",]
-
-    # Establece conexión con la base de datos
-    conn = sqlite3.connect(database_path)
-    cur = conn.cursor()
-    # Crea la tabla de géneros si no existe
-    cur.execute("CREATE TABLE IF NOT EXISTS genres (genre TEXT UNIQUE)") # Crea la tabla de géneros si no existe
-    # Inserta cada género en la base de datos
-    for _genre in popular_genres:
-        cur.execute("INSERT OR IGNORE INTO genres (genre) VALUES (?)", (_genre,))
-    # Guarda los cambios y cierra la conexión
-    conn.commit()
-    conn.close()
-    return database_path
+# Versión del esquema de la base de datos del catálogo (formatos y géneros)
+# Si la base de datos tiene una versión menor, se crea o actualiza el esquema
+CATALOG_SCHEMA_VERSION = 1
+
+# Lista de formatos de audio populares
+POPULAR_FORMATS = ["mp3", "flac", "wav", "aac", "ogg", "m4a"]
+
+# Lista de géneros populares
+POPULAR_GENRES = ["Pop", "Rock", "Hip-Hop", "Electrónica",
+                  "Reggaetón", "Jazz", "Blues", "R&B",
+                  "Country", "Metal", "Clásica", "Funk",
+                  "Soul", "Indie", "Latina", "Dubstep",]
+
+# Conexiones abiertas y listas en memoria del catálogo, por ruta de la base de datos
+# Así la base de datos se abre una sola vez por proceso
+# La conexión se comparte entre hilos (la interfaz y los trabajos): cada uso se hace con el candado tomado
+_catalog_connections = {}
+_catalog_lists = {}
+_catalog_lock = threading.RLock()
+
+
+# Abre (una sola vez) la conexión con la base de datos del catálogo
+# Se llama con _catalog_lock tomado
+def _catalog(database_path: str) -> sqlite3.Connection:
+    conn = _catalog_connections.get(database_path)
+    if conn is None:
+        conn = sqlite3.connect(database_path, check_same_thread=False)
+        _catalog_connections[database_path] = conn
+    return conn
+
+
+# Crea la base de datos del catálogo con los formatos y géneros populares
+# Solo se crean las tablas y se insertan los valores la primera vez (según la versión del esquema)
+# Si existen las bases de datos de versiones anteriores (formats.db3 y genres.db3), copia sus valores
+def create_database_catalog(database_path: str, legacy_formats: str = None, legacy_genres: str = None) -> str:
+    with _catalog_lock:
+        conn = _catalog(database_path)
+        cur = conn.cursor()
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        if version >= CATALOG_SCHEMA_VERSION: # La base de datos ya está al día
+            return database_path
+
+        formats = list(POPULAR_FORMATS)
+        genres = list(POPULAR_GENRES)
+        # Recupera los géneros y formatos agregados en versiones anteriores
+        if legacy_formats and os.path.exists(legacy_formats):
+            formats += _read_legacy(legacy_formats, "SELECT format FROM formats")
+        if legacy_genres and os.path.exists(legacy_genres):
+            genres += _read_legacy(legacy_genres, "SELECT genre FROM genres")
+
+        # Crea las tablas si no existen
+        cur.execute("CREATE TABLE IF NOT EXISTS formats (format TEXT UNIQUE)")
+        cur.execute("CREATE TABLE IF NOT EXISTS genres (genre TEXT UNIQUE)")
+        # Inserta cada formato y género en la base de datos
+        cur.executemany("INSERT OR IGNORE INTO formats (format) VALUES (?)", [(_format,) for _format in formats])
+        cur.executemany("INSERT OR IGNORE INTO genres (genre) VALUES (?)", [(_genre,) for _genre in genres])
+        cur.execute(f"PRAGMA user_version = {CATALOG_SCHEMA_VERSION}")
+        # Guarda los cambios
+        conn.commit()
+        return database_path
+
+
+# Lee una columna de una base de datos antigua
+def _read_legacy(database_path: str, query: str) -> list[str]:
+    try:
+        conn = sqlite3.connect(database_path)
+        rows = [row[0] for row in conn.execute(query).fetchall()]
+        conn.close()
+    except sqlite3.Error:
+        rows = []
+    return rows
+
+
+# Extrae una lista del catálogo y la guarda en memoria
+# Las siguientes llamadas devuelven la lista guardada sin consultar la base de datos
+def _catalog_list(database_path: str, query: str) -> list[str]:
+    key = (database_path, query)
+    with _catalog_lock:
+        if key not in _catalog_lists:
+            _catalog_lists[key] = [row[0] for row in _catalog(database_path).execute(query).fetchall()]
+        return list(_catalog_lists[key])
+
+
+# Elimina las listas en memoria de una base de datos (se vuelven a leer en la siguiente consulta)
+def invalidate_catalog(database_path: str) -> None:
+    with _catalog_lock:
+        for key in [key for key in _catalog_lists if key[0] == database_path]:
+            del _catalog_lists[key]
 
 
 # Esta función extrae la lista de géneros de la base de datos
 # Tal lista esta ordenada alfabéticamente (A-Z) con código SQL
 # y los devuelve en una lista ordenada
 def get_genres_list(database_path: str) -> list[str]:
-    conn = sqlite3.connect(database_path)
-    cur = conn.cursor()
-    cur.execute("SELECT genre FROM genres ORDER BY genre ASC")
-    genres = [row[0] for row in cur.fetchall()] # Extrae los géneros en una lista
-    conn.close()
-    return genres
+    return _catalog_list(database_path, "SELECT genre FROM genres ORDER BY genre ASC")
 
 
 # Esta función extrae la lista de formatos de la base de datos
 # Tal lista esta ordenada alfabéticamente (A-Z) con código SQL
 # y los devuelve en una lista ordenada
 def get_formats_list(database_path: str) -> list[str]:
-    conn = sqlite3.connect(database_path)
-    cur = conn.cursor()
-    cur.execute("SELECT format FROM formats ORDER BY format ASC")
-    formats = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return formats
+    return _catalog_list(database_path, "SELECT format FROM formats ORDER BY format ASC")
+
+
+# Agrega un género nuevo a la base de datos y actualiza la lista en memoria
+def add_genre(database_path: str, genre: str) -> None:
+    with _catalog_lock:
+        conn = _catalog(database_path)
+        conn.execute("INSERT OR IGNORE INTO genres (genre) VALUES (?)", (genre.title(),))
+        conn.commit()
+        invalidate_catalog(database_path)
 
 
 # Esta función extrae el perfil del usuario
@@ -77,6 +128,15 @@ def get_user_profile() -> str:
     return os.path.expanduser("~")
 
 
+# Lee el archivo de configuración; devuelve None si no existe
+def _read_config(json_path: str) -> dict | None:
+    try:
+        with open(json_path, "r") as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        return None
+
+
 # Esta función crea las carpetas de la aplicación
 # Si la carpeta no existe, la crea
 # De lo contrario, solo devuelve la ruta de la carpeta
@@ -96,21 +156,92 @@ def app_config():
     _user_profile = get_user_profile() # Extrae la ruta del perfil del usuario
     _user_profile = _user_profile.replace("\\", "/") # Reemplaza las barras invertidas por barras normales
     
-    # Crea las carpetas necesarias para la aplicación
-    app_path = create_directory(f"{_user_profile}/Music-DL") # Crea la carpeta Music-DL en Documents del perfil del usuario
-    app_databases_path = create_directory(f"{app_path}/Databases") # Crea la carpeta databases
-    app_output_path = create_directory(f"{app_path}/Output") # Crea la carpeta output, donde se guardarán los archivos descargados
-    app_config_path = create_directory(f"{app_path}/Config") # Crea la carpeta config, donde se guardarán los archivos de configuración
-    
-    # Crea las bases de datos necesarias
-    db_formats = create_database_formats(f"{app_databases_path}/formats.db3") # Crea la base de datos de formatos
-    db_genres = create_database_genres(f"{app_databases_path}/genres.db3") # Crea la base de datos de géneros músicales
+    # Rutas de las carpetas de la aplicación
+    # Las carpetas de salida, caché y registros no se crean aquí: las crea la función que las usa por primera vez
+    app_path = f"{_user_profile}/Music-DL" # Carpeta Music-DL en el perfil del usuario
+    app_databases_path = f"{app_path}/Databases" # Carpeta de las bases de datos
+    app_output_path = f"{app_path}/Output" # Carpeta output, donde se guardarán los archivos descargados
+    app_config_path = f"{app_path}/Config" # Carpeta config, donde se guardarán los archivos de configuración
+    app_cache_path = f"{app_path}/Cache" # Carpeta cache, donde se guardan los metadatos extraídos y las portadas
+    app_logs_path = f"{app_path}/Logs" # Carpeta logs, donde se guardan las métricas de los trabajos
+
+    # Rutas de las bases de datos
+    db_catalog = f"{app_databases_path}/catalog.db3" # Formatos y géneros músicales
+    db_formats = db_catalog # Los formatos están en la base de datos del catálogo
+    db_genres = db_catalog # Los géneros están en la base de datos del catálogo
+    db_music_list = f"{app_databases_path}/music_list.db3" # Cola de descargas
+    db_archive = f"{app_databases_path}/archive.db3" # Pistas ya descargadas
+    db_library = f"{app_databases_path}/library.db3" # Biblioteca local
 
     # Ruta del archivo de configuración JSON
     json_path = f"{app_config_path}/app_config.json"
-    
+    config = _read_config(json_path)
+
+    # Las carpetas y las bases de datos solo se crean en el primer arranque, cuando cambia la versión de
+    # algún esquema (guardadas en la configuración) o si falta alguna base de datos
+    # En los demás arranques no se crea nada ni se abre ninguna base de datos
+    schema_versions = {
+        "catalog": CATALOG_SCHEMA_VERSION,
+        "music_list": jobs.SCHEMA_VERSION,
+        "archive": archive.SCHEMA_VERSION,
+        "library": library.SCHEMA_VERSION
+    }
+    databases = (db_catalog, db_music_list, db_archive, db_library)
+    if (config is None or config.get("schema_versions") != schema_versions
+            or not all(os.path.exists(database_path) for database_path in databases)):
+        create_directory(app_config_path)
+        create_directory(app_databases_path)
+        create_database_catalog(
+            db_catalog,
+            legacy_formats=f"{app_databases_path}/formats.db3",
+            legacy_genres=f"{app_databases_path}/genres.db3"
+        )
+        jobs.create_database_music_list(db_music_list)
+        archive.create_database_archive(db_archive)
+        library.create_database_library(db_library)
+
+    # Valores ajustables por el usuario, solo se escriben si no existen en el archivo de configuración
+    default_settings = {
+        "max_threads": 3, # Número de álbumes que se descargan al mismo tiempo
+        "track_workers": 4, # Número de pistas que se descargan al mismo tiempo (compartido por todos los álbumes)
+        "transcode_workers": 0, # Número de conversiones de FFmpeg simultáneas (0 = número de núcleos)
+        "transcode_queue_size": 0, # Archivos en espera de conversión antes de pausar las descargas (0 = el doble de conversiones)
+        "metadata_cache_ttl": 10800, # Segundos que se reutilizan los metadatos extraídos (los enlaces de audio caducan a las ~6 horas)
+        "artwork_cache_size_mb": 200, # Tamaño máximo del caché de portadas
+        "incremental_sync": True, # Solo descarga las pistas que no están ya en la carpeta de destino
+        "library_dedupe": True, # Enlaza las pistas que ya están en otro álbum de la biblioteca en lugar de descargarlas
+        "progress_rate_hz": 5, # Veces por segundo que se publica el progreso de las descargas
+        "metrics_enabled": True, # Guarda los tiempos de cada trabajo como líneas JSON en metrics_path
+        "metrics_path": f"{app_logs_path}/metrics.jsonl", # Archivo de métricas de los trabajos
+        "metrics_prometheus_path": "", # Archivo de texto para Prometheus (node_exporter), vacío = desactivado
+        "profile_jobs": False, # Guarda un perfil de cProfile de cada trabajo en la carpeta Logs/profiles
+        "debug_metadata": False, # Guarda los metadatos completos del extractor en metadata_url.json (sin caché)
+        "bandwidth_limit_kbps": 0, # Límite de todas las descargas juntas en kilobits por segundo (0 = sin límite)
+        "host_connections": 6, # Conexiones simultáneas por servidor (0 = sin límite)
+        "bandwidth_schedule": [], # Franjas horarias con otro límite, p. ej. {"start": "23:00", "end": "07:00", "limit_kbps": 0}
+        "track_retries": 3, # Reintentos de cada pista que falla antes de darla por perdida
+        "retry_base_delay": 2, # Segundos de espera antes del primer reintento (se duplica en cada intento)
+        "retry_max_delay": 60, # Espera máxima entre reintentos en segundos
+        "embed_tags": True, # Escribe las etiquetas (título, artista, álbum, género, año, número de pista) y la portada
+        "cover_size": 600, # Tamaño máximo en píxeles de la portada incrustada
+        "worker_backend": "thread", # Dónde se descargan los álbumes: "thread" (hilos) o "process" (un proceso por álbum simultáneo)
+        "lazy_playlist": False, # Empieza a descargar con los IDs de la lista y resuelve cada pista en segundo plano
+        "resolve_workers": 2, # Pistas que se resuelven al mismo tiempo en cada álbum (lazy_playlist)
+        "cover_cache_items": 300, # Portadas de la lista de descargas que se guardan en memoria
+        "service_url": "", # URL del servicio de descargas (python -m app serve); vacío = la interfaz descarga por sí misma
+        "service_host": "127.0.0.1", # Dirección donde escucha el servicio (0.0.0.0 para aceptar trabajadores de otros equipos)
+        "service_port": 8765, # Puerto del servicio
+        "service_token": "", # Clave compartida de la API (cabecera Authorization: Bearer), vacío = sin clave
+        "service_events": 10000, # Cambios de trabajos que el servicio recuerda para los clientes (GET /events)
+        "lease_seconds": 60, # Segundos que un trabajo queda concedido a un trabajador sin recibir su latido
+        "job_max_attempts": 3, # Veces que se concede un trabajo antes de darlo por fallido (trabajadores que se cuelgan)
+        "worker_poll_seconds": 2, # Segundos entre consultas de un trabajador cuando la cola está vacía
+        "fsync_batch": 16, # Pistas que se escriben en el disco antes de moverlas a la carpeta del álbum (0 = sin fsync)
+        "replaygain": False # Mide la sonoridad (EBU R128) y escribe las etiquetas ReplayGain de cada pista y álbum (requiere NumPy)
+    }
+
     # Si no existe el archivo de configuración, lo crea con valores predeterminados
-    if not os.path.exists(json_path):
+    if config is None:
         _config_values = {
             "app_name": app_name,
             "app_version": app_version,
@@ -119,50 +250,74 @@ def app_config():
             "app_path": app_path,
             "app_databases_path": app_databases_path,
             "app_output_path": app_output_path,
+            "app_cache_path": app_cache_path,
             "app_config": json_path,
             "db_formats": db_formats,
-            "db_genres": db_genres
+            "db_genres": db_genres,
+            "db_music_list": db_music_list,
+            "db_archive": db_archive,
+            "db_library": db_library,
+            "schema_versions": schema_versions,
+            **default_settings
         }
 
         with open(json_path, "w") as config_file:
             json.dump(_config_values, config_file, indent=4)
 
     # Si existe el archivo, actualiza los valores si es necesario
-    elif os.path.exists(json_path):
-        # Lee la configuración actual que tiene guardada la aplicación
-        with open(json_path, "r") as config_file:
-            config = json.load(config_file)
+    else:
+        saved_config = dict(config) # Copia para saber si hubo cambios
 
-            # Verifica y actualiza cada valor de configuración que sea necesario para la aplicación
-            if "app_name" not in config or config["app_name"] != app_name:
-                config["app_name"] = app_name
+        # Verifica y actualiza cada valor de configuración que sea necesario para la aplicación
+        if "app_name" not in config or config["app_name"] != app_name:
+            config["app_name"] = app_name
 
-            if "app_version" not in config or config["app_version"] != app_version:
-                config["app_version"] = app_version
+        if "app_version" not in config or config["app_version"] != app_version:
+            config["app_version"] = app_version
 
-            if "app_icon" not in config or config["app_icon"] != app_icon:
-                config["app_icon"] = app_icon
-            
-            if "ffmpeg_path" not in config or config["ffmpeg_path"] != ffmpeg_path:
-                config["ffmpeg_path"] = ffmpeg_path
-            
-            if "app_path" not in config or config["app_path"] != app_path:
-                config["app_path"] = app_path
+        if "app_icon" not in config or config["app_icon"] != app_icon:
+            config["app_icon"] = app_icon
+        
+        if "ffmpeg_path" not in config or config["ffmpeg_path"] != ffmpeg_path:
+            config["ffmpeg_path"] = ffmpeg_path
+        
+        if "app_path" not in config or config["app_path"] != app_path:
+            config["app_path"] = app_path
 
-            if "app_databases_path" not in config or config["app_databases_path"] != app_databases_path:
-                config["app_databases_path"] = app_databases_path
+        if "app_databases_path" not in config or config["app_databases_path"] != app_databases_path:
+            config["app_databases_path"] = app_databases_path
 
-            if "app_output_path" not in config or config["app_output_path"] != app_output_path:
-                config["app_output_path"] = app_output_path
+        if "app_output_path" not in config or config["app_output_path"] != app_output_path:
+            config["app_output_path"] = app_output_path
 
-            if "db_formats" not in config or config["db_formats"] != db_formats:
-                config["db_formats"] = db_formats
+        if "app_cache_path" not in config or config["app_cache_path"] != app_cache_path:
+            config["app_cache_path"] = app_cache_path
 
-            if "db_genres" not in config or config["db_genres"] != db_genres:
-                config["db_genres"] = db_genres
+        if "db_formats" not in config or config["db_formats"] != db_formats:
+            config["db_formats"] = db_formats
 
-        # Guarda la configuración actualizada
-        with open(json_path, "w") as config_file:
-            json.dump(config, config_file, indent=4)
+        if "db_genres" not in config or config["db_genres"] != db_genres:
+            config["db_genres"] = db_genres
+
+        if "db_music_list" not in config or config["db_music_list"] != db_music_list:
+            config["db_music_list"] = db_music_list
+
+        if "db_archive" not in config or config["db_archive"] != db_archive:
+            config["db_archive"] = db_archive
+
+        if "db_library" not in config or config["db_library"] != db_library:
+            config["db_library"] = db_library
+
+        # Versiones de los esquemas ya creados (el siguiente arranque no los vuelve a revisar)
+        config["schema_versions"] = schema_versions
+
+        # Agrega los valores ajustables que falten sin sobrescribir los del usuario
+        for key, value in default_settings.items():
+            config.setdefault(key, value)
+
+        # Guarda la configuración actualizada, solo si cambió algún valor
+        if config != saved_config:
+            with open(json_path, "w") as config_file:
+                json.dump(config, config_file, indent=4)
 
     return json_path
@@ -0,0 +1,890 @@
+# Importación de módulos necesarios para el funcionamiento
+import copy
+import errno
+import glob
+import json
+import os
+import re
+import threading
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from app.core import archive
+from app.core import artwork
+from app.core import bandwidth
+from app.core import library
+from app.core import loudness
+from app.core import metadata_cache
+from app.core import metrics
+from app.core import progress
+from app.core import retry
+from app.core import tagging
+from app.core import transcoder
+
+
+# Formatos compatible la configuración
+SUPPORTED_FORMATS = ["flac", "mp3", "wav", "aac", "opus"]
+
+# caracteres que no se permiten en nombres de archivos y carpetas
+_char_pattern = r'[\/\\*?"<>|:]'
+
+# Un trabajo cancelado (cancel) termina con este error; las pistas ya convertidas quedan en el archivo de descargas
+class JobCancelled(RuntimeError):
+    pass
+
+
+# Pool de hilos compartido por todos los álbumes para descargar pistas
+_track_pool = None
+_track_pool_lock = threading.Lock()
+
+
+# Devuelve el pool compartido de descarga de pistas
+# Se crea la primera vez que se necesita con el número de hilos indicado
+def get_track_pool(max_workers: int) -> ThreadPoolExecutor:
+    global _track_pool
+    with _track_pool_lock:
+        if _track_pool is None:
+            _track_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="track")
+        return _track_pool
+
+
+# Reemplaza los caracteres que no se permiten en nombres de archivos
+def clean_name(name: str) -> str:
+    return re.sub(_char_pattern, " -", name)
+
+
+# Enlaza (enlace duro) un archivo existente en otra ruta; si no es posible, lo copia
+def link_file(source: str, target: str) -> str:
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError: # Otro sistema de archivos o sin soporte de enlaces duros
+        shutil.copyfile(source, target)
+    return target
+
+
+# Enlaza una pista que ya está en otro álbum y le escribe las etiquetas y la portada de este álbum
+# Las etiquetas se escriben en una copia que reemplaza al enlace: el archivo del otro álbum no cambia
+# Sin etiquetas (embed_tags desactivado) solo se enlaza
+def link_track(ffmpeg_path: str, source: str, target: str, tags: dict | None, cover: str | None) -> str:
+    link_file(source, target)
+    if tags is None:
+        return target
+    name, extension = os.path.splitext(target)
+    try:
+        transcoder.add_tags(ffmpeg_path, target, tags, f"{name}.retag{extension}", cover, replace=True)
+    except RuntimeError:
+        os.remove(target)
+        raise
+    return target
+
+
+# Oculta una carpeta en Windows (en los demás sistemas basta con que su nombre empiece con ".")
+# Se cambian los atributos directamente, sin abrir un proceso de attrib por carpeta
+def hide_folder(path: str) -> None:
+    if os.name != "nt":
+        return
+    import ctypes
+
+    file_attribute_hidden = 0x02
+    kernel32 = ctypes.windll.kernel32
+    attributes = kernel32.GetFileAttributesW(path)
+    if attributes != 0xFFFFFFFF and not attributes & file_attribute_hidden: # 0xFFFFFFFF: la ruta no existe
+        kernel32.SetFileAttributesW(path, attributes | file_attribute_hidden)
+
+
+# Escribe en el disco el contenido de un archivo o las entradas de una carpeta (fsync)
+# Windows no permite abrir carpetas: allí solo se sincronizan los archivos
+def fsync_path(path: str) -> None:
+    folder = os.path.isdir(path)
+    if folder and os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY if folder else os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Mueve un archivo terminado a su ruta definitiva
+# La carpeta temporal está dentro de la carpeta del álbum (mismo sistema de archivos): os.replace solo
+# renombra y el archivo aparece completo o no aparece. Si aun así están en sistemas de archivos distintos
+# (p. ej. .temp es un punto de montaje), se copia junto al destino y se renombra desde ahí
+def move_file(source: str, target: str) -> str:
+    try:
+        os.replace(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        partial = f"{target}.part"
+        shutil.copyfile(source, partial)
+        fsync_path(partial)
+        os.replace(partial, target)
+        os.remove(source)
+    return target
+
+
+# Verifica un archivo convertido antes de moverlo a la carpeta del álbum (existe y no está vacío)
+def verified_output(path: str) -> bool:
+    return os.path.isfile(path) and os.path.getsize(path) > 0
+
+
+# Convierte el formato de un trabajo en la lista de formatos de salida
+# Acepta un formato ("flac"), varios separados por comas ("flac,mp3") o una lista
+def parse_formats(value) -> list[str]:
+    items = value.split(",") if isinstance(value, str) else value
+    formats = []
+    for item in items:
+        item = item.strip().lower()
+        if item and item not in formats:
+            formats.append(item)
+    return formats
+
+
+# Carpeta de destino de un formato (clave del archivo de descargas)
+# Con un solo formato el álbum se guarda directamente en la carpeta de destino,
+# con varios cada formato tiene su propia carpeta (destino/FLAC, destino/MP3...)
+def format_root(save_as: str, formats: list[str], _format: str) -> str:
+    return save_as if len(formats) == 1 else f"{save_as}/{_format.upper()}"
+
+
+# Mensaje de error de un trabajo con pistas que agotaron sus reintentos
+def missing_error(missing: list[dict]) -> str:
+    titles = ", ".join(track["title"] for track in missing)
+    return f"Pistas faltantes ({len(missing)}): {titles}"
+
+
+# Construye la URL de una pista a partir de la entrada de la lista de reproducción
+# Las entradas sin resolver (extracción plana) solo tienen el enlace a la pista en "url"
+def track_url(entry: dict) -> str:
+    if entry.get("webpage_url"):
+        return entry["webpage_url"]
+    if entry.get("_type") == "url" and entry.get("url"):
+        return entry["url"]
+    return f"https://music.youtube.com/watch?v={entry['id']}"
+
+
+# Datos de una pista a partir de su entrada en la lista de reproducción
+def song_info(entry: dict, track_number: int) -> dict:
+    return {
+        "id": entry.get("id"), # ID
+        "url": track_url(entry), # URL de la pista
+        "title": entry.get("title", "Sin título"), # Titulo
+        "artist_principal": (entry.get("uploader") or "Artista desconocido").replace(" - Topic", ""), # Artista principal
+        "artists": entry.get("artists", "Artistas desconocidos"), # Artistas
+        "year": entry.get("release_year", ""), # Año de creacion/modificacion
+        "date": entry.get("upload_date", ""), # Fecha de creacion/modificacion
+        "track_number": track_number # Número de pista en el álbum
+    }
+
+
+# Descarga un álbum completo: extrae los metadatos, prepara las carpetas
+# y reparte cada pista en el pool compartido
+# Con varios formatos ("flac,mp3") cada pista se descarga una sola vez y se convierte a cada formato
+# en paralelo; cada formato se guarda en su propia carpeta (p. ej. Output/FLAC y Output/MP3)
+class AlbumDownloader:
+    def __init__(self, url: str, _format, genre: str, save_as: str, settings: dict,
+                 job_key=None, on_started=None) -> None:
+        self.url = url
+        self.formats = parse_formats(_format) # Formatos de salida
+        self.genre = genre
+        self.save_as = save_as.replace("\\", "/")
+        self.settings = settings # Configuración de la aplicación (app_config.json)
+        self.job_key = job_key if job_key is not None else url # Identifica el álbum en el bus de progreso
+        self.progress_bus = progress.get_progress_bus(settings)
+        self.bandwidth = bandwidth.get_bandwidth_scheduler(settings) # Límite de ancho de banda compartido
+        self._received = {} # Bytes ya contados de cada pista en el límite de ancho de banda
+        self.on_started = on_started # Recibe el diccionario con la información del álbum
+        self.raw_metadata = None # Metadatos completos del extractor (solo con debug_metadata)
+        self.entries = {} # Entradas ya resueltas de la lista de reproducción por ID de pista
+        self.album_id = None # ID de la lista de reproducción del álbum
+        self.extractor_calls = 0 # Número de llamadas al extractor de yt_dlp hechas por este trabajo
+        self.fast_path_tracks = 0 # Pistas cuyo audio se copió sin recodificar
+        self.album_metadata = None # Metadatos del álbum para las etiquetas de cada pista
+        self.cover = None # Portada preparada una sola vez para todas las pistas del álbum
+        self.cover_tags = {} # Portada como etiqueta (formatos sin pista de imagen, p. ej. opus)
+        self.trees = {} # Carpetas de cada formato: destino, álbum, metadatos, archivos y convertidos
+        self.first_request_at = None # Momento (perf_counter) de la primera petición de red
+        self._calls_lock = threading.Lock()
+        self.metrics = metrics.JobMetrics(self.job_key, url) # Tiempos de cada fase y de cada pista
+        self.record = None # Métricas del trabajo terminado (las que se guardaron con record_job)
+        self.lazy = settings["lazy_playlist"] and not settings["debug_metadata"] # Extracción plana de la lista
+        self.flat = False # Las entradas de la lista aún no están resueltas (lazy_playlist)
+        self.flat_metadata = None # Metadatos de la lista sin las entradas (para el caché)
+        self.resolver = None # Hilos que resuelven las entradas en segundo plano
+        self.resolving = {} # Future de la resolución de cada pista por ID
+        self.cancelled = threading.Event() # El trabajo se canceló (ver cancel)
+        self.replaygain = settings["replaygain"] and loudness.available() # Mide la sonoridad y escribe ReplayGain
+        self.loudness = {} # Medición de sonoridad de cada pista convertida en este trabajo por ID
+
+    # Cancela el trabajo desde otro hilo: no se envían más pistas, las que esperan en el pool o en la cola
+    # de reintentos se descartan y las descargas en curso se interrumpen en el siguiente aviso de progreso
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    # Guarda el momento de la primera petición de red del trabajo
+    def mark_request(self) -> None:
+        if self.first_request_at is None:
+            self.first_request_at = time.perf_counter()
+
+    # Llama al extractor de yt_dlp y cuenta la llamada
+    def extract_info(self, ytd, url: str, download: bool) -> dict:
+        with self._calls_lock:
+            self.extractor_calls += 1
+            self.mark_request()
+        return ytd.extract_info(url, download=download)
+
+    # Obtiene los metadatos de la URL desde el caché o, si no están, con el extractor
+    # Solo se conservan los campos que usa la aplicación (los metadatos completos ocupan megabytes)
+    # Con debug_metadata siempre se usa el extractor y se guardan los metadatos completos
+    def extract_metadata(self) -> dict:
+        import yt_dlp # Se importa solo cuando un trabajo se ejecuta (arranque rápido)
+
+        cache_path = self.settings["app_cache_path"]
+        debug = self.settings["debug_metadata"]
+        if not debug:
+            metadata = metadata_cache.load_metadata(cache_path, self.url, self.settings["metadata_cache_ttl"])
+            if metadata is not None:
+                return metadata
+
+        ydl_opts = { # opciones de yt_dlp
+            "quiet" : True, # Muestra solo advertencias importantes
+            'no_warnings': True,  # Suprime las advertencias
+            'format' : transcoder.format_selector(self.formats), # Mismo formato que la descarga, así las entradas ya quedan resueltas
+        }
+        if self.lazy: # Solo los IDs y títulos de las pistas, las entradas se resuelven mientras se descarga
+            ydl_opts["extract_flat"] = "in_playlist"
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ytd: # Descarga solo los metadatos de la URL
+            raw_metadata = self.extract_info(ytd, self.url, download=False)
+        if debug:
+            self.raw_metadata = raw_metadata
+        metadata = metadata_cache.trim_metadata(raw_metadata)
+
+        # Con entradas sin resolver el caché se guarda al terminar, con los metadatos completos
+        if self.lazy and any(not entry.get("formats") for entry in metadata["entries"]):
+            self.flat = True
+            self.flat_metadata = {key: value for key, value in metadata.items() if key != "entries"}
+            return metadata
+        metadata_cache.save_metadata(cache_path, self.url, metadata)
+        return metadata
+
+    # Envía el progreso de cada pista al bus de progreso (no publica nada directamente)
+    # yt_dlp llama al hook en el mismo hilo después de cada bloque recibido: si se supera el límite
+    # de ancho de banda, el hook espera y la descarga se detiene hasta que vuelve al ritmo permitido
+    def progress_hook(self, d):
+        track_key = d.get('info_dict', {}).get('id') or d.get('filename')
+        if self.cancelled.is_set():
+            raise JobCancelled("Trabajo cancelado")
+        if d['status'] == 'downloading':
+            total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+            downloaded = d.get('downloaded_bytes', 0) or 0
+            self.progress_bus.update(self.job_key, track_key, downloaded, int(total or 0))
+            received = downloaded - self._received.get(track_key, 0)
+            self._received[track_key] = downloaded
+            self.bandwidth.consume(received)
+        elif d['status'] == 'finished':
+            self.progress_bus.finish_track(self.job_key, track_key)
+
+    # Ejecuta el trabajo y guarda sus métricas (con cProfile si profile_jobs está activado)
+    def run(self) -> dict:
+        try:
+            result = metrics.profiled(self.settings, f"job-{self.job_key}", self.download)
+        except Exception as e:
+            self.metrics.error()
+            self.record = metrics.record_job(self.settings, self.metrics, "error", str(e))
+            raise
+        self.record = metrics.record_job(self.settings, self.metrics, "error" if result["failed"] else "ok")
+        return {**result, "phases": self.record["phases"], "first_track_seconds": self.record["first_track_seconds"]}
+
+    def download(self) -> dict:
+        with self.metrics.phase("extract"):
+            metadata = self.extract_metadata()
+
+        # Obtiene su titulo, artista principal, artistas, año y fecha de creacion/modificacion de cada pista
+        playlist_entries = metadata.get("entries", [])
+        self.entries = {entry.get("id"): entry for entry in playlist_entries}
+        self.album_id = metadata["id"]
+        songs = [song_info(entry, index) for index, entry in enumerate(playlist_entries, start=1)]
+
+        # Las entradas sin resolver (lazy_playlist) se resuelven en segundo plano mientras empiezan las descargas
+        if self.flat:
+            self.start_resolving(songs)
+        try:
+            return self.download_songs(metadata, songs)
+        finally:
+            if self.resolver is not None:
+                self.resolver.shutdown(wait=False, cancel_futures=True)
+
+    # Prepara las carpetas y la portada del álbum y descarga sus pistas
+    def download_songs(self, metadata: dict, songs: list[dict]) -> dict:
+        channel = self.album_channel(metadata, songs)
+
+        # Obtiene la URL de la miniatura
+        thumbnail_url = metadata.get("thumbnails", [])[-2]["url"]
+
+        # Obtiene el nombre del álbum
+        album = metadata.get("title").replace("Album - ", "")
+        album_title = clean_name(album)
+
+        # Obtiene el numero de pistas en el album
+        playlist_count = metadata.get("playlist_count")
+
+        # Obtiene la fecha de creacion/modificacion del album
+        date_album = metadata.get("modified_date")
+
+        album_metadata = {
+            "id": metadata["id"], # ID
+            "channel": channel, # Canal del creador
+            "thumbnail_url": thumbnail_url, # URL de la miniatura
+            "album_title": album_title, # Titulo del album
+            "playlist_count": playlist_count, # Numero de pistas del album
+            "date": date_album, # Fecha de creacion/modificacion
+            "year": date_album[:4], # Año de creacion/modificacion
+            "genre": self.genre, # Genero musical
+            "songs_metadata": songs # Entidades (canciones)
+        }
+
+        with self.metrics.phase("prepare"):
+            for _format in self.formats:
+                self.prepare_tree(_format, channel, album_title)
+            self.write_album_metadata(album_metadata)
+
+            # Guarda los metadatos completos del extractor en un archivo JSON (solo con debug_metadata)
+            first_tree = self.trees[self.formats[0]]
+            if self.raw_metadata is not None:
+                with open(f"{first_tree['metadata']}/metadata_url.json", "w", encoding="utf-8") as data:
+                    json.dump(self.raw_metadata, data, indent=4)
+                self.raw_metadata = None
+
+        with self.metrics.phase("thumbnail"):
+            for _format in self.formats: # Después de la primera descarga la miniatura sale del caché de portadas
+                thumbnail = self.download_thumbnail(thumbnail_url, self.trees[_format]["metadata"], "thumbnail")
+            self.prepare_tagging(album_metadata, thumbnail, first_tree["metadata"])
+
+        # Emitir señal con información del álbum
+        album_info = {
+            'thumbnail': thumbnail_url,
+            'album': album_title,
+            'artist': channel,
+            'tracks': playlist_count,
+            'save_as': first_tree["save_as"]
+        }
+        if self.on_started is not None:
+            self.on_started(album_info)
+        self.progress_bus.start_album(self.job_key, album_title, channel, playlist_count)
+
+        try:
+            missing, skipped = self.download_album(songs, album_metadata, date_album)
+        finally:
+            self.progress_bus.finish_album(self.job_key)
+
+        return {
+            **album_info,
+            "formats": {_format: tree["save_as"] for _format, tree in self.trees.items()}, # Carpeta de cada formato
+            "failed": list(missing), # IDs de las pistas que faltan
+            "missing": list(missing.values()), # Pistas que faltan con sus formatos, el número de intentos y el último error
+            "skipped": skipped,
+            "fast_path": self.fast_path_tracks, # Conversiones copiadas sin recodificar
+            "extractor_calls": self.extractor_calls
+        }
+
+    # Obtiene el nombre del canal (artista del álbum): el artista común a todas las pistas
+    # Con las entradas sin resolver (lazy_playlist) se usa el canal de la lista o, si no lo tiene,
+    # el primer artista de la primera pista (solo se espera a que se resuelva esa pista)
+    def album_channel(self, metadata: dict, songs: list[dict]) -> str:
+        if self.flat:
+            channel = metadata.get("channel") or metadata.get("uploader")
+            if channel:
+                return channel.replace(" - Topic", "")
+            self.claim_entry(songs[0], cancel=False)
+            artists = songs[0]["artists"]
+            return artists[0] if isinstance(artists, list) and artists else songs[0]["artist_principal"]
+
+        common_artists = set(songs[0]["artists"])
+        for song in songs[1:]:
+            common_artists.intersection_update(song["artists"])
+
+        if common_artists:
+            return next(iter(common_artists))
+        return metadata["entries"][0]["artists"][0]
+
+    # Guarda los metadatos necesario para el album en un archivo JSON (en la carpeta de cada formato)
+    def write_album_metadata(self, album_metadata: dict) -> None:
+        for tree in self.trees.values():
+            with open(f"{tree['metadata']}/metadata_album.json", "w", encoding="utf-8") as data:
+                json.dump({**album_metadata, "save_as": tree["save_as"]}, data, ensure_ascii=False, separators=(",", ":"))
+
+    # Empieza a resolver las entradas de la lista en orden, en segundo plano (lazy_playlist)
+    def start_resolving(self, songs: list[dict]) -> None:
+        self.resolver = ThreadPoolExecutor(max_workers=self.settings["resolve_workers"], thread_name_prefix="resolve")
+        for song in songs:
+            self.resolving[song["id"]] = self.resolver.submit(self.resolve_entry, song)
+
+    # Resuelve una entrada de la lista (formatos, artistas, fechas) y completa los datos de su pista
+    def resolve_entry(self, song: dict) -> dict:
+        import yt_dlp
+
+        started = time.monotonic()
+        ydl_opts = {
+            "quiet": True,
+            "no_warnings": True,
+            "format": transcoder.format_selector(self.formats),
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ytd:
+            entry = metadata_cache.trim_entry(self.extract_info(ytd, song["url"], download=False))
+        self.entries[song["id"]] = entry
+        song.update(song_info(entry, song["track_number"]))
+        self.metrics.track(song["id"], resolve_seconds=round(time.monotonic() - started, 3))
+        return entry
+
+    # Espera a que se resuelva la entrada de una pista (lazy_playlist)
+    # Con cancel, si la resolución aún no empezó se cancela: quien la espera la resuelve al descargarla
+    def claim_entry(self, song: dict, cancel: bool = True) -> None:
+        future = self.resolving.get(song["id"])
+        if future is None or (cancel and future.cancel()):
+            return
+        try:
+            future.result()
+        except Exception as e:
+            print(f"No se pudo resolver la pista {song['title']}: {e}")
+
+    # Espera todas las entradas y guarda los metadatos completos en el caché (lazy_playlist)
+    # Si alguna entrada se resolvió al descargarla, no se guarda el caché (sus metadatos no quedaron reducidos)
+    def finish_resolving(self, songs: list[dict], album_metadata: dict) -> None:
+        for song in songs:
+            self.claim_entry(song, cancel=False)
+        self.write_album_metadata(album_metadata)
+        if all(song["id"] in self.entries for song in songs):
+            metadata = {**self.flat_metadata, "entries": [self.entries[song["id"]] for song in songs]}
+            metadata_cache.save_metadata(self.settings["app_cache_path"], self.url, metadata)
+        self.flat = False
+
+    # Crea las carpetas de un formato
+    def prepare_tree(self, _format: str, channel: str, album_title: str) -> dict:
+        root = format_root(self.save_as, self.formats, _format)
+        save_as = os.path.join(root, channel, album_title).replace("\\", "/")
+        save_as_temp, save_as_metadata, save_as_files, save_as_converted = self.prepare_folders(save_as)
+        self.trees[_format] = {
+            "root": root, # Carpeta de destino del formato (clave del archivo de descargas)
+            "save_as": save_as, # Carpeta del álbum
+            "temp": save_as_temp, # Se elimina al finalizar el álbum
+            "metadata": save_as_metadata,
+            "files": save_as_files,
+            "converted": save_as_converted,
+        }
+        return self.trees[_format]
+
+    # Crea la carpeta del álbum, su carpeta de metadatos y sus carpetas temporales (ocultas)
+    # La carpeta temporal está dentro de la del álbum, así al finalizar las pistas solo se renombran
+    # Devuelve las rutas de la carpeta temporal, los metadatos, los archivos descargados y los convertidos
+    def prepare_folders(self, save_as: str) -> tuple[str, str, str, str]:
+        os.makedirs(save_as, exist_ok=True)
+
+        # Crea la carpeta para los metadatos (se conserva: la lee la reconstrucción de la biblioteca)
+        save_as_metadata = os.path.join(save_as, ".metadata")
+        os.makedirs(save_as_metadata, exist_ok=True)
+        hide_folder(save_as_metadata)
+
+        # Crea la carpeta oculta temporal
+        save_as_temp = os.path.join(save_as, ".temp")
+        os.makedirs(save_as_temp, exist_ok=True)
+        hide_folder(save_as_temp)
+
+        # Crea la carpeta para los archivos descargados sin metadatos
+        save_as_files = os.path.join(save_as_temp, "files")
+        os.makedirs(save_as_files, exist_ok=True)
+
+        # Crea la carpeta para los archivos convertidos al formato elegido
+        save_as_converted = os.path.join(save_as_temp, "converted")
+        os.makedirs(save_as_converted, exist_ok=True)
+
+        return save_as_temp, save_as_metadata, save_as_files, save_as_converted
+
+    # Descarga las pistas pendientes del álbum y lo registra en el archivo y la biblioteca (en cada formato)
+    # Devuelve las pistas que faltan después de los reintentos y el número de pistas omitidas
+    def download_album(self, songs: list[dict], album_metadata: dict, date_album: str) -> tuple[dict, int]:
+        # Cuando el formato se encuentra en la lista de formatos permitidos
+        formats = [_format for _format in self.formats if _format in SUPPORTED_FORMATS]
+
+        # Formatos que faltan de cada pista
+        needed = {song["id"]: [] for song in songs}
+        for _format in formats:
+            pending = songs
+            if self.settings["incremental_sync"]: # Solo se descargan las pistas nuevas o modificadas
+                archived = archive.get_album_tracks(
+                    self.settings["db_archive"], self.trees[_format]["root"], _format, self.album_id
+                )
+                if archived and self.flat: # La sincronización compara la fecha de cada pista
+                    for song in songs:
+                        self.claim_entry(song, cancel=False)
+                pending = archive.pending_songs(songs, archived)
+            for song in pending:
+                needed[song["id"]].append(_format)
+        pending = [song for song in songs if needed[song["id"]]]
+        skipped = len(songs) - len(pending)
+
+        with self.metrics.phase("tracks"):
+            missing = self.download_tracks(pending, needed)
+        if self.cancelled.is_set():
+            raise JobCancelled("Trabajo cancelado")
+
+        if self.replaygain:
+            with self.metrics.phase("loudness"):
+                self.tag_loudness(songs, formats)
+
+        with self.metrics.phase("finalize"):
+            if self.flat:
+                self.finish_resolving(songs, album_metadata)
+            titles = {song["id"]: song["title"] for song in songs}
+            for _format in formats:
+                root = self.trees[_format]["root"]
+                archived = archive.get_album_tracks(self.settings["db_archive"], root, _format, self.album_id)
+                for video_id in self.finalize_tracks(_format, archived):
+                    track = missing.setdefault(video_id, {
+                        "id": video_id, "title": titles.get(video_id, video_id), "formats": [],
+                        "attempts": 1, "error": "el archivo convertido está vacío"
+                    })
+                    track["formats"].append(_format)
+                if not any(_format in track["formats"] for track in missing.values()):
+                    # El álbum quedó completo con esta fecha de modificación
+                    archive.set_album_date(self.settings["db_archive"], root, _format, self.album_id, date_album)
+
+                # Agrega las pistas del álbum (nuevas y ya descargadas) a la biblioteca
+                archived = archive.get_album_tracks(self.settings["db_archive"], root, _format, self.album_id)
+                files = {video_id: track["path"] for video_id, track in archived.items() if os.path.exists(track["path"])}
+                library.add_album(self.settings["db_library"], album_metadata, files, _format)
+
+            # Sin pistas faltantes se elimina la carpeta temporal; si faltan, se conserva para continuar sus .part
+            if not missing:
+                for _format in formats:
+                    shutil.rmtree(self.trees[_format]["temp"], ignore_errors=True)
+        self.metrics.error(len(missing))
+
+        return missing, skipped
+
+    # Escribe las etiquetas ReplayGain de las pistas del álbum (replaygain)
+    # Las pistas convertidas en este trabajo se midieron al convertirse; las demás pistas del álbum
+    # (omitidas por la sincronización o enlazadas desde la biblioteca) se miden desde su archivo, en paralelo
+    # en la etapa de conversión. Las mediciones se guardan en .metadata/loudness.json: una pista anterior
+    # solo se vuelve a etiquetar si cambió la medición del álbum. Las etiquetas se agregan sin recodificar
+    def tag_loudness(self, songs: list[dict], formats: list[str]) -> None:
+        stored = loudness.read_measurements(f"{self.trees[formats[0]]['metadata']}/loudness.json")
+        measured = {**stored["tracks"], **self.loudness}
+        archived = {
+            _format: archive.get_album_tracks(self.settings["db_archive"], self.trees[_format]["root"], _format, self.album_id)
+            for _format in formats
+        }
+
+        analysis = {}
+        for song in songs:
+            if song["id"] in measured:
+                continue
+            paths = [archived[_format][song["id"]]["path"] for _format in formats if song["id"] in archived[_format]]
+            paths = [path for path in paths if verified_output(path)]
+            if paths:
+                analysis[song["id"]] = transcoder.get_transcoder(self.settings).submit_analysis(paths[0])
+        for video_id, future in analysis.items():
+            try:
+                measured[video_id] = future.result()
+            except Exception as e:
+                print(f"No se pudo medir la sonoridad de {video_id}: {e}")
+
+        tracks = {song["id"]: measured[song["id"]] for song in songs if song["id"] in measured}
+        if not tracks:
+            return
+        album = loudness.album_measurement(list(tracks.values()))
+        album_changed = album != stored["album"]
+        ffmpeg_path = transcoder.ffmpeg_executable(self.settings)
+        for _format in formats:
+            if _format not in loudness.TAG_FORMATS:
+                continue
+            for video_id, track in archived[_format].items():
+                if video_id not in tracks or not verified_output(track["path"]):
+                    continue
+                if not album_changed and video_id in stored["tracks"] and video_id not in self.loudness:
+                    continue # Ya tiene las etiquetas de esta medición
+                tags = loudness.replaygain_tags(tracks[video_id], album, _format)
+                if not tags:
+                    continue
+                if _format == "opus": # La portada de opus se vuelve a escribir como etiqueta
+                    tags.update(self.cover_tags)
+                name, extension = os.path.splitext(os.path.basename(track["path"]))
+                try:
+                    transcoder.add_tags(
+                        ffmpeg_path, track["path"], tags, f"{self.trees[_format]['converted']}/{name}.replaygain{extension}"
+                    )
+                except RuntimeError as e:
+                    print(f"No se pudieron escribir las etiquetas ReplayGain de {track['path']}: {e}")
+        for tree in self.trees.values():
+            loudness.write_measurements(f"{tree['metadata']}/loudness.json", album, tracks)
+
+    # Mueve las pistas convertidas de la carpeta temporal a la carpeta del álbum
+    # Solo se mueven las que están en el archivo de descargas (conversión terminada, también de un intento
+    # anterior) y pasan la verificación: una pista a medias (p. ej. FFmpeg interrumpido) nunca llega a la
+    # carpeta del álbum ni a la biblioteca. Cada tanda de fsync_batch pistas se escribe en el disco antes
+    # de renombrarse y la carpeta del álbum se sincroniza una vez por tanda (fsync_batch 0 = sin fsync)
+    # Devuelve los IDs de las pistas que no pasaron la verificación (se eliminan y se vuelven a descargar)
+    def finalize_tracks(self, _format: str, archived: dict) -> list[str]:
+        tree = self.trees[_format]
+        converted = os.path.abspath(tree["converted"])
+        pending = [
+            (video_id, track["path"]) for video_id, track in archived.items()
+            if os.path.dirname(os.path.abspath(track["path"])) == converted
+        ]
+        batch_size = self.settings["fsync_batch"]
+        rejected = []
+        moved = {} # Ruta temporal -> ruta definitiva
+        paths = {} # Ruta definitiva de cada pista movida por ID
+        for start in range(0, len(pending), batch_size or len(pending) or 1):
+            batch = []
+            for video_id, path in pending[start:start + (batch_size or len(pending))]:
+                if not verified_output(path):
+                    rejected.append(video_id)
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                if batch_size:
+                    fsync_path(path)
+                batch.append((video_id, path))
+            for video_id, path in batch:
+                target = f"{tree['save_as']}/{os.path.basename(path)}"
+                moved[path] = paths[video_id] = move_file(path, target)
+            if batch and batch_size:
+                fsync_path(tree["save_as"])
+        archive.update_track_paths(self.settings["db_archive"], tree["root"], _format, paths)
+        library.move_files(self.settings["db_library"], moved)
+        return rejected
+
+    # Reparte cada pista del álbum en el pool compartido
+    # Las pistas descargadas pasan a la etapa de conversión (una por formato, en paralelo) sin ocupar el hilo de descarga
+    # Una pista que falla (al descargar o al convertir) se vuelve a intentar desde la cola de reintentos
+    # con retroceso exponencial, solo con los formatos que faltan; la descarga continúa desde el archivo
+    # .part que quedó a medias, y si el archivo original ya está descargado no se vuelve a descargar
+    # El álbum termina cuando cada pista se convirtió o agotó sus intentos (track_retries)
+    # needed son los formatos que faltan de cada pista (se actualiza)
+    # Devuelve las pistas que faltan: {ID: {"id", "title", "formats", "attempts", "error"}}
+    def download_tracks(self, songs: list[dict], needed: dict) -> dict:
+        pool = get_track_pool(self.settings["track_workers"])
+        retries = retry.get_retry_queue()
+        pending = {} # Future -> (pista, etapa, formato)
+        converting = {} # Conversiones en curso de cada pista
+        sources = {} # Archivo original de cada pista
+        errors = {} # Último error de cada pista
+        attempts = {}
+        missing = {}
+
+        # Envía una pista al pool, o a la cola de reintentos si debe esperar
+        def submit(song: dict, delay: float = 0.0) -> None:
+            if self.cancelled.is_set():
+                return
+            arguments = (song, list(needed[song["id"]]), time.monotonic() + delay)
+            if delay:
+                future = retries.schedule(delay, pool, self.download_track, *arguments)
+            else:
+                future = pool.submit(self.download_track, *arguments)
+            pending[future] = (song, "download", None)
+
+        for song in songs:
+            submit(song)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED, timeout=0.5)
+            if self.cancelled.is_set(): # Descarta las pistas que aún no empezaron
+                for future in pending:
+                    future.cancel()
+            for future in done:
+                song, stage, _format = pending.pop(future)
+                if future.cancelled():
+                    continue
+                error = future.exception()
+                if error is None and stage == "download": # Descargada, espera las conversiones
+                    sources[song["id"]], conversions = future.result()
+                    converting[song["id"]] = len(conversions)
+                    for conversion_format, conversion in conversions.items():
+                        pending[conversion] = (song, "convert", conversion_format)
+                    continue
+
+                if error is None: # Registra la pista en el archivo de descargas
+                    self.track_converted(song, _format, future)
+                    needed[song["id"]].remove(_format)
+                else:
+                    errors[song["id"]] = f"{stage} {_format or ''}: {error}".replace(" :", ":")
+
+                if stage == "convert":
+                    converting[song["id"]] -= 1
+                    if converting[song["id"]]: # Faltan otras conversiones de la misma pista
+                        continue
+                    if not needed[song["id"]]: # Todas las conversiones terminaron bien
+                        if sources[song["id"]] is not None and os.path.exists(sources[song["id"]]):
+                            os.remove(sources[song["id"]])
+                        continue
+
+                if self.cancelled.is_set(): # Una pista del trabajo cancelado no se reintenta
+                    continue
+                attempts[song["id"]] = attempts.get(song["id"], 0) + 1
+                self.metrics.track(song["id"], attempts=attempts[song["id"]])
+                if attempts[song["id"]] <= self.settings["track_retries"]:
+                    delay = retry.backoff_delay(
+                        attempts[song["id"]] - 1, self.settings["retry_base_delay"], self.settings["retry_max_delay"]
+                    )
+                    print(f"Reintentando la pista {song['title']} en {delay:.1f} s ({errors[song['id']]})")
+                    submit(song, delay)
+                else:
+                    print(f"Error en la pista {song['title']} ({errors[song['id']]})")
+                    missing[song["id"]] = {
+                        "id": song["id"], "title": song["title"], "formats": list(needed[song["id"]]),
+                        "attempts": attempts[song["id"]], "error": errors[song["id"]]
+                    }
+        return missing
+
+    # Registra una conversión terminada en las métricas y en el archivo de descargas
+    def track_converted(self, song: dict, _format: str, future: Future) -> None:
+        self.metrics.track_done()
+        fast_path = getattr(future, "fast_path", False)
+        self.fast_path_tracks += fast_path
+        self.metrics.add(
+            song["id"],
+            transcode_wait=getattr(future, "transcode_wait", 0.0),
+            transcode_seconds=getattr(future, "transcode_seconds", 0.0),
+            fast_path=fast_path
+        )
+        if getattr(future, "loudness", None) is not None:
+            self.loudness[song["id"]] = future.loudness
+        archive.add_track(self.settings["db_archive"], self.trees[_format]["root"], _format,
+                          song["id"], self.album_id, song["date"], future.result())
+
+    # Descarga el audio original de una sola pista y lo envía a la etapa de conversión
+    # submitted es el momento en que la pista entró al pool (para medir la espera)
+    # Devuelve la ruta del archivo original (None si no se descargó) y el Future de la conversión de cada formato
+    def download_track(self, song: dict, formats: list[str], submitted: float) -> tuple[str | None, dict]:
+        token = metrics.track_pool_usage.start()
+        started = time.monotonic()
+        self.metrics.track(song["id"], queue_wait=round(started - submitted, 3))
+        try:
+            return self._download_track(song, formats)
+        finally:
+            self.metrics.track(song["id"], download_seconds=round(time.monotonic() - started, 3))
+            metrics.track_pool_usage.stop(token)
+
+    def _download_track(self, song: dict, formats: list[str]) -> tuple[str | None, dict]:
+        import yt_dlp
+
+        if self.flat: # Espera la resolución de la entrada si ya empezó (si no, se resuelve al descargarla)
+            self.claim_entry(song)
+
+        targets = {
+            _format: os.path.join(
+                self.trees[_format]["converted"], f"{clean_name(song['title'])}.{transcoder.output_extension(_format)}"
+            )
+            for _format in formats
+        }
+
+        # Si la pista ya está en otro álbum de la biblioteca, se enlaza en lugar de descargarla
+        # (con las etiquetas y la portada de este álbum)
+        conversions = {}
+        if self.settings["library_dedupe"]:
+            for _format in formats:
+                existing = library.find_track(self.settings["db_library"], song["id"], _format)
+                if existing is None or os.path.abspath(existing) == os.path.abspath(targets[_format]):
+                    continue
+                tags, cover = self.track_tagging(song, _format)
+                try:
+                    path = link_track(transcoder.ffmpeg_executable(self.settings), existing, targets[_format], tags, cover)
+                except RuntimeError as e:
+                    print(f"No se pudieron escribir las etiquetas de {song['title']} ({_format}), se descarga: {e}")
+                    continue
+                conversions[_format] = Future()
+                conversions[_format].set_result(path)
+                self.metrics.track(song["id"], linked=True)
+        formats = [_format for _format in formats if _format not in conversions]
+        if not formats:
+            return None, conversions
+
+        # El archivo original se descarga una sola vez (en la carpeta del primer formato)
+        save_as_files = self.trees[self.formats[0]]["files"]
+
+        # Una descarga interrumpida continúa desde su archivo .part (petición con Range)
+        # Los bytes que ya estaban no cuentan para el límite de ancho de banda
+        for part_file in glob.glob(os.path.join(glob.escape(save_as_files), f"{glob.escape(song['id'])}.*.part")):
+            self._received[song["id"]] = os.path.getsize(part_file)
+            self.metrics.track(song["id"], resumed_bytes=self._received[song["id"]])
+
+        ydl_opts = {
+            'format' : transcoder.format_selector(formats), # Prefiere el códec elegido (se copia sin recodificar)
+            'continuedl': True,  # Continúa las descargas a medias
+            'quiet': True,  # Suprime la salida
+            'noprogress': True,  # El progreso se informa con el hook
+            'no_warnings': True,  # Suprime las advertencias
+            'progress_hooks': [self.progress_hook],  # Agregar hook de progreso
+            'outtmpl': fr"{save_as_files}/%(id)s.%(ext)s"  # ruta de destino por defecto
+        }
+
+        with self.bandwidth.connection(self.media_url(song)), yt_dlp.YoutubeDL(ydl_opts) as ytd:
+            info = self.download_entry(ytd, song)
+        if song["id"] not in self.entries: # Entrada resuelta al descargarla (lazy_playlist)
+            song.update(song_info(info, song["track_number"]))
+        source = info["requested_downloads"][0]["filepath"]
+        self.metrics.track(song["id"], bytes=os.path.getsize(source))
+        source_codec = info["requested_downloads"][0].get("acodec") or info.get("acodec")
+
+        # Las etiquetas y la portada se escriben al convertir (un solo paso)
+        # La sonoridad se mide en la primera conversión, con el mismo audio decodificado (replaygain)
+        for index, _format in enumerate(formats):
+            tags, cover = self.track_tagging(song, _format)
+            conversions[_format] = transcoder.get_transcoder(self.settings).submit(
+                source, targets[_format], _format, source_codec, tags, cover, analyze=self.replaygain and index == 0
+            )
+        return source, conversions
+
+    # Devuelve la URL del audio de una pista (para contar las conexiones por servidor)
+    # Si la entrada no tiene formatos se usa la URL de la pista
+    def media_url(self, song: dict) -> str:
+        entry = self.entries.get(song["id"]) or {}
+        formats = entry.get("formats") or [{}]
+        return entry.get("url") or formats[-1].get("url") or song["url"]
+
+    # Descarga una pista reutilizando la entrada ya extraída de la lista de reproducción
+    # Si la entrada no tiene formatos o sus enlaces caducaron, vuelve a extraer solo esa pista
+    def download_entry(self, ytd, song: dict) -> dict:
+        import yt_dlp
+
+        entry = self.entries.get(song["id"])
+        if entry and entry.get("formats"):
+            with self._calls_lock:
+                self.mark_request()
+            try:
+                return ytd.process_ie_result(copy.deepcopy(entry), download=True)
+            except yt_dlp.utils.DownloadError as e:
+                print(f"Reintentando la extracción de {song['title']}: {e}")
+        return self.extract_info(ytd, song["url"], download=True)
+
+    # Prepara las etiquetas del álbum y su portada una sola vez para todas las pistas (y todos los formatos)
+    # La portada se reduce a cover_size px y cada pista la copia sin volver a decodificarla
+    def prepare_tagging(self, album_metadata: dict, thumbnail: str | None, save_as_metadata: str) -> None:
+        if not self.settings["embed_tags"]:
+            return
+        self.album_metadata = album_metadata
+        self.cover = tagging.prepare_cover(
+            transcoder.ffmpeg_executable(self.settings), thumbnail,
+            os.path.join(save_as_metadata, "cover.jpg"), self.settings["cover_size"]
+        )
+        if self.cover is not None and "opus" in self.formats:
+            self.cover_tags = {"METADATA_BLOCK_PICTURE": tagging.picture_block(self.cover)}
+
+    # Devuelve las etiquetas y la portada de una pista en un formato (None si no se etiqueta)
+    # opus guarda la portada como etiqueta y los demás formatos como pista de imagen
+    def track_tagging(self, song: dict, _format: str) -> tuple[dict | None, str | None]:
+        if self.album_metadata is None:
+            return None, None
+        tags = tagging.track_tags(self.album_metadata, song)
+        if _format == "opus":
+            tags.update(self.cover_tags)
+        return tags, self.cover if _format in tagging.ATTACHED_PIC_FORMATS else None
+
+    # Descarga la miniatura
+    # Se reutiliza la imagen del caché de portadas si ya se descargó antes
+    def download_thumbnail(self, thumbnail_url: str, save_as: str, file_name: str) -> str:
+        save = os.path.join(save_as, f"{file_name}.jpg")
+        return artwork.get_artwork_cache(self.settings).copy_to(thumbnail_url, save)
@@ -0,0 +1,55 @@
+# Importación de módulos necesarios para el funcionamiento
+import contextlib
+import threading
+
+
+# Tiempo máximo de espera (conexión, lectura) en segundos
+DEFAULT_TIMEOUT = (10, 30)
+
+# Tamaño de cada bloque leído en las descargas con límite de ancho de banda
+CHUNK_SIZE = 64 * 1024
+
+# Sesión HTTP compartida por todos los hilos (reutiliza las conexiones abiertas)
+_session = None
+_session_lock = threading.Lock()
+
+
+# Devuelve la sesión HTTP compartida
+# Se crea la primera vez que se necesita, con un pool de conexiones por servidor
+# y reintentos automáticos ante errores temporales
+def get_session(pool_size: int = 16):
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests # Se importa solo cuando se hace la primera petición
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+# Hace una petición GET con la sesión compartida y el tiempo de espera por defecto
+def get(url: str, **kwargs):
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    return get_session().get(url, **kwargs)
+
+
+# Descarga el contenido de una URL respetando el planificador de ancho de banda (si se indica)
+# Devuelve None si el servidor no responde 200
+def download(url: str, scheduler=None) -> bytes | None:
+    connection = scheduler.connection(url) if scheduler is not None else contextlib.nullcontext()
+    with connection:
+        with get(url, stream=True) as _response:
+            if _response.status_code != 200:
+                return None
+            chunks = []
+            for chunk in _response.iter_content(CHUNK_SIZE):
+                if scheduler is not None:
+                    scheduler.consume(len(chunk))
+                chunks.append(chunk)
+    return b"".join(chunks)
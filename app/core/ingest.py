@@ -0,0 +1,175 @@
+# Importación de módulos necesarios para el funcionamiento
+import os
+import re
+import sys
+from urllib.parse import parse_qs, urlparse
+from app.core import archive
+from app.core import jobs
+from app.core import metadata_cache
+from app.core.downloader import format_root, parse_formats
+
+
+# Resultado de agregar un álbum descubierto a la cola
+QUEUED = "queued" # Agregado a la cola
+IN_QUEUE = "in_queue" # Ya estaba en la cola (pendiente, en descarga o terminado)
+PRESENT = "present" # Ya está completo en la carpeta de destino
+
+# Niveles de páginas que se recorren como máximo (p. ej. canal -> pestaña -> álbumes)
+MAX_DEPTH = 2
+
+# Dominios de YouTube y YouTube Music
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com")
+
+# Página principal de un canal o artista (sin pestaña)
+CHANNEL_PATH = re.compile(r"/(channel/[\w-]+|@[\w.%-]+|c/[\w.%-]+|user/[\w.%-]+)/?")
+
+
+# Tipo de una URL sin extraerla: "album" (lista de reproducción o álbum de YouTube Music),
+# "track" (un video o una mezcla automática) o "listing" (canal, pestaña, artista...)
+def url_kind(url: str) -> str:
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    if "list" in query:
+        return "track" if query["list"][0].startswith("RD") else "album" # Las mezclas (RD...) no terminan nunca
+    if parsed.path.startswith("/browse/MPREb_"):
+        return "album"
+    if "v" in query or parsed.netloc == "youtu.be" or parsed.path.startswith("/shorts/"):
+        return "track"
+    return "listing"
+
+
+# Tipo de una entrada de la extracción plana
+# Solo las pestañas y listas son páginas que se recorren; cualquier otro enlace es una pista
+def entry_kind(entry: dict) -> str:
+    kind = url_kind(entry.get("url") or entry.get("webpage_url") or "")
+    if kind == "listing" and entry.get("ie_key") != "YoutubeTab" and entry.get("_type") != "playlist":
+        return "track"
+    return kind
+
+
+# La página de un canal o artista sin pestaña se lee desde su pestaña de lanzamientos (álbumes y sencillos)
+def releases_url(url: str) -> str:
+    parsed = urlparse(url)
+    if parsed.netloc in YOUTUBE_HOSTS and CHANNEL_PATH.fullmatch(parsed.path):
+        return f"https://www.youtube.com/{parsed.path.strip('/')}/releases"
+    return url
+
+
+# Las páginas de álbum de YouTube Music (/browse/MPREb_...) se resuelven a su lista de reproducción (OLAK5uy_...)
+# El archivo de descargas y la cola usan el ID de la lista (el mismo que guarda el descargador),
+# así un álbum se reconoce aunque se haya agregado con otra URL
+def album_url(extractor, url: str) -> str:
+    if not urlparse(url).path.startswith("/browse/MPREb_"):
+        return url
+    info = extractor().extract_info(url, download=False, process=False)
+    if info.get("_type") in ("url", "url_transparent"):
+        return info["url"]
+    if str(info.get("id", "")).startswith("OLAK5uy_"):
+        return f"https://music.youtube.com/playlist?list={info['id']}"
+    return url
+
+
+# Lee las URLs de una fuente: un archivo (una por línea, "-" para la entrada estándar) o una sola URL
+# El archivo se lee línea por línea; ignora las líneas vacías y los comentarios (#)
+def iter_source_urls(source: str):
+    if source != "-" and not os.path.isfile(source):
+        yield source.strip()
+        return
+    urls_file = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line in urls_file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    finally:
+        if urls_file is not sys.stdin:
+            urls_file.close()
+
+
+# Recorre una página y entrega las URLs de sus álbumes a medida que aparecen
+# Las entradas se leen con extracción plana (sin resolver pistas) y sin procesar, así yt_dlp
+# pide las siguientes páginas del catálogo solo cuando se consumen las anteriores
+# Una página cuyas entradas son pistas es un álbum, pero solo si es la URL pedida (top): dentro
+# de un canal, las pestañas de videos no son álbumes
+def _walk(extractor, url: str, depth: int, top: bool):
+    kind = url_kind(url)
+    if kind == "album":
+        yield album_url(extractor, url)
+        return
+    if kind == "track":
+        print(f"Se omite la pista {url} (solo se agregan álbumes)")
+        return
+
+    info = extractor().extract_info(url, download=False, process=False)
+    if info.get("_type") in ("url", "url_transparent"): # Redirección (p. ej. YouTube Music a YouTube)
+        yield from _walk(extractor, info["url"], depth, top)
+        return
+
+    for index, entry in enumerate(info.get("entries") or []):
+        if not entry:
+            continue
+        kind = entry_kind(entry)
+        if kind == "album":
+            yield album_url(extractor, entry.get("url") or entry["webpage_url"])
+        elif kind == "listing" and depth > 0:
+            yield from _walk(extractor, entry.get("url") or entry["webpage_url"], depth - 1, False)
+        elif kind == "track" and index == 0 and top:
+            yield url
+            return
+
+
+# Entrega las URLs de los álbumes de una fuente (álbum, artista, canal o archivo de URLs)
+# Es un generador: los álbumes se descubren mientras se consumen, la memoria no crece con el catálogo
+# Una URL que no se puede leer se informa y se pasa a la siguiente
+def iter_album_urls(source: str):
+    ytd = None
+
+    # yt_dlp se importa solo si hay una página que recorrer (un archivo de álbumes no lo necesita)
+    def extractor():
+        nonlocal ytd
+        if ytd is None:
+            import yt_dlp
+            ytd = yt_dlp.YoutubeDL({ # opciones de yt_dlp
+                "quiet": True, # Muestra solo advertencias importantes
+                "no_warnings": True, # Suprime las advertencias
+                "extract_flat": "in_playlist", # Solo los enlaces de las entradas
+            })
+        return ytd
+
+    try:
+        for url in iter_source_urls(source):
+            try:
+                yield from _walk(extractor, releases_url(url), MAX_DEPTH, True)
+            except Exception as e:
+                print(f"No se pudo leer {url}: {e}")
+    finally:
+        if ytd is not None:
+            ytd.close()
+
+
+# Indica si un álbum ya está completo en la carpeta de destino en todos sus formatos
+# (el archivo de descargas guarda la fecha del álbum solo cuando se descargaron todas sus pistas)
+def album_present(settings: dict, url: str, save: str, _format: str) -> bool:
+    formats = parse_formats(_format)
+    album_id = metadata_cache.cache_key(url)
+    return all(
+        archive.get_album_date(settings["db_archive"], format_root(save, formats, item), item, album_id) is not None
+        for item in formats
+    )
+
+
+# Agrega a la cola los álbumes de una fuente a medida que se descubren
+# Los álbumes que ya están en la cola o completos en la carpeta de destino no se agregan
+# Entrega un diccionario por álbum: {"url", "status" (QUEUED, IN_QUEUE o PRESENT), "job_id"}
+def enqueue_albums(source: str, save: str, genre: str, _format: str, settings: dict, priority: int = 0):
+    save = save.replace("\\", "/")
+    database_path = settings["db_music_list"]
+    for url in iter_album_urls(source):
+        job = jobs.find_job(database_path, url, save, _format)
+        if job is not None:
+            yield {"url": url, "status": IN_QUEUE, "job_id": job["id"]}
+        elif album_present(settings, url, save, _format):
+            yield {"url": url, "status": PRESENT, "job_id": None}
+        else:
+            job_id = jobs.add_music_list(database_path, url, save, genre, _format, priority)
+            yield {"url": url, "status": QUEUED, "job_id": job_id}
@@ -0,0 +1,303 @@
+# Importación de módulos necesarios para el funcionamiento
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from app.core import metadata_cache
+
+
+# Estados posibles de un trabajo en la cola de descargas
+STATUS_PENDING = "Pendiente"
+STATUS_DOWNLOADING = "Descargando"
+STATUS_FINISHED = "Finalizado"
+STATUS_ERROR = "Error"
+STATUS_CANCELLED = "Cancelado"
+
+# Versión del esquema de la base de datos de la cola
+SCHEMA_VERSION = 3
+
+# Prioridades disponibles (mayor valor = se descarga antes)
+PRIORITIES = {"Alta": 10, "Normal": 0, "Baja": -10}
+
+# Evita que dos hilos reclamen el mismo trabajo a la vez dentro del proceso
+_claim_lock = threading.Lock()
+
+
+# Abre una conexión con la base de datos de la cola
+# Las filas se devuelven como diccionarios para facilitar su uso
+def _connect(database_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(database_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _now() -> str:
+    return datetime.now().strftime("%d-%m-%Y, %H:%M:%S")
+
+
+# Crea la base de datos de la lista de descargas
+# Si la base de datos ya existe con la versión actual del esquema, no hace nada
+# Versión 2: columna album_key (ID de la lista de reproducción) para encontrar un álbum ya agregado
+# Versión 3: columnas worker, lease_until y attempts para los trabajadores del servicio (concesiones)
+def create_database_music_list(database_path: str) -> str:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    if cur.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return database_path
+
+    # WAL permite leer la cola mientras otro hilo la actualiza
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS music_list (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            cover TEXT,
+            save TEXT NOT NULL,
+            title TEXT,
+            count_music INTEGER,
+            artists TEXT,
+            genre TEXT,
+            format TEXT,
+            status TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            date_music TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            error TEXT,
+            album_key TEXT,
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Las colas de la versión 1 reciben la columna nueva con la clave de cada álbum
+    columns = [row["name"] for row in cur.execute("PRAGMA table_info(music_list)")]
+    if "album_key" not in columns:
+        cur.execute("ALTER TABLE music_list ADD COLUMN album_key TEXT")
+        rows = cur.execute("SELECT id, url FROM music_list").fetchall()
+        cur.executemany(
+            "UPDATE music_list SET album_key = ? WHERE id = ?",
+            [(metadata_cache.cache_key(row["url"]), row["id"]) for row in rows]
+        )
+    # Las colas anteriores a la versión 3 reciben las columnas de las concesiones
+    if "worker" not in columns:
+        cur.execute("ALTER TABLE music_list ADD COLUMN worker TEXT")
+        cur.execute("ALTER TABLE music_list ADD COLUMN lease_until REAL")
+        cur.execute("ALTER TABLE music_list ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    # Indice para que el planificador obtenga el siguiente trabajo sin recorrer la tabla
+    cur.execute("CREATE INDEX IF NOT EXISTS music_list_next ON music_list (status, priority DESC, id)")
+    # Indice para buscar si un álbum ya está en la cola (ingesta de discografías)
+    cur.execute("CREATE INDEX IF NOT EXISTS music_list_album ON music_list (album_key, save, format)")
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    conn.close()
+    return database_path
+
+
+# Agrega un álbum a la cola de descargas con estado "Pendiente"
+# Devuelve el ID del trabajo creado
+def add_music_list(database_path: str, url: str, save: str, genre: str, _format: str, priority: int = 0) -> int:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO music_list (url, save, genre, format, status, priority, date_music, album_key) VALUES (?,?,?,?,?,?,?,?)",
+        (url, save.replace("\\", "/"), genre, _format, STATUS_PENDING, priority, _now(), metadata_cache.cache_key(url))
+    )
+    conn.commit()
+    job_id = cur.lastrowid
+    conn.close()
+    return job_id
+
+
+# Busca un trabajo del mismo álbum, carpeta de destino y formato que no haya fallado ni se haya cancelado
+# (pendiente, en descarga o terminado). Devuelve None si el álbum no está en la cola
+def find_job(database_path: str, url: str, save: str, _format: str) -> dict | None:
+    conn = _connect(database_path)
+    row = conn.execute(
+        "SELECT * FROM music_list WHERE album_key = ? AND save = ? AND format = ? AND status NOT IN (?, ?) LIMIT 1",
+        (metadata_cache.cache_key(url), save.replace("\\", "/"), _format, STATUS_ERROR, STATUS_CANCELLED)
+    ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+# Reclama el siguiente trabajo pendiente (mayor prioridad primero, luego el más antiguo)
+# y lo marca como "Descargando". Si no hay trabajos pendientes devuelve None
+# Con worker el trabajo queda concedido a ese trabajador durante lease_seconds (ver renew_lease)
+def claim_next_job(database_path: str, worker: str | None = None, lease_seconds: float | None = None) -> dict | None:
+    with _claim_lock:
+        conn = _connect(database_path)
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE") # Bloquea la escritura para que otro proceso no reclame el mismo trabajo
+        cur.execute(
+            "SELECT * FROM music_list WHERE status = ? ORDER BY priority DESC, id ASC LIMIT 1",
+            (STATUS_PENDING,)
+        )
+        row = cur.fetchone()
+        if row is None:
+            conn.commit()
+            conn.close()
+            return None
+        lease_until = time.time() + lease_seconds if worker is not None else None
+        cur.execute(
+            "UPDATE music_list SET status = ?, started_at = ?, error = NULL, worker = ?, lease_until = ?, "
+            "attempts = attempts + 1 WHERE id = ?",
+            (STATUS_DOWNLOADING, _now(), worker, lease_until, row["id"])
+        )
+        conn.commit()
+        conn.close()
+        job = dict(row)
+        job.update(status=STATUS_DOWNLOADING, worker=worker, lease_until=lease_until, attempts=row["attempts"] + 1)
+        return job
+
+
+# Renueva la concesión de un trabajo (latido del trabajador)
+# Devuelve False si el trabajo ya no es de ese trabajador: se canceló o se reasignó al vencer la concesión
+def renew_lease(database_path: str, job_id: int, worker: str, lease_seconds: float) -> bool:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE music_list SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+        (time.time() + lease_seconds, job_id, worker, STATUS_DOWNLOADING)
+    )
+    conn.commit()
+    renewed = cur.rowcount == 1
+    conn.close()
+    return renewed
+
+
+# Recupera los trabajos cuya concesión venció (el trabajador dejó de enviar latidos)
+# Vuelven a "Pendiente", salvo los que ya se intentaron max_attempts veces, que quedan con error
+# Devuelve los trabajos recuperados con su estado nuevo
+def reclaim_expired_jobs(database_path: str, max_attempts: int) -> list[dict]:
+    with _claim_lock:
+        conn = _connect(database_path)
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        rows = cur.execute(
+            "SELECT id, worker, attempts FROM music_list WHERE status = ? AND lease_until < ?",
+            (STATUS_DOWNLOADING, time.time())
+        ).fetchall()
+        reclaimed = []
+        for row in rows:
+            if row["attempts"] >= max_attempts:
+                error = f"El trabajador {row['worker']} dejó de responder ({row['attempts']} intentos)"
+                cur.execute(
+                    "UPDATE music_list SET status = ?, error = ?, finished_at = ?, worker = NULL, lease_until = NULL WHERE id = ?",
+                    (STATUS_ERROR, error, _now(), row["id"])
+                )
+                reclaimed.append({"id": row["id"], "status": STATUS_ERROR, "error": error})
+            else:
+                cur.execute(
+                    "UPDATE music_list SET status = ?, started_at = NULL, worker = NULL, lease_until = NULL WHERE id = ?",
+                    (STATUS_PENDING, row["id"])
+                )
+                reclaimed.append({"id": row["id"], "status": STATUS_PENDING, "error": None})
+        conn.commit()
+        conn.close()
+        return reclaimed
+
+
+# Devuelve a "Pendiente" un trabajo que su trabajador no va a terminar (sin esperar a que venza la concesión)
+# Devuelve False si el trabajo ya no es de ese trabajador
+def release_job(database_path: str, job_id: int, worker: str) -> bool:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE music_list SET status = ?, started_at = NULL, worker = NULL, lease_until = NULL "
+        "WHERE id = ? AND worker = ? AND status = ?",
+        (STATUS_PENDING, job_id, worker, STATUS_DOWNLOADING)
+    )
+    conn.commit()
+    released = cur.rowcount == 1
+    conn.close()
+    return released
+
+
+# Cancela un trabajo pendiente o en descarga
+# Devuelve False si el trabajo no existe o ya terminó
+def cancel_job(database_path: str, job_id: int) -> bool:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE music_list SET status = ?, finished_at = ?, worker = NULL, lease_until = NULL "
+        "WHERE id = ? AND status IN (?, ?)",
+        (STATUS_CANCELLED, _now(), job_id, STATUS_PENDING, STATUS_DOWNLOADING)
+    )
+    conn.commit()
+    cancelled = cur.rowcount == 1
+    conn.close()
+    return cancelled
+
+
+# Actualiza el estado de un trabajo y, opcionalmente, los datos del álbum
+# (cover, title, count_music, artists, error)
+# Con worker solo se actualiza si el trabajo sigue concedido a ese trabajador
+# Con expected solo se actualiza si el trabajo sigue en ese estado (p. ej. no se canceló mientras terminaba)
+# Devuelve False si no se actualizó ningún trabajo
+def update_job(database_path: str, job_id: int, status: str | None = None, worker: str | None = None,
+               expected: str | None = None, **fields) -> bool:
+    allowed = {"cover", "title", "count_music", "artists", "error"}
+    values = {key: value for key, value in fields.items() if key in allowed}
+    if status is not None:
+        values["status"] = status
+        if status in (STATUS_FINISHED, STATUS_ERROR):
+            values["finished_at"] = _now()
+            values["lease_until"] = None
+    if not values:
+        return False
+
+    columns = ", ".join(f"{key} = ?" for key in values)
+    condition = "id = ?"
+    parameters = [*values.values(), job_id]
+    if worker is not None:
+        condition += " AND worker = ? AND status = ?"
+        parameters += [worker, STATUS_DOWNLOADING]
+    if expected is not None:
+        condition += " AND status = ?"
+        parameters.append(expected)
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    cur.execute(f"UPDATE music_list SET {columns} WHERE {condition}", parameters)
+    conn.commit()
+    updated = cur.rowcount == 1
+    conn.close()
+    return updated
+
+
+# Devuelve a "Pendiente" los trabajos que quedaron a medias (la aplicación se cerró durante la descarga)
+# Los trabajos concedidos a un trabajador del servicio no se tocan: vuelven a la cola si su concesión vence
+# Devuelve el número de trabajos recuperados
+def reset_interrupted_jobs(database_path: str) -> int:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE music_list SET status = ?, started_at = NULL WHERE status = ? AND lease_until IS NULL",
+        (STATUS_PENDING, STATUS_DOWNLOADING)
+    )
+    conn.commit()
+    recovered = cur.rowcount
+    conn.close()
+    return recovered
+
+
+# Devuelve un trabajo por ID (None si no existe)
+def get_job(database_path: str, job_id: int) -> dict | None:
+    conn = _connect(database_path)
+    row = conn.execute("SELECT * FROM music_list WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+# Extrae la lista de trabajos, opcionalmente filtrada por estado
+def get_jobs(database_path: str, status: str | None = None) -> list[dict]:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    if status is None:
+        cur.execute("SELECT * FROM music_list ORDER BY id ASC")
+    else:
+        cur.execute("SELECT * FROM music_list WHERE status = ? ORDER BY priority DESC, id ASC", (status,))
+    jobs = [dict(row) for row in cur.fetchall()]
+    conn.close()
+    return jobs
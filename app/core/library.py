@@ -0,0 +1,250 @@
+# Importación de módulos necesarios para el funcionamiento
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+
+# Versión del esquema de la base de datos de la biblioteca
+SCHEMA_VERSION = 1
+
+# Extensiones de audio que puede producir la aplicación
+AUDIO_EXTENSIONS = ("flac", "mp3", "wav", "m4a", "opus")
+
+# Máximo de coincidencias que se ordenan por relevancia en una búsqueda
+RANK_LIMIT = 5000
+
+
+def _connect(database_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(database_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# Crea la base de datos de la biblioteca local
+# La tabla tracks guarda cada archivo descargado y tracks_fts es su índice de texto completo (FTS5)
+# Los triggers mantienen el índice sincronizado con la tabla
+def create_database_library(database_path: str) -> str:
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    if cur.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return database_path
+
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.executescript("""
+        CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY,
+            video_id TEXT NOT NULL,
+            album_id TEXT,
+            title TEXT,
+            artist TEXT,
+            album TEXT,
+            genre TEXT,
+            year TEXT,
+            format TEXT,
+            path TEXT NOT NULL UNIQUE,
+            added_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS tracks_video ON tracks (video_id, format);
+        CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album_id);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+            title, artist, album, genre,
+            content='tracks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+            INSERT INTO tracks_fts (rowid, title, artist, album, genre)
+            VALUES (new.id, new.title, new.artist, new.album, new.genre);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+            INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, genre)
+            VALUES ('delete', old.id, old.title, old.artist, old.album, old.genre);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE ON tracks BEGIN
+            INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, genre)
+            VALUES ('delete', old.id, old.title, old.artist, old.album, old.genre);
+            INSERT INTO tracks_fts (rowid, title, artist, album, genre)
+            VALUES (new.id, new.title, new.artist, new.album, new.genre);
+        END;
+
+        -- Álbumes leídos desde el disco y la fecha de modificación de sus metadatos (reconstrucción incremental)
+        CREATE TABLE IF NOT EXISTS scanned_albums (
+            metadata_path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL
+        );
+    """)
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    conn.close()
+    return database_path
+
+
+# Inserta o actualiza las pistas de un álbum
+# files relaciona el ID de cada pista con la ruta de su archivo
+def add_album(database_path: str, album_metadata: dict, files: dict, _format: str) -> int:
+    now = datetime.now().strftime("%d-%m-%Y, %H:%M:%S")
+    rows = []
+    for song in album_metadata["songs_metadata"]:
+        path = files.get(song["id"])
+        if path is None:
+            continue
+        rows.append((
+            song["id"], album_metadata["id"], song["title"], song["artist_principal"],
+            album_metadata["album_title"], album_metadata["genre"], album_metadata["year"],
+            _format, path.replace("\\", "/"), now
+        ))
+
+    conn = _connect(database_path)
+    conn.executemany("""
+        INSERT INTO tracks (video_id, album_id, title, artist, album, genre, year, format, path, added_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+        ON CONFLICT(path) DO UPDATE SET
+            video_id = excluded.video_id, album_id = excluded.album_id, title = excluded.title,
+            artist = excluded.artist, album = excluded.album, genre = excluded.genre,
+            year = excluded.year, format = excluded.format
+    """, rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+# Cambia la ruta de los archivos movidos (moved relaciona la ruta anterior con la nueva)
+# Si la ruta nueva ya estaba en la biblioteca, se conserva esa fila y se descarta la anterior
+def move_files(database_path: str, moved: dict) -> None:
+    if not moved:
+        return
+    conn = _connect(database_path)
+    for old_path, new_path in moved.items():
+        conn.execute("UPDATE OR IGNORE tracks SET path = ? WHERE path = ?", (new_path.replace("\\", "/"), old_path.replace("\\", "/")))
+        conn.execute("DELETE FROM tracks WHERE path = ?", (old_path.replace("\\", "/"),))
+    conn.commit()
+    conn.close()
+
+
+# Convierte el texto del usuario en una consulta FTS5
+# Cada palabra se busca como prefijo ("beat" encuentra "Beatles") y todas deben aparecer
+def _fts_query(text: str) -> str:
+    words = re.findall(r"\w+", text, flags=re.UNICODE)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+# Busca pistas por título, artista, álbum o género
+# Los resultados se ordenan por relevancia (bm25). Si la búsqueda coincide con demasiadas pistas
+# (p. ej. un género), calcular la relevancia de todas es lento y se devuelven las más recientes
+def search(database_path: str, text: str, limit: int = 50) -> list[dict]:
+    query = _fts_query(text)
+    if not query:
+        return []
+    conn = _connect(database_path)
+    matches = conn.execute("SELECT COUNT(*) FROM tracks_fts WHERE tracks_fts MATCH ?", (query,)).fetchone()[0]
+    order = "bm25(tracks_fts)" if matches <= RANK_LIMIT else "tracks_fts.rowid DESC"
+    rows = conn.execute(f"""
+        SELECT tracks.* FROM tracks_fts
+        JOIN tracks ON tracks.id = tracks_fts.rowid
+        WHERE tracks_fts MATCH ?
+        ORDER BY {order}
+        LIMIT ?
+    """, (query, limit)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+# Busca un archivo ya descargado de la misma pista y formato (en cualquier álbum)
+# Devuelve la ruta si el archivo sigue en el disco, si no devuelve None
+def find_track(database_path: str, video_id: str, _format: str) -> str | None:
+    conn = _connect(database_path)
+    rows = conn.execute(
+        "SELECT path FROM tracks WHERE video_id = ? AND format = ?", (video_id, _format)
+    ).fetchall()
+    conn.close()
+    for row in rows:
+        if os.path.exists(row["path"]):
+            return row["path"]
+    return None
+
+
+# Devuelve las pistas que aparecen en más de un álbum: {video_id: [rutas]}
+def duplicates(database_path: str) -> dict:
+    conn = _connect(database_path)
+    rows = conn.execute("""
+        SELECT video_id, path FROM tracks
+        WHERE video_id IN (
+            SELECT video_id FROM tracks GROUP BY video_id HAVING COUNT(DISTINCT album_id) > 1
+        )
+        ORDER BY video_id
+    """).fetchall()
+    conn.close()
+    found = {}
+    for row in rows:
+        found.setdefault(row["video_id"], []).append(row["path"])
+    return found
+
+
+# Relaciona cada pista de un álbum con su archivo en la carpeta indicada
+# Los archivos se nombran con el título de la pista
+def _album_files(album_metadata: dict, folder: str) -> tuple[dict, str | None]:
+    from app.core.downloader import clean_name
+
+    files = {}
+    _format = None
+    for song in album_metadata["songs_metadata"]:
+        for extension in AUDIO_EXTENSIONS:
+            path = os.path.join(folder, f"{clean_name(song['title'])}.{extension}")
+            if os.path.exists(path):
+                files[song["id"]] = path.replace("\\", "/")
+                _format = "aac" if extension == "m4a" else extension
+                break
+    return files, _format
+
+
+# Reconstruye la biblioteca a partir de los álbumes en el disco
+# Solo vuelve a leer los álbumes cuyos metadatos cambiaron desde la última vez (incremental)
+# y elimina las pistas cuyos archivos ya no existen
+# Devuelve el número de álbumes leídos y de pistas eliminadas
+def rebuild(database_path: str, root: str) -> dict:
+    conn = _connect(database_path)
+    scanned = {row["metadata_path"]: row["mtime"] for row in conn.execute("SELECT * FROM scanned_albums")}
+    conn.close()
+
+    albums = 0
+    for folder, _, file_names in os.walk(root):
+        if "metadata_album.json" not in file_names:
+            continue
+        metadata_path = os.path.join(folder, "metadata_album.json")
+        mtime = os.stat(metadata_path).st_mtime
+        if scanned.get(metadata_path) == mtime: # Sin cambios desde la última lectura
+            continue
+        try:
+            with open(metadata_path, "r", encoding="utf-8") as data:
+                album_metadata = json.load(data)
+        except (OSError, ValueError):
+            continue
+
+        # Los archivos están en la carpeta del álbum (la de sus metadatos, .metadata)
+        # En los álbumes sin finalizar de versiones anteriores (.temp/metadata) siguen en .temp/converted
+        album_folder = os.path.dirname(folder)
+        if os.path.basename(album_folder) == ".temp":
+            album_folder = os.path.join(album_folder, "converted")
+        files, _format = _album_files(album_metadata, album_folder)
+        if files:
+            add_album(database_path, album_metadata, files, _format)
+        conn = _connect(database_path)
+        conn.execute("INSERT OR REPLACE INTO scanned_albums (metadata_path, mtime) VALUES (?, ?)", (metadata_path, mtime))
+        conn.commit()
+        conn.close()
+        albums += 1
+
+    # Elimina las pistas de esta carpeta cuyo archivo ya no existe
+    conn = _connect(database_path)
+    prefix = root.replace("\\", "/").rstrip("/") + "/"
+    missing = [
+        row["id"] for row in conn.execute("SELECT id, path FROM tracks WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+        if not os.path.exists(row["path"])
+    ]
+    conn.executemany("DELETE FROM tracks WHERE id = ?", [(track_id,) for track_id in missing])
+    conn.commit()
+    conn.close()
+    return {"albums": albums, "removed": len(missing)}
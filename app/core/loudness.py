@@ -0,0 +1,232 @@
+# Sonoridad EBU R128 (ITU-R BS.1770-4) y etiquetas ReplayGain de cada pista y de cada álbum
+# El audio se lee como PCM float de 32 bits a 48 kHz en bloques de tamaño fijo: el filtro K, la
+# potencia de cada bloque de 400 ms y el pico real se calculan con NumPy sobre el bloque completo, así la
+# memoria no depende de la duración de la pista. NumPy es opcional: sin él la etapa no se ejecuta
+# Los bloques de 400 ms se guardan en un histograma de 0.01 LU: los histogramas de las pistas se suman
+# para medir el álbum con la misma compuerta que cada pista
+import json
+import math
+import os
+import threading
+from functools import lru_cache
+
+
+RATE = 48000 # Frecuencia de muestreo del análisis (la de los coeficientes del filtro K)
+CHANNELS = 2 # Las fuentes mono se miden como mono dual
+BLOCK_SAMPLES = 65536 # Muestras por canal de cada bloque leído
+
+# Salida de FFmpeg con el PCM del análisis (se agrega a la misma orden que convierte la pista)
+PCM_OUTPUT = ["-map", "0:a", "-ac", str(CHANNELS), "-ar", str(RATE), "-c:a", "pcm_f32le", "-f", "f32le", "pipe:1"]
+
+# Filtro K a 48 kHz: estante de altas frecuencias y pasa altos (RLB), coeficientes de la norma
+SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285], [1.0, -1.69065929318241, 0.73248077421585])
+HIGH_PASS = ([1.0, -2.0, 1.0], [1.0, -1.99004745483398, 0.99007225036621])
+KERNEL_SIZE = 8192 # Muestras de la respuesta al impulso del filtro (la cola que se descarta es menor que 1e-17)
+
+SUBBLOCK = RATE // 10 # 100 ms: los bloques de 400 ms se solapan un 75 %
+ABSOLUTE_GATE = -70.0 # LUFS
+RELATIVE_GATE = -10.0 # LU por debajo de la sonoridad de los bloques que pasan la compuerta absoluta
+BIN_LU = 0.01 # Ancho de cada barra del histograma
+BINS = 8000 # De -70 a +10 LUFS
+
+# Sobremuestreo x4 del pico real: filtro de 48 coeficientes (12 por fase)
+OVERSAMPLING = 4
+PHASE_TAPS = 12
+
+REFERENCE_LUFS = -18.0 # Sonoridad de referencia de ReplayGain 2.0
+OPUS_REFERENCE_LUFS = -23.0 # Referencia de R128_TRACK_GAIN y R128_ALBUM_GAIN (RFC 7845)
+TAG_FORMATS = ("flac", "mp3", "opus") # Formatos que se etiquetan (FFmpeg no escribe etiquetas libres en m4a ni wav)
+
+_warned = False
+_warned_lock = threading.Lock()
+
+
+# Indica si NumPy está instalado (avisa una sola vez si no lo está)
+def available() -> bool:
+    global _warned
+    try:
+        import numpy # noqa: F401
+    except ImportError:
+        with _warned_lock:
+            if not _warned:
+                print("ReplayGain desactivado: instala NumPy para medir la sonoridad (pip install numpy)")
+                _warned = True
+        return False
+    return True
+
+
+# Respuesta en frecuencia del filtro K para una FFT de nfft puntos
+# La respuesta al impulso se obtiene de la respuesta en frecuencia (en lugar de recorrer la recursión
+# muestra por muestra) y se recorta a KERNEL_SIZE
+@lru_cache(maxsize=4)
+def _kernel_spectrum(nfft: int):
+    import numpy as np
+
+    def response(size: int):
+        spectrum = np.ones(size // 2 + 1, dtype=np.complex128)
+        for b, a in (SHELF, HIGH_PASS):
+            spectrum *= np.fft.rfft(b, size) / np.fft.rfft(a, size)
+        return spectrum
+
+    kernel = np.fft.irfft(response(4 * KERNEL_SIZE), 4 * KERNEL_SIZE)[:KERNEL_SIZE]
+    return np.fft.rfft(kernel, nfft)
+
+
+# Filtro de interpolación del pico real: seno cardinal con ventana de Kaiser, una columna por fase
+# Las filas van de la muestra más nueva a la más antigua (el producto con la ventana deslizante es la convolución)
+@lru_cache(maxsize=1)
+def _peak_filter():
+    import numpy as np
+
+    taps = OVERSAMPLING * PHASE_TAPS
+    offsets = np.arange(taps) - (taps - 1) / 2
+    prototype = np.sinc(offsets / OVERSAMPLING) * np.kaiser(taps, 8.0)
+    phases = prototype.reshape(PHASE_TAPS, OVERSAMPLING)
+    return (phases / phases.sum(axis=0))[::-1].astype(np.float32)
+
+
+# Sonoridad en LUFS de una potencia media (suma de los canales)
+def _lufs(power: float) -> float:
+    return -0.691 + 10 * math.log10(power)
+
+
+# Mide una pista: se le entregan bloques de muestras (add) y al final devuelve su medición (result)
+class LoudnessMeter:
+    def __init__(self) -> None:
+        import numpy as np
+
+        self.np = np
+        self.tail = np.zeros((KERNEL_SIZE - 1, CHANNELS)) # Cola del filtro K que se suma al bloque siguiente
+        self.pending = np.zeros((0, CHANNELS)) # Muestras filtradas que aún no completan 100 ms
+        self.previous = np.zeros(0) # Potencia de los últimos tres bloques de 100 ms
+        self.history = np.zeros((PHASE_TAPS - 1, CHANNELS), dtype=np.float32) # Últimas muestras para el pico real
+        self.counts = np.zeros(BINS, dtype=np.int64) # Bloques de 400 ms por barra del histograma
+        self.energy = np.zeros(BINS) # Suma de la potencia de esos bloques
+        self.peak = 0.0
+
+    # Agrega un bloque de muestras (forma (n, CHANNELS), float32)
+    def add(self, samples) -> None:
+        np = self.np
+        if not len(samples):
+            return
+        self.add_peak(samples)
+
+        # Filtro K por solapamiento y suma: una FFT por bloque
+        size = len(samples) + KERNEL_SIZE - 1
+        nfft = 1 << (size - 1).bit_length()
+        spectrum = np.fft.rfft(samples, nfft, axis=0) * _kernel_spectrum(nfft)[:, None]
+        filtered = np.fft.irfft(spectrum, nfft, axis=0)[:size]
+        filtered[:KERNEL_SIZE - 1] += self.tail
+        self.tail = filtered[len(samples):].copy()
+
+        # Potencia de cada bloque de 100 ms y de cada bloque de 400 ms (cuatro seguidos)
+        filtered = np.concatenate((self.pending, filtered[:len(samples)]))
+        complete = len(filtered) // SUBBLOCK * SUBBLOCK
+        self.pending = filtered[complete:]
+        if not complete:
+            return
+        powers = (filtered[:complete] ** 2).reshape(-1, SUBBLOCK, CHANNELS).mean(axis=1).sum(axis=1)
+        powers = np.concatenate((self.previous, powers))
+        self.previous = powers[-3:]
+        blocks = np.convolve(powers, np.full(4, 0.25), mode="valid")
+        self.add_blocks(blocks)
+
+    # Sobremuestrea x4 (las cuatro fases de una vez con una ventana deslizante) y guarda el mayor valor absoluto
+    def add_peak(self, samples) -> None:
+        np = self.np
+        data = np.concatenate((self.history, samples.astype(np.float32, copy=False)))
+        windows = np.lib.stride_tricks.sliding_window_view(data, PHASE_TAPS, axis=0) # (n, canales, coeficientes)
+        oversampled = windows @ _peak_filter()
+        self.peak = max(self.peak, float(np.abs(oversampled).max()), float(np.abs(samples).max()))
+        self.history = data[-(PHASE_TAPS - 1):]
+
+    # Agrega los bloques de 400 ms que superan la compuerta absoluta al histograma
+    def add_blocks(self, blocks) -> None:
+        np = self.np
+        blocks = blocks[blocks > 0]
+        loudness = -0.691 + 10 * np.log10(blocks)
+        gated = loudness > ABSOLUTE_GATE
+        bins = np.minimum(((loudness[gated] - ABSOLUTE_GATE) / BIN_LU).astype(np.int64), BINS - 1)
+        self.counts += np.bincount(bins, minlength=BINS)
+        self.energy += np.bincount(bins, weights=blocks[gated], minlength=BINS)
+
+    # Medición de la pista: sonoridad integrada (None si es silencio), pico real lineal y el histograma
+    # disperso ([barra, bloques, potencia]) para medir el álbum
+    def result(self) -> dict:
+        used = self.np.nonzero(self.counts)[0]
+        histogram = [[int(index), int(self.counts[index]), float(self.energy[index])] for index in used]
+        return {"integrated": integrated(histogram), "peak": round(self.peak, 6), "histogram": histogram}
+
+
+# Sonoridad integrada de un histograma: compuerta relativa a -10 LU de la media de los bloques
+def integrated(histogram: list) -> float | None:
+    blocks = sum(count for _, count, _ in histogram)
+    if not blocks:
+        return None
+    gate = _lufs(sum(energy for _, _, energy in histogram) / blocks) + RELATIVE_GATE
+    first = math.ceil((gate - ABSOLUTE_GATE) / BIN_LU)
+    gated = [(count, energy) for index, count, energy in histogram if index >= first]
+    count = sum(count for count, _ in gated)
+    return round(_lufs(sum(energy for _, energy in gated) / count), 2) if count else None
+
+
+# Lee el PCM de FFmpeg (PCM_OUTPUT) hasta el final y devuelve la medición de la pista
+def measure_stream(stream) -> dict:
+    import numpy as np
+
+    meter = LoudnessMeter()
+    frame = CHANNELS * 4
+    while True:
+        data = stream.read(BLOCK_SAMPLES * frame)
+        if not data:
+            break
+        meter.add(np.frombuffer(data[:len(data) // frame * frame], dtype=np.float32).reshape(-1, CHANNELS))
+    return meter.result()
+
+
+# Medición del álbum: suma los histogramas de sus pistas (mismas compuertas que una pista larga)
+def album_measurement(tracks: list[dict]) -> dict:
+    bins = {}
+    for track in tracks:
+        for index, count, energy in track["histogram"]:
+            total = bins.setdefault(index, [index, 0, 0.0])
+            total[1] += count
+            total[2] += energy
+    return {
+        "integrated": integrated(list(bins.values())),
+        "peak": max((track["peak"] for track in tracks), default=0.0),
+    }
+
+
+# Etiquetas de ReplayGain de una pista (vacío si la pista o el álbum son silencio)
+# opus usa R128_TRACK_GAIN y R128_ALBUM_GAIN (Q7.8 respecto a -23 LUFS); los demás formatos, REPLAYGAIN_*
+def replaygain_tags(track: dict, album: dict, _format: str) -> dict:
+    if track["integrated"] is None or album["integrated"] is None:
+        return {}
+    if _format == "opus":
+        def q78(lufs: float) -> str:
+            return str(max(-32768, min(32767, round((OPUS_REFERENCE_LUFS - lufs) * 256))))
+        return {"R128_TRACK_GAIN": q78(track["integrated"]), "R128_ALBUM_GAIN": q78(album["integrated"])}
+    return {
+        "REPLAYGAIN_TRACK_GAIN": f"{REFERENCE_LUFS - track['integrated']:.2f} dB",
+        "REPLAYGAIN_TRACK_PEAK": f"{track['peak']:.6f}",
+        "REPLAYGAIN_ALBUM_GAIN": f"{REFERENCE_LUFS - album['integrated']:.2f} dB",
+        "REPLAYGAIN_ALBUM_PEAK": f"{album['peak']:.6f}",
+    }
+
+
+# Lee las mediciones guardadas de un álbum (loudness.json en su carpeta de metadatos)
+def read_measurements(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as data:
+            return json.load(data)
+    except (OSError, ValueError):
+        return {"album": None, "tracks": {}}
+
+
+# Guarda la medición del álbum y la de cada pista
+def write_measurements(path: str, album: dict, tracks: dict) -> None:
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as data:
+        json.dump({"album": album, "tracks": tracks}, data, separators=(",", ":"))
+    os.replace(temp_path, path)
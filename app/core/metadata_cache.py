@@ -0,0 +1,79 @@
+# Importación de módulos necesarios para el funcionamiento
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+# Campos de cada entrada que la aplicación no usa y ocupan la mayor parte de los metadatos
+# (subtítulos automáticos en todos los idiomas, miniaturas, mapas de calor, descripciones...)
+ENTRY_DROP_FIELDS = (
+    "automatic_captions", "subtitles", "requested_subtitles", "heatmap", "thumbnails",
+    "description", "chapters", "tags", "categories", "requested_formats", "requested_downloads",
+)
+
+# Campos de la lista de reproducción que usa la aplicación (además de las entradas y las miniaturas)
+PLAYLIST_FIELDS = (
+    "_type", "id", "title", "playlist_count", "modified_date", "channel", "uploader",
+    "webpage_url", "original_url", "extractor", "extractor_key",
+)
+
+
+# Reduce una entrada (pista) a lo necesario para descargarla y etiquetarla
+# Solo se conservan los formatos con audio: los de solo video y los storyboards no se descargan nunca
+def trim_entry(entry: dict) -> dict:
+    trimmed = {key: value for key, value in entry.items() if key not in ENTRY_DROP_FIELDS}
+    if "formats" in entry:
+        trimmed["formats"] = [_format for _format in entry["formats"] if _format.get("acodec") != "none"]
+    return trimmed
+
+
+# Reduce los metadatos de un álbum a los campos que usa la aplicación
+def trim_metadata(metadata: dict) -> dict:
+    trimmed = {key: metadata[key] for key in PLAYLIST_FIELDS if key in metadata}
+    trimmed["thumbnails"] = [{"url": thumbnail["url"]} for thumbnail in metadata.get("thumbnails", [])]
+    trimmed["entries"] = [trim_entry(entry) for entry in metadata.get("entries", []) if entry]
+    return trimmed
+
+
+# Obtiene la clave del caché para una URL
+# Para las listas de reproducción se usa su ID (parámetro "list"),
+# así la misma lista con distinta URL comparte los metadatos
+def cache_key(url: str) -> str:
+    playlist_id = parse_qs(urlparse(url).query).get("list")
+    if playlist_id:
+        return playlist_id[0]
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def _cache_file(cache_path: str, url: str) -> str:
+    return os.path.join(cache_path, f"{cache_key(url)}.json.gz")
+
+
+# Carga los metadatos guardados de una URL
+# Devuelve None si no existen o si son más antiguos que el tiempo de vida (segundos)
+def load_metadata(cache_path: str, url: str, ttl: int) -> dict | None:
+    try:
+        with gzip.open(_cache_file(cache_path, url), "rt", encoding="utf-8") as data:
+            cached = json.load(data)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() - cached.get("cached_at", 0) > ttl:
+        return None
+    return cached["metadata"]
+
+
+# Guarda los metadatos (ya reducidos) de una URL como JSON comprimido
+# Se escribe en un archivo temporal y luego se renombra para no dejar archivos a medias
+# El archivo temporal es propio de cada proceso e hilo: dos hilos que guardan el mismo álbum no lo comparten
+def save_metadata(cache_path: str, url: str, metadata: dict) -> None:
+    os.makedirs(cache_path, exist_ok=True)
+    cache_file = _cache_file(cache_path, url)
+    temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(temp_file, "wt", encoding="utf-8", compresslevel=6) as data:
+        json.dump({"cached_at": time.time(), "metadata": metadata}, data, separators=(",", ":"))
+    os.replace(temp_file, cache_file)
@@ -0,0 +1,222 @@
+# Importación de módulos necesarios para el funcionamiento
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+# Mide cuánto tiempo están ocupados los hilos de un pool
+# busy_seconds incluye las tareas que siguen en curso, así la utilización se puede
+# calcular en cualquier momento: segundos ocupados / (hilos * segundos transcurridos)
+class UtilizationCounter:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.busy = 0 # Tareas en curso
+        self.accumulated = 0.0 # Segundos ocupados de las tareas ya terminadas
+        self.started = {} # Inicio de cada tarea en curso
+
+    def start(self) -> object:
+        token = object()
+        with self.lock:
+            self.busy += 1
+            self.started[token] = time.monotonic()
+        return token
+
+    def stop(self, token: object) -> None:
+        with self.lock:
+            self.busy -= 1
+            self.accumulated += time.monotonic() - self.started.pop(token)
+
+    def busy_seconds(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            return self.accumulated + sum(now - started for started in self.started.values())
+
+
+# Utilización de los pools compartidos (descarga de pistas y conversión)
+track_pool_usage = UtilizationCounter()
+transcode_usage = UtilizationCounter()
+
+
+# Tiempos de un trabajo (álbum): duración de cada fase y datos de cada pista
+class JobMetrics:
+    def __init__(self, job_key, url: str) -> None:
+        self.job_key = job_key
+        self.url = url
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.phases = {} # Segundos por fase: extract, prepare, thumbnail, tracks, finalize
+        self.tracks = {} # Datos de cada pista por ID
+        self.errors = 0
+        self.first_track = None # Segundos desde el inicio hasta la primera pista terminada
+        self.track_busy_start = track_pool_usage.busy_seconds()
+        self.transcode_busy_start = transcode_usage.busy_seconds()
+
+    # Mide la duración de una fase del trabajo
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - started
+
+    # Agrega datos a una pista (queue_wait, download_seconds, bytes, transcode_wait, transcode_seconds, fast_path...)
+    def track(self, track_id: str, **values) -> None:
+        with self.lock:
+            self.tracks.setdefault(track_id, {}).update(values)
+
+    # Suma valores a los datos de una pista (p. ej. el tiempo de conversión de varios formatos)
+    def add(self, track_id: str, **values) -> None:
+        with self.lock:
+            track = self.tracks.setdefault(track_id, {})
+            for key, value in values.items():
+                track[key] = round(track.get(key, 0) + value, 3)
+
+    # Guarda el momento en que termina la primera pista del trabajo
+    def track_done(self) -> None:
+        with self.lock:
+            if self.first_track is None:
+                self.first_track = time.monotonic() - self.started
+
+    def error(self, count: int = 1) -> None:
+        with self.lock:
+            self.errors += count
+
+    # Devuelve los datos del trabajo listos para guardarse como JSON
+    def to_dict(self, settings: dict, status: str, error: str | None = None) -> dict:
+        elapsed = time.monotonic() - self.started
+        track_workers = settings["track_workers"]
+        transcode_workers = settings.get("transcode_workers") or os.cpu_count() or 1
+        with self.lock:
+            tracks = []
+            for track_id, values in self.tracks.items():
+                track = {"id": track_id, **values}
+                if track.get("download_seconds"):
+                    track["bytes_per_second"] = round(track.get("bytes", 0) / track["download_seconds"], 1)
+                tracks.append(track)
+            return {
+                "time": self.started_at,
+                "job": self.job_key,
+                "url": self.url,
+                "status": status,
+                "error": error,
+                "errors": self.errors,
+                "seconds": round(elapsed, 3),
+                "first_track_seconds": round(self.first_track, 3) if self.first_track is not None else None,
+                "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                "tracks": tracks,
+                # Utilización de los pools compartidos durante el trabajo (incluye otros trabajos simultáneos)
+                "track_pool_utilization": round(
+                    (track_pool_usage.busy_seconds() - self.track_busy_start) / (track_workers * elapsed), 3
+                ) if elapsed > 0 else 0.0,
+                "transcode_utilization": round(
+                    (transcode_usage.busy_seconds() - self.transcode_busy_start) / (transcode_workers * elapsed), 3
+                ) if elapsed > 0 else 0.0,
+            }
+
+
+# Contadores acumulados de todos los trabajos (para el archivo de Prometheus)
+_totals = {
+    "jobs": 0, "job_errors": 0, "track_errors": 0, "tracks": 0,
+    "download_bytes": 0, "download_seconds": 0.0, "transcode_seconds": 0.0, "fast_path_tracks": 0,
+}
+_phase_totals = {}
+_write_lock = threading.Lock()
+
+
+# Guarda los datos de un trabajo terminado
+# Se agrega una línea JSON a metrics_path y se suma a los contadores acumulados
+def record_job(settings: dict, job_metrics: JobMetrics, status: str, error: str | None = None) -> dict:
+    record = job_metrics.to_dict(settings, status, error)
+    if not settings["metrics_enabled"]:
+        return record
+
+    with _write_lock:
+        os.makedirs(os.path.dirname(settings["metrics_path"]), exist_ok=True)
+        with open(settings["metrics_path"], "a", encoding="utf-8") as metrics_file:
+            metrics_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    count_job(settings, record)
+    return record
+
+
+# Suma un trabajo terminado a los contadores acumulados y, si está configurado, reescribe el archivo de Prometheus
+# Los trabajos de los procesos de trabajo (worker_backend "process") se suman en el proceso principal
+def count_job(settings: dict, record: dict) -> None:
+    if not settings["metrics_enabled"]:
+        return
+
+    with _write_lock:
+        _totals["jobs"] += 1
+        _totals["job_errors"] += record["status"] != "ok"
+        _totals["track_errors"] += record["errors"]
+        _totals["tracks"] += len(record["tracks"])
+        for track in record["tracks"]:
+            _totals["download_bytes"] += track.get("bytes", 0)
+            _totals["download_seconds"] += track.get("download_seconds", 0.0)
+            _totals["transcode_seconds"] += track.get("transcode_seconds", 0.0)
+            _totals["fast_path_tracks"] += track.get("fast_path", False)
+        for name, seconds in record["phases"].items():
+            _phase_totals[name] = _phase_totals.get(name, 0.0) + seconds
+
+        if settings["metrics_prometheus_path"]:
+            write_prometheus(settings["metrics_prometheus_path"])
+
+
+# Escribe el archivo de texto para el textfile collector de node_exporter (Prometheus)
+# Se escribe en un archivo temporal y se renombra para que nunca se lea a medias
+def write_prometheus(path: str) -> None:
+    lines = [
+        "# TYPE musicdl_jobs_total counter",
+        f"musicdl_jobs_total {_totals['jobs']}",
+        "# TYPE musicdl_job_errors_total counter",
+        f"musicdl_job_errors_total {_totals['job_errors']}",
+        "# TYPE musicdl_track_errors_total counter",
+        f"musicdl_track_errors_total {_totals['track_errors']}",
+        "# TYPE musicdl_tracks_total counter",
+        f"musicdl_tracks_total {_totals['tracks']}",
+        "# TYPE musicdl_download_bytes_total counter",
+        f"musicdl_download_bytes_total {_totals['download_bytes']}",
+        "# TYPE musicdl_download_seconds_total counter",
+        f"musicdl_download_seconds_total {_totals['download_seconds']:.3f}",
+        "# TYPE musicdl_transcode_seconds_total counter",
+        f"musicdl_transcode_seconds_total {_totals['transcode_seconds']:.3f}",
+        "# TYPE musicdl_fast_path_tracks_total counter",
+        f"musicdl_fast_path_tracks_total {_totals['fast_path_tracks']}",
+        "# TYPE musicdl_phase_seconds_total counter",
+    ]
+    lines += [f'musicdl_phase_seconds_total{{phase="{name}"}} {seconds:.3f}' for name, seconds in sorted(_phase_totals.items())]
+    lines += [
+        "# TYPE musicdl_track_pool_busy gauge",
+        f"musicdl_track_pool_busy {track_pool_usage.busy}",
+        "# TYPE musicdl_transcode_busy gauge",
+        f"musicdl_transcode_busy {transcode_usage.busy}",
+    ]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as prometheus_file:
+        prometheus_file.write("\n".join(lines) + "\n")
+    os.replace(temp_file, path)
+
+
+# Ejecuta una función con cProfile si profile_jobs está activado
+# El perfil se guarda en la carpeta profiles junto a metrics_path (se abre con pstats o snakeviz)
+# cProfile solo mide el hilo que lo ejecuta: extracción, preparación y espera del álbum
+def profiled(settings: dict, name: str, function):
+    if not settings["profile_jobs"]:
+        return function()
+
+    import cProfile
+
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function)
+    finally:
+        profiles_path = os.path.join(os.path.dirname(settings["metrics_path"]), "profiles")
+        os.makedirs(profiles_path, exist_ok=True)
+        safe_name = "".join(char if char.isalnum() else "_" for char in str(name))[:80]
+        profile.dump_stats(os.path.join(profiles_path, f"{safe_name}-{int(time.time())}.prof"))
@@ -0,0 +1,162 @@
+# Importación de módulos necesarios para el funcionamiento
+import threading
+import time
+
+
+# Agrupa el progreso de todas las pistas en curso y lo publica a una frecuencia fija
+# yt_dlp informa el progreso muchas veces por segundo por pista; en lugar de reenviar cada
+# aviso, se guardan los bytes de cada pista y se publica una "foto" (snapshot) del estado
+# de cada álbum y del total unas pocas veces por segundo
+class ProgressBus:
+    def __init__(self, rate_hz: float = 5) -> None:
+        self.interval = 1 / rate_hz
+        self.lock = threading.Lock()
+        self.albums = {} # Estado de cada álbum por clave del trabajo
+        self.subscribers = []
+        self.dirty = False # Hay cambios sin publicar
+        self.thread = None
+        self.last_publish = time.monotonic()
+        self.global_speed = 0.0
+        self.last_global_bytes = 0
+
+    # Registra una función que recibe cada snapshot (se llama desde el hilo del bus)
+    def subscribe(self, callback) -> None:
+        with self.lock:
+            self.subscribers.append(callback)
+        self._ensure_thread()
+
+    def unsubscribe(self, callback) -> None:
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    # Inicia el seguimiento de un álbum
+    def start_album(self, job_key, album: str, artist: str, tracks: int) -> None:
+        with self.lock:
+            self.albums[job_key] = {
+                "album": album, "artist": artist, "tracks_total": tracks or 0,
+                "tracks": {}, "done": set(), "finished": False,
+                "speed": 0.0, "last_bytes": 0,
+            }
+            self.dirty = True
+        self._ensure_thread()
+
+    # Actualiza los bytes descargados de una pista (llamado desde el hook de yt_dlp)
+    def update(self, job_key, track_key, downloaded: int, total: int) -> None:
+        with self.lock:
+            album = self.albums.get(job_key)
+            if album is not None:
+                album["tracks"][track_key] = (downloaded, total)
+                self.dirty = True
+
+    # Marca una pista como descargada
+    def finish_track(self, job_key, track_key) -> None:
+        with self.lock:
+            album = self.albums.get(job_key)
+            if album is not None:
+                album["done"].add(track_key)
+                self.dirty = True
+
+    # Marca un álbum como terminado; se publica una última vez y luego se elimina
+    def finish_album(self, job_key) -> None:
+        with self.lock:
+            album = self.albums.get(job_key)
+            if album is not None:
+                album["finished"] = True
+                self.dirty = True
+
+    # Construye la foto del estado actual
+    # elapsed son los segundos desde la foto anterior (para calcular la velocidad)
+    def _snapshot(self, elapsed: float) -> dict:
+        albums = {}
+        global_downloaded = 0
+        global_total = 0
+        for job_key, album in self.albums.items():
+            downloaded = sum(done for done, _ in album["tracks"].values())
+            total = sum(size for _, size in album["tracks"].values())
+            # Velocidad suavizada (media móvil exponencial) para que no salte en cada foto
+            instant = max(downloaded - album["last_bytes"], 0) / elapsed if elapsed > 0 else 0
+            album["speed"] = 0.3 * instant + 0.7 * album["speed"]
+            album["last_bytes"] = downloaded
+            albums[job_key] = {
+                "album": album["album"],
+                "artist": album["artist"],
+                "downloaded_bytes": downloaded,
+                "total_bytes": total,
+                "percentage": downloaded / total * 100 if total else 0.0,
+                "speed": album["speed"],
+                "eta": (total - downloaded) / album["speed"] if album["speed"] > 0 else None,
+                "tracks_total": album["tracks_total"],
+                "tracks_done": len(album["done"]),
+                "tracks_active": len(album["tracks"]) - len(album["done"]),
+                "finished": album["finished"],
+            }
+            global_downloaded += downloaded
+            global_total += total
+
+        instant = max(global_downloaded - self.last_global_bytes, 0) / elapsed if elapsed > 0 else 0
+        self.global_speed = 0.3 * instant + 0.7 * self.global_speed
+        self.last_global_bytes = global_downloaded
+        return {
+            "albums": albums,
+            "global": {
+                "albums": len(albums),
+                "downloaded_bytes": global_downloaded,
+                "total_bytes": global_total,
+                "speed": self.global_speed,
+                "eta": (global_total - global_downloaded) / self.global_speed if self.global_speed > 0 else None,
+            },
+        }
+
+    # Publica una foto si hubo cambios desde la anterior
+    def publish(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            now = time.monotonic()
+            snapshot = self._snapshot(now - self.last_publish)
+            self.last_publish = now
+            self.dirty = False
+            # Los álbumes terminados ya se publicaron por última vez
+            for job_key in [key for key, album in self.albums.items() if album["finished"]]:
+                self.last_global_bytes -= snapshot["albums"][job_key]["downloaded_bytes"]
+                del self.albums[job_key]
+            subscribers = list(self.subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Error al publicar el progreso: {e}")
+
+    def _ensure_thread(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="progress", daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.publish()
+
+
+# Bus de progreso compartido por todos los trabajos
+_progress_bus = None
+_progress_bus_lock = threading.Lock()
+
+
+# Devuelve el bus de progreso compartido con la frecuencia de la configuración
+def get_progress_bus(settings: dict) -> ProgressBus:
+    global _progress_bus
+    with _progress_bus_lock:
+        if _progress_bus is None:
+            _progress_bus = ProgressBus(settings["progress_rate_hz"])
+        return _progress_bus
+
+
+# Reemplaza el bus compartido (los procesos de trabajo reenvían el progreso al proceso principal)
+def set_progress_bus(bus) -> None:
+    global _progress_bus
+    with _progress_bus_lock:
+        _progress_bus = bus
@@ -0,0 +1,85 @@
+# Importación de módulos necesarios para el funcionamiento
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+
+# Devuelve la espera antes de un reintento: retroceso exponencial con variación aleatoria completa
+# (entre 0 y base * 2^intento, como máximo max_delay) para que las pistas no se reintenten todas a la vez
+def backoff_delay(attempt: int, base: float, max_delay: float) -> float:
+    return random.uniform(0, min(max_delay, base * 2 ** attempt))
+
+
+# Cola de reintentos compartida por todos los álbumes
+# Las pistas que fallan esperan aquí (no en el pool de descargas) hasta que se cumple su espera
+# y entonces se envían de nuevo al pool; así los reintentos no ocupan hilos de los trabajos sanos
+class RetryQueue:
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.pending = [] # Montículo de (momento, orden, Future, pool, función, argumentos)
+        self.counter = itertools.count()
+        self.thread = threading.Thread(target=self._run, name="retry", daemon=True)
+        self.thread.start()
+
+    # Programa una función en el pool después de delay segundos
+    # Devuelve un Future con el resultado de la función
+    # El Future queda pendiente hasta que la función termina: cancelarlo (p. ej. un trabajo cancelado)
+    # funciona mientras espera en esta cola y también cancela la función si aún no empezó en el pool
+    def schedule(self, delay: float, pool, function, *args) -> Future:
+        future = Future()
+        future.add_done_callback(_notify_cancel)
+        with self.condition:
+            heapq.heappush(self.pending, (time.monotonic() + delay, next(self.counter), future, pool, function, args))
+            self.condition.notify()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.pending or self.pending[0][0] > time.monotonic():
+                    timeout = self.pending[0][0] - time.monotonic() if self.pending else None
+                    self.condition.wait(timeout)
+                _, _, future, pool, function, args = heapq.heappop(self.pending)
+            if future.cancelled():
+                continue
+            inner = pool.submit(function, *args)
+            future.add_done_callback(lambda future, inner=inner: future.cancelled() and inner.cancel())
+            inner.add_done_callback(lambda done, future=future: _copy_result(done, future))
+
+
+# Un Future cancelado fuera de un pool no avisa a concurrent.futures.wait hasta que se marca como notificado
+# (lo hace el pool al tomarlo); el reintento se marca al cancelarse para que nadie se quede esperándolo
+def _notify_cancel(future: Future) -> None:
+    if future.cancelled():
+        future.set_running_or_notify_cancel()
+
+
+# Pasa el resultado (o el error) de un Future del pool al Future del reintento
+# Si la función se canceló en el pool, el reintento también se cancela (nadie se queda esperándolo)
+# Si el reintento ya se canceló, el resultado se descarta
+def _copy_result(done: Future, future: Future) -> None:
+    try:
+        if done.cancelled():
+            future.cancel()
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+    except InvalidStateError:
+        pass
+
+
+# Cola de reintentos compartida
+_retry_queue = None
+_retry_queue_lock = threading.Lock()
+
+
+def get_retry_queue() -> RetryQueue:
+    global _retry_queue
+    with _retry_queue_lock:
+        if _retry_queue is None:
+            _retry_queue = RetryQueue()
+        return _retry_queue
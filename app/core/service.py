@@ -0,0 +1,473 @@
+# Servicio de descargas: API HTTP/JSON sobre la cola persistente y trabajadores con concesiones
+# El servicio es el único que escribe en la cola; la interfaz gráfica y los trabajadores de otros
+# equipos son clientes de la API. Cada trabajo reclamado queda concedido a un trabajador durante
+# lease_seconds y el trabajador renueva la concesión con latidos; si deja de enviarlos (se colgó o
+# perdió la conexión), el trabajo vuelve a la cola para otro trabajador
+import hmac
+import http.server
+import json
+import re
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlparse
+from app.core import http_client
+from app.core import ingest
+from app.core import jobs
+from app.core import progress
+from app.core import workers
+from app.core.downloader import AlbumDownloader, JobCancelled, missing_error
+
+
+# Un pedido a la API con datos que faltan o no son válidos (responde 400)
+class BadRequest(ValueError):
+    pass
+
+
+# Suma el progreso de varios álbumes en una sola foto (la misma forma que la del bus de progreso)
+def merge_progress(albums: dict) -> dict:
+    downloaded = sum(album["downloaded_bytes"] for album in albums.values())
+    total = sum(album["total_bytes"] for album in albums.values())
+    speed = sum(album["speed"] for album in albums.values())
+    return {
+        "albums": albums,
+        "global": {
+            "albums": len(albums),
+            "downloaded_bytes": downloaded,
+            "total_bytes": total,
+            "speed": speed,
+            "eta": (total - downloaded) / speed if speed > 0 else None,
+        },
+    }
+
+
+# Cola de descargas compartida y su API
+# Todos los cambios de los trabajos pasan por aquí y quedan en un registro de eventos numerados;
+# los clientes piden los eventos posteriores al último que vieron (GET /events?after=N)
+class JobService:
+    def __init__(self, settings: dict, host: str, port: int) -> None:
+        self.settings = settings
+        self.database_path = settings["db_music_list"]
+        self.lease_seconds = settings["lease_seconds"]
+        self.token = settings["service_token"]
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=settings["service_events"]) # (número, ID del trabajo, campos cambiados)
+        self.sequence = 0 # Número del último evento
+        self.local_albums = {} # Progreso de los álbumes descargados en este proceso
+        self.remote_albums = {} # Progreso enviado por los trabajadores: ID -> (álbum, momento)
+        self.stopping = threading.Event()
+        self.server = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        progress.get_progress_bus(settings).subscribe(self.store_progress)
+
+    # Registra el cambio de un trabajo
+    def record(self, job_id: int, **fields) -> None:
+        with self.lock:
+            self.sequence += 1
+            self.events.append((self.sequence, job_id, fields))
+
+    # Indica si la cabecera Authorization lleva la clave del servicio (sin clave se acepta cualquier pedido)
+    # La comparación tarda lo mismo sin importar dónde difieren (no revela la clave por tiempos)
+    def authorized(self, header: str | None) -> bool:
+        if not self.token:
+            return True
+        return hmac.compare_digest((header or "").encode("utf-8"), f"Bearer {self.token}".encode("utf-8"))
+
+    # Eventos posteriores a after; reset indica que el cliente se perdió eventos y debe recargar la lista
+    # (los eventos salieron del registro, o after es de un servicio anterior que se reinició)
+    def events_after(self, after: int) -> dict:
+        with self.lock:
+            events = [{"sequence": number, "id": job_id, "fields": fields}
+                      for number, job_id, fields in self.events if number > after]
+            reset = after > self.sequence or (
+                after < self.sequence and (not self.events or self.events[0][0] > after + 1)
+            )
+            return {"sequence": self.sequence, "events": events, "reset": reset}
+
+    # Agrega un álbum a la cola
+    def submit(self, url: str, _format: str, genre: str, save: str, priority: int = 0) -> dict:
+        job_id = jobs.add_music_list(self.database_path, url, save, genre, _format, priority)
+        job = jobs.get_job(self.database_path, job_id)
+        self.record(job_id, **job)
+        return job
+
+    # Recorre un artista, un canal o un archivo de URLs en otro hilo (ver ingest.enqueue_albums)
+    def ingest(self, source: str, _format: str, genre: str, save: str, priority: int = 0) -> None:
+        def run() -> None:
+            try:
+                for album in ingest.enqueue_albums(source, save, genre, _format, self.settings, priority):
+                    if album["status"] == ingest.QUEUED:
+                        self.record(album["job_id"], **jobs.get_job(self.database_path, album["job_id"]))
+            except Exception as e:
+                print(f"Error al recorrer {source}: {e}")
+
+        threading.Thread(target=run, name="ingest", daemon=True).start()
+
+    def cancel(self, job_id: int) -> bool:
+        if not jobs.cancel_job(self.database_path, job_id):
+            return False
+        self.record(job_id, status=jobs.STATUS_CANCELLED)
+        return True
+
+    # Reclama el siguiente trabajo para un trabajador
+    # El trabajo incluye lease_seconds: el trabajador envía sus latidos según la concesión del servicio
+    def claim(self, worker: str) -> dict | None:
+        job = jobs.claim_next_job(self.database_path, worker, self.lease_seconds)
+        if job is None:
+            return None
+        self.record(job["id"], status=jobs.STATUS_DOWNLOADING, worker=worker, error=None)
+        return {**job, "lease_seconds": self.lease_seconds}
+
+    # Latido de un trabajador: renueva la concesión y guarda el progreso del álbum
+    # Devuelve False si el trabajo ya no es del trabajador (cancelado o reasignado): debe abandonarlo
+    def heartbeat(self, job_id: int, worker: str, album: dict | None = None) -> bool:
+        if not jobs.renew_lease(self.database_path, job_id, worker, self.lease_seconds):
+            with self.lock:
+                self.remote_albums.pop(job_id, None)
+            return False
+        if album is not None and job_id not in self.local_albums:
+            with self.lock:
+                self.remote_albums[job_id] = (album, time.monotonic())
+        return True
+
+    # Guarda los datos del álbum (título, artista, pistas, portada) cuando el trabajador lo empieza
+    def started(self, job_id: int, worker: str, album_info: dict) -> bool:
+        fields = {
+            "cover": album_info["thumbnail"], "title": album_info["album"],
+            "count_music": album_info["tracks"], "artists": album_info["artist"],
+        }
+        if not jobs.update_job(self.database_path, job_id, worker=worker, **fields):
+            return False
+        self.record(job_id, **fields)
+        return True
+
+    # Termina un trabajo (status es jobs.STATUS_FINISHED o jobs.STATUS_ERROR)
+    def finish(self, job_id: int, worker: str, status: str, error: str | None = None) -> bool:
+        with self.lock:
+            self.remote_albums.pop(job_id, None)
+        if not jobs.update_job(self.database_path, job_id, status, worker=worker, error=error):
+            return False
+        self.record(job_id, status=status, error=error)
+        return True
+
+    # Devuelve a la cola un trabajo que el trabajador no va a terminar (p. ej. se está cerrando)
+    def release(self, job_id: int, worker: str) -> bool:
+        with self.lock:
+            self.remote_albums.pop(job_id, None)
+        if not jobs.release_job(self.database_path, job_id, worker):
+            return False
+        self.record(job_id, status=jobs.STATUS_PENDING, worker=None)
+        return True
+
+    # Recibe las fotos del bus de progreso de este proceso (trabajadores locales)
+    def store_progress(self, snapshot: dict) -> None:
+        with self.lock:
+            self.local_albums = {key: album for key, album in snapshot["albums"].items() if not album["finished"]}
+
+    # Progreso de todos los trabajos en curso, locales y remotos
+    # El progreso de un trabajador que dejó de enviar latidos se descarta
+    def progress(self) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            albums = {str(key): album for key, album in self.local_albums.items()}
+            for job_id, (album, received) in list(self.remote_albums.items()):
+                if now - received > self.lease_seconds:
+                    del self.remote_albums[job_id]
+                else:
+                    albums[str(job_id)] = album
+        return merge_progress(albums)
+
+    # Devuelve a la cola los trabajos cuya concesión venció (se revisa varias veces por concesión)
+    def reclaim(self) -> None:
+        while not self.stopping.wait(self.lease_seconds / 3):
+            try:
+                for job in jobs.reclaim_expired_jobs(self.database_path, self.settings["job_max_attempts"]):
+                    print(f"Concesión vencida del trabajo {job['id']}: {job['status']}")
+                    self.record(job["id"], status=job["status"], error=job["error"], worker=None)
+            except Exception as e:
+                print(f"Error al recuperar trabajos: {e}")
+
+    # Atiende la API hasta que se llama a stop
+    def serve(self) -> None:
+        recovered = jobs.reset_interrupted_jobs(self.database_path)
+        if recovered:
+            print(f"Trabajos recuperados: {recovered}")
+        threading.Thread(target=self.reclaim, name="reclaim", daemon=True).start()
+        print(f"Servicio de descargas en {self.url}")
+        self.server.serve_forever()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Atiende un pedido de la API; devuelve (código HTTP, respuesta)
+    def dispatch(self, method: str, path: str, query: dict, body: dict) -> tuple[int, object]:
+        def field(name: str, default=None):
+            value = body.get(name, default)
+            if value is None:
+                raise BadRequest(f"falta el campo {name}")
+            return value
+
+        if method == "GET" and path == "/jobs":
+            return 200, jobs.get_jobs(self.database_path, query.get("status"))
+        if method == "GET" and path == "/events":
+            return 200, self.events_after(int(query.get("after", 0)))
+        if method == "GET" and path == "/progress":
+            return 200, self.progress()
+        if method == "POST" and path in ("/jobs", "/ingest"):
+            arguments = (field("url"), field("format", "flac"), field("genre", ""),
+                         field("save", self.settings["app_output_path"]).replace("\\", "/"), int(field("priority", 0)))
+            if path == "/ingest":
+                self.ingest(*arguments)
+                return 202, {"accepted": True}
+            return 201, self.submit(*arguments)
+        if method == "POST" and path == "/workers/claim":
+            return 200, {"job": self.claim(field("worker"))}
+
+        match = re.fullmatch(r"/jobs/(\d+)(?:/(cancel|heartbeat|started|finish|release))?", path)
+        if match is None:
+            return 404, {"error": "ruta desconocida"}
+        job_id, action = int(match.group(1)), match.group(2)
+        if method == "GET" and action is None:
+            job = jobs.get_job(self.database_path, job_id)
+            return (200, job) if job is not None else (404, {"error": "el trabajo no existe"})
+        if method != "POST" or action is None:
+            return 404, {"error": "ruta desconocida"}
+        if action == "cancel":
+            return 200, {"ok": self.cancel(job_id)}
+        if action == "heartbeat":
+            return 200, {"ok": self.heartbeat(job_id, field("worker"), body.get("album"))}
+        if action == "started":
+            return 200, {"ok": self.started(job_id, field("worker"), field("album"))}
+        if action == "finish":
+            status = field("status")
+            if status not in (jobs.STATUS_FINISHED, jobs.STATUS_ERROR):
+                raise BadRequest(f"estado no válido: {status}")
+            return 200, {"ok": self.finish(job_id, field("worker"), status, body.get("error"))}
+        return 200, {"ok": self.release(job_id, field("worker"))}
+
+    def _handler(self):
+        service = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                self.handle_request("GET")
+
+            def do_POST(self) -> None:
+                self.handle_request("POST")
+
+            def handle_request(self, method: str) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw_body = self.rfile.read(length) if length else b""
+                if not service.authorized(self.headers.get("Authorization")):
+                    return self.send_json(401, {"error": "token no válido"})
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                try:
+                    body = json.loads(raw_body) if raw_body else {}
+                    status, response = service.dispatch(method, parsed.path, query, body)
+                except (BadRequest, ValueError, KeyError, TypeError) as e:
+                    status, response = 400, {"error": str(e)}
+                except Exception as e:
+                    print(f"Error en {method} {self.path}: {e}")
+                    status, response = 500, {"error": str(e)}
+                self.send_json(status, response)
+
+            def send_json(self, status: int, response) -> None:
+                body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+# Cliente de la API del servicio (interfaz gráfica y trabajadores de otros equipos)
+# Tiene los mismos métodos que JobService, así un trabajador usa la cola local o la remota sin cambios
+class ServiceClient:
+    def __init__(self, url: str, token: str = "") -> None:
+        self.url = url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    def _request(self, method: str, path: str, body: dict | None = None, params: dict | None = None):
+        response = http_client.get_session().request(
+            method, f"{self.url}{path}", json=body, params=params, headers=self.headers,
+            timeout=http_client.DEFAULT_TIMEOUT
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path}: {response.status_code} {response.text}")
+        return response.json()
+
+    def submit(self, url: str, _format: str, genre: str, save: str, priority: int = 0) -> dict:
+        return self._request("POST", "/jobs", {"url": url, "format": _format, "genre": genre, "save": save, "priority": priority})
+
+    def ingest(self, source: str, _format: str, genre: str, save: str, priority: int = 0) -> None:
+        self._request("POST", "/ingest", {"url": source, "format": _format, "genre": genre, "save": save, "priority": priority})
+
+    def list_jobs(self, status: str | None = None) -> list[dict]:
+        return self._request("GET", "/jobs", params={"status": status} if status else None)
+
+    def get_job(self, job_id: int) -> dict:
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def cancel(self, job_id: int) -> bool:
+        return self._request("POST", f"/jobs/{job_id}/cancel")["ok"]
+
+    def events_after(self, after: int) -> dict:
+        return self._request("GET", "/events", params={"after": after})
+
+    def progress(self) -> dict:
+        return self._request("GET", "/progress")
+
+    def claim(self, worker: str) -> dict | None:
+        return self._request("POST", "/workers/claim", {"worker": worker})["job"]
+
+    def heartbeat(self, job_id: int, worker: str, album: dict | None = None) -> bool:
+        return self._request("POST", f"/jobs/{job_id}/heartbeat", {"worker": worker, "album": album})["ok"]
+
+    def started(self, job_id: int, worker: str, album_info: dict) -> bool:
+        return self._request("POST", f"/jobs/{job_id}/started", {"worker": worker, "album": album_info})["ok"]
+
+    def finish(self, job_id: int, worker: str, status: str, error: str | None = None) -> bool:
+        return self._request("POST", f"/jobs/{job_id}/finish", {"worker": worker, "status": status, "error": error})["ok"]
+
+    def release(self, job_id: int, worker: str) -> bool:
+        return self._request("POST", f"/jobs/{job_id}/release", {"worker": worker})["ok"]
+
+
+# Nombre predeterminado de un trabajador: equipo y un sufijo aleatorio (único aunque haya varios por equipo)
+def worker_name() -> str:
+    import uuid
+    return f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+
+
+# Trabajador: reclama trabajos de la cola (JobService o ServiceClient) y descarga hasta slots álbumes a la vez
+# Mientras descarga envía un latido por trabajo cada tercio de la concesión, con el progreso del álbum;
+# si el servicio responde que el trabajo ya no es suyo (cancelado o reasignado), lo abandona
+# save_as reemplaza la carpeta de destino de los trabajos (la ruta del equipo que los agregó puede no existir aquí)
+class Worker:
+    def __init__(self, queue, settings: dict, name: str, slots: int, save_as: str | None = None) -> None:
+        self.queue = queue
+        self.settings = settings
+        self.name = name
+        self.save_as = save_as.replace("\\", "/") if save_as else None
+        self.slots = threading.BoundedSemaphore(max(slots, 1))
+        self.processes = max(slots, 1)
+        self.interval = settings["lease_seconds"] / 3 # Segundos entre latidos (un tercio de la concesión del servicio)
+        self.lock = threading.Lock()
+        self.active = {} # Función que cancela cada trabajo en curso por ID
+        self.albums = {} # Último progreso de cada álbum en curso
+        self.stopping = threading.Event()
+        progress.get_progress_bus(settings).subscribe(self.store_progress)
+
+    def store_progress(self, snapshot: dict) -> None:
+        with self.lock:
+            self.albums = {key: album for key, album in snapshot["albums"].items() if key in self.active}
+
+    # Reclama trabajos hasta que se llama a stop (cuando la cola está vacía consulta cada worker_poll_seconds)
+    # Los latidos empiezan con el primer trabajo (su intervalo depende de la concesión del servicio)
+    def run(self) -> None:
+        heartbeats = None
+        print(f"Trabajador {self.name} listo")
+        while not self.stopping.is_set():
+            self.slots.acquire()
+            try:
+                job = self.queue.claim(self.name)
+            except Exception as e:
+                print(f"No se pudo reclamar un trabajo: {e}")
+                job = None
+            if job is None:
+                self.slots.release()
+                self.stopping.wait(self.settings["worker_poll_seconds"])
+                continue
+            self.interval = job["lease_seconds"] / 3
+            if heartbeats is None:
+                heartbeats = threading.Thread(target=self.send_heartbeats, name="heartbeat", daemon=True)
+                heartbeats.start()
+            threading.Thread(target=self.run_job, args=(job,), name=f"job-{job['id']}", daemon=True).start()
+
+    # Deja de reclamar trabajos; los que están en curso se cancelan y vuelven a la cola
+    def stop(self) -> None:
+        self.stopping.set()
+        with self.lock:
+            active = list(self.active.items())
+        for job_id, cancel in active:
+            cancel()
+            try:
+                self.queue.release(job_id, self.name)
+            except Exception as e:
+                print(f"No se pudo devolver el trabajo {job_id}: {e}")
+
+    # Descarga un trabajo (en un hilo o en un proceso de trabajo, según worker_backend) y lo termina en la cola
+    def run_job(self, job: dict) -> None:
+        job_id = job["id"]
+        save_as = self.save_as or job["save"]
+        on_started = lambda album_info: self.album_started(job_id, album_info)
+        status, error = jobs.STATUS_FINISHED, None
+        try:
+            if self.settings["worker_backend"] == "process":
+                cancelled = threading.Event()
+                with self.lock:
+                    self.active[job_id] = cancelled.set
+                result = workers.get_process_pool(self.settings, self.processes).run(
+                    job["url"], job["format"], job["genre"], save_as,
+                    job_key=job_id, on_started=on_started, cancelled=cancelled
+                )
+            else:
+                downloader = AlbumDownloader(
+                    job["url"], job["format"], job["genre"], save_as, self.settings,
+                    job_key=job_id, on_started=on_started
+                )
+                with self.lock:
+                    self.active[job_id] = downloader.cancel
+                result = downloader.run()
+            if result["missing"]:
+                status, error = jobs.STATUS_ERROR, missing_error(result["missing"])
+        except JobCancelled:
+            print(f"Trabajo {job_id} abandonado")
+            status = None
+        except Exception as e:
+            print(e)
+            status, error = jobs.STATUS_ERROR, str(e)
+        finally:
+            with self.lock:
+                self.active.pop(job_id, None)
+            self.slots.release()
+
+        if status is not None:
+            try:
+                if not self.queue.finish(job_id, self.name, status, error):
+                    print(f"El trabajo {job_id} ya no pertenece a este trabajador")
+            except Exception as e: # Si no se pudo avisar, la concesión vence y el trabajo se repite
+                print(f"No se pudo terminar el trabajo {job_id}: {e}")
+
+    # Envía los datos del álbum al servicio (si falla, el trabajo sigue: solo falta el título en la lista)
+    def album_started(self, job_id: int, album_info: dict) -> None:
+        try:
+            self.queue.started(job_id, self.name, album_info)
+        except Exception as e:
+            print(f"No se pudieron enviar los datos del álbum {job_id}: {e}")
+
+    # Renueva la concesión de cada trabajo en curso
+    def send_heartbeats(self) -> None:
+        while not self.stopping.wait(self.interval):
+            with self.lock:
+                active = list(self.active.items())
+                albums = dict(self.albums)
+            for job_id, cancel in active:
+                try:
+                    if not self.queue.heartbeat(job_id, self.name, albums.get(job_id)):
+                        print(f"El trabajo {job_id} se canceló o se reasignó")
+                        cancel()
+                except Exception as e: # Se reintenta en el próximo latido
+                    print(f"No se pudo enviar el latido del trabajo {job_id}: {e}")
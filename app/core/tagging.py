@@ -0,0 +1,92 @@
+# Importación de módulos necesarios para el funcionamiento
+import base64
+import os
+import struct
+import subprocess
+
+
+# Formatos que admiten la portada como pista de imagen (attached_pic) en FFmpeg
+# opus (Ogg) guarda la portada como comentario METADATA_BLOCK_PICTURE y wav no admite portada
+ATTACHED_PIC_FORMATS = ("flac", "mp3", "aac")
+
+
+# Prepara la portada del álbum una sola vez: la decodifica, la reduce a max_size px y la guarda como JPEG
+# Todas las pistas del álbum copian esta imagen sin volver a decodificarla
+# Devuelve la ruta de la portada o None si no hay miniatura o FFmpeg no pudo leerla
+def prepare_cover(ffmpeg_path: str, thumbnail: str | None, target: str, max_size: int) -> str | None:
+    if not thumbnail or not os.path.exists(thumbnail):
+        return None
+    command = [
+        ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-i", thumbnail,
+        "-vf", f"scale=w='min(iw,{max_size})':h='min(ih,{max_size})':force_original_aspect_ratio=decrease",
+        "-frames:v", "1", "-q:v", "2",
+        target
+    ]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0 or not os.path.exists(target):
+        print(f"No se pudo preparar la portada: {result.stderr.decode(errors='replace').strip()}")
+        return None
+    return target
+
+
+# Devuelve el ancho y alto de una imagen JPEG leyendo su cabecera (0, 0 si no se encuentra)
+def jpeg_size(data: bytes) -> tuple[int, int]:
+    index = 2
+    while index + 9 < len(data):
+        if data[index] != 0xFF:
+            index += 1
+            continue
+        marker = data[index + 1]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC): # Inicio de imagen (SOF)
+            height, width = struct.unpack(">HH", data[index + 5:index + 9])
+            return width, height
+        length = struct.unpack(">H", data[index + 2:index + 4])[0]
+        index += 2 + length
+    return 0, 0
+
+
+# Construye el bloque METADATA_BLOCK_PICTURE (formato de FLAC en base64) para la portada de Ogg/Opus
+def picture_block(cover: str) -> str:
+    with open(cover, "rb") as cover_file:
+        data = cover_file.read()
+    width, height = jpeg_size(data)
+    mime = b"image/jpeg"
+    block = (
+        struct.pack(">I", 3) # Tipo 3: portada frontal
+        + struct.pack(">I", len(mime)) + mime
+        + struct.pack(">I", 0) # Sin descripción
+        + struct.pack(">IIII", width, height, 24, 0)
+        + struct.pack(">I", len(data)) + data
+    )
+    return base64.b64encode(block).decode("ascii")
+
+
+# Etiquetas de una pista a partir de los metadatos del álbum
+def track_tags(album_metadata: dict, song: dict) -> dict:
+    artists = song.get("artists")
+    return {
+        "title": song["title"],
+        "artist": ", ".join(artists) if isinstance(artists, list) else song["artist_principal"],
+        "album_artist": album_metadata["channel"],
+        "album": album_metadata["album_title"],
+        "genre": album_metadata["genre"],
+        "date": album_metadata["year"],
+        "track": f"{song['track_number']}/{album_metadata['playlist_count'] or len(album_metadata['songs_metadata'])}",
+    }
+
+
+# Escapa un valor para el formato ffmetadata de FFmpeg
+def _escape(value) -> str:
+    text = str(value)
+    for char in ("\\", "=", ";", "#", "\n"):
+        text = text.replace(char, f"\\{char}")
+    return text
+
+
+# Escribe las etiquetas en un archivo ffmetadata (evita el límite de longitud de la línea de comandos)
+def write_ffmetadata(path: str, tags: dict) -> str:
+    lines = [";FFMETADATA1"] + [f"{key}={_escape(value)}" for key, value in tags.items() if value not in (None, "")]
+    with open(path, "w", encoding="utf-8") as metadata_file:
+        metadata_file.write("\n".join(lines) + "\n")
+    return path
@@ -0,0 +1,292 @@
+# Importación de módulos necesarios para el funcionamiento
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from app.core import loudness
+from app.core import metrics
+from app.core import tagging
+
+
+# Argumentos de FFmpeg y extensión de salida para cada formato compatible
+# Se usa la calidad máxima de cada códec (equivalente a preferredquality '0')
+CODECS = {
+    "flac": (["-c:a", "flac", "-compression_level", "8"], "flac"),
+    "mp3": (["-c:a", "libmp3lame", "-q:a", "0"], "mp3"),
+    "wav": (["-c:a", "pcm_s16le"], "wav"),
+    "aac": (["-c:a", "aac", "-b:a", "320k"], "m4a"),
+    "opus": (["-c:a", "libopus", "-b:a", "256k"], "opus"),
+}
+
+# Códecs de origen que se pueden copiar sin recodificar a cada formato (prefijos de acodec de yt_dlp)
+# Copiar el audio evita la pérdida de calidad de una segunda compresión y casi no usa CPU
+COPY_CODECS = {
+    "flac": ("flac",),
+    "mp3": ("mp3",),
+    "wav": ("pcm_s16le",),
+    "aac": ("mp4a", "aac"),
+    "opus": ("opus",),
+}
+
+# Etapa de conversión compartida por todos los álbumes
+_transcoder = None
+_transcoder_lock = threading.Lock()
+
+
+# Devuelve la ruta del ejecutable de FFmpeg
+# Si la ruta configurada no existe (p. ej. fuera de Windows) busca FFmpeg en el PATH
+def ffmpeg_executable(settings: dict) -> str:
+    ffmpeg_path = settings.get("ffmpeg_path", "")
+    if ffmpeg_path and os.path.isfile(ffmpeg_path):
+        return ffmpeg_path
+    return shutil.which("ffmpeg") or ffmpeg_path
+
+
+# Devuelve la extensión del archivo final para un formato
+def output_extension(_format: str) -> str:
+    return CODECS[_format][1]
+
+
+# Indica si el audio de origen se puede copiar al formato elegido sin recodificar
+def can_copy(source_codec: str | None, _format: str) -> bool:
+    return bool(source_codec) and source_codec.lower().startswith(COPY_CODECS[_format])
+
+
+# Devuelve el selector de formato de yt_dlp para los formatos de salida de un trabajo
+# Prefiere un audio que ya tenga alguno de los códecs elegidos (se copia en lugar de recodificarse)
+def format_selector(formats: list[str]) -> str:
+    codecs = [codec for _format in formats for codec in COPY_CODECS[_format]]
+    preferred = "".join(f"bestaudio[acodec^={codec}]/" for codec in dict.fromkeys(codecs))
+    return f"{preferred}bestaudio/best"
+
+
+# Convierte los archivos descargados en un conjunto de hilos independiente de las descargas
+# Cada hilo lanza un proceso de FFmpeg, por lo que la conversión usa tantos núcleos como hilos
+# La cola es limitada: si está llena, quien descarga espera (evita llenar el disco de archivos sin convertir)
+# El archivo original no se elimina: un mismo archivo puede convertirse a varios formatos y lo elimina quien lo envía
+class Transcoder:
+    def __init__(self, ffmpeg_path: str, workers: int, queue_size: int) -> None:
+        self.ffmpeg_path = ffmpeg_path
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.running = {} # Procesos de FFmpeg en curso y su archivo de salida (ver terminate)
+        self.running_lock = threading.Lock()
+        self.terminated = False
+        self.threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"transcode-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    # Agrega un archivo a la cola de conversión y devuelve un Future con la ruta final
+    # source_codec es el códec del archivo descargado (acodec de yt_dlp), si se conoce
+    # tags y cover son las etiquetas y la portada (JPEG) que se escriben en el mismo paso
+    # Con analyze, el mismo FFmpeg que convierte entrega el PCM para medir la sonoridad (Future.loudness)
+    def submit(self, source: str, target: str, _format: str, source_codec: str | None = None,
+               tags: dict | None = None, cover: str | None = None, analyze: bool = False) -> Future:
+        future = Future()
+        task = (future, source, target, _format, source_codec, tags, cover, analyze, time.monotonic())
+        self.tasks.put(task) # Bloquea si la cola está llena
+        return future
+
+    # Agrega a la cola la medición de sonoridad de un archivo ya convertido (sin convertirlo)
+    # El Future devuelve la medición (ver loudness.LoudnessMeter.result)
+    def submit_analysis(self, source: str) -> Future:
+        return self.submit(source, None, None, analyze=True)
+
+    # Cada Future guarda la espera en la cola (transcode_wait), la duración de la conversión (transcode_seconds),
+    # si el audio se copió sin recodificar (fast_path) y la medición de sonoridad (loudness, None sin analyze)
+    def _worker(self) -> None:
+        while True:
+            future, source, target, _format, source_codec, tags, cover, analyze, submitted = self.tasks.get()
+            if future.set_running_or_notify_cancel():
+                token = metrics.transcode_usage.start()
+                started = time.monotonic()
+                future.transcode_wait = started - submitted
+                try:
+                    if target is None: # Solo medición
+                        result = self.run_ffmpeg(source, None, [], analyze=True)
+                    else:
+                        result, future.fast_path, future.loudness = self.transcode(
+                            source, target, _format, source_codec, tags, cover, analyze
+                        )
+                except Exception as e:
+                    future.transcode_seconds = time.monotonic() - started
+                    future.set_exception(e)
+                else:
+                    future.transcode_seconds = time.monotonic() - started
+                    future.set_result(result)
+                finally:
+                    metrics.transcode_usage.stop(token)
+            self.tasks.task_done()
+
+    # Convierte un archivo al formato elegido y escribe sus etiquetas y su portada
+    # Si el códec de origen ya es el elegido, solo cambia el contenedor (copia el audio)
+    # y si la copia falla, recodifica
+    # Devuelve la ruta final, si se copió el audio y la medición de sonoridad (con analyze)
+    def transcode(self, source: str, target: str, _format: str, source_codec: str | None = None,
+                  tags: dict | None = None, cover: str | None = None,
+                  analyze: bool = False) -> tuple[str, bool, dict | None]:
+        metadata_file = tagging.write_ffmetadata(f"{target}.ffmeta", tags) if tags else None
+        try:
+            if can_copy(source_codec, _format):
+                try:
+                    measurement = self.run_ffmpeg(source, target, ["-c:a", "copy"], metadata_file, cover, analyze)
+                    return target, True, measurement
+                except RuntimeError as e:
+                    print(f"No se pudo copiar el audio de {source}, se recodifica: {e}")
+
+            codec_args, _ = CODECS[_format]
+            measurement = self.run_ffmpeg(source, target, codec_args, metadata_file, cover, analyze)
+            return target, False, measurement
+        finally:
+            if metadata_file is not None:
+                os.remove(metadata_file)
+
+    # Ejecuta FFmpeg con los argumentos de audio indicados
+    # Las etiquetas se leen de un archivo ffmetadata y la portada se copia sin recodificar
+    # Con analyze se agrega una segunda salida con el PCM del análisis (el audio se decodifica una sola vez)
+    # y se devuelve la medición de sonoridad; sin target solo se mide
+    # Si falla elimina el archivo incompleto y lanza RuntimeError
+    def run_ffmpeg(self, source: str, target: str | None, audio_args: list[str],
+                   metadata_file: str | None = None, cover: str | None = None, analyze: bool = False) -> dict | None:
+        inputs = ["-i", source]
+        maps = ["-map", "0:a"] # Ignora las pistas de video del original (miniaturas incrustadas)
+        if metadata_file is not None:
+            inputs += ["-f", "ffmetadata", "-i", metadata_file]
+            maps += ["-map_metadata", "1"]
+        if cover is not None:
+            inputs += ["-i", cover]
+            maps += ["-map", f"{inputs.count('-i') - 1}:v", "-c:v", "copy", "-disposition:v", "attached_pic"]
+        if target is not None and target.endswith(".mp3"):
+            maps += ["-id3v2_version", "3"] # ID3v2.3 es la versión que leen todos los reproductores
+        command = [
+            self.ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+            *inputs,
+            *([*maps, *audio_args, target] if target is not None else [])
+        ]
+        if not analyze:
+            process = self.start_process(command, target, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            try:
+                _, stderr = process.communicate()
+            finally:
+                self.finish_process(process)
+            returncode, measurement = process.returncode, None
+        else:
+            # Los errores van a un archivo temporal: FFmpeg no se bloquea mientras se lee el PCM
+            with tempfile.TemporaryFile() as error_file:
+                process = self.start_process(
+                    [*command, *loudness.PCM_OUTPUT], target, stdout=subprocess.PIPE, stderr=error_file
+                )
+                try:
+                    measurement = loudness.measure_stream(process.stdout)
+                finally:
+                    process.stdout.close()
+                    returncode = process.wait()
+                    self.finish_process(process)
+                error_file.seek(0)
+                stderr = error_file.read()
+        if returncode != 0:
+            if target is not None and os.path.exists(target): # Elimina el archivo incompleto
+                os.remove(target)
+            raise RuntimeError(f"FFmpeg: {stderr.decode(errors='replace').strip()}")
+        return measurement
+
+    # Lanza un proceso de FFmpeg y lo registra como en curso (no lanza ninguno después de terminate)
+    def start_process(self, command: list[str], target: str | None, **options) -> subprocess.Popen:
+        with self.running_lock:
+            if self.terminated:
+                raise RuntimeError("La conversión se detuvo")
+            process = subprocess.Popen(command, **options)
+            self.running[process] = target
+        return process
+
+    def finish_process(self, process: subprocess.Popen) -> None:
+        with self.running_lock:
+            self.running.pop(process, None)
+
+    # Detiene las conversiones en curso y elimina sus archivos a medias (y sus archivos ffmetadata)
+    # Lo usa un proceso de trabajo que se cierra porque su trabajo se canceló: sin esto, los procesos
+    # de FFmpeg seguirían escribiendo en .temp/converted después de que el proceso de trabajo terminó
+    def terminate(self) -> None:
+        with self.running_lock:
+            self.terminated = True
+            running, self.running = self.running, {}
+        for process, target in running.items():
+            process.kill()
+            process.wait()
+            for path in (target, f"{target}.ffmeta") if target is not None else ():
+                try:
+                    os.remove(path)
+                except FileNotFoundError: # No llegó a crearse o ya lo eliminó run_ffmpeg
+                    pass
+
+
+# Agrega etiquetas a un archivo ya convertido sin recodificar (copia el audio y la portada)
+# El archivo nuevo se escribe en temp_path y reemplaza al original con un renombrado
+# opus (Ogg) guarda las etiquetas en la pista de audio y se copian solas, pero FFmpeg lee su portada
+# (METADATA_BLOCK_PICTURE) como una pista de imagen que no puede volver a escribir: se copia solo el
+# audio y la portada vuelve como etiqueta en tags, junto a las nuevas (en un archivo ffmetadata)
+# Con replace se descartan las etiquetas y la portada del archivo (p. ej. una pista enlazada desde otro
+# álbum): quedan solo tags y cover, también en las etiquetas de la pista de audio
+def add_tags(ffmpeg_path: str, path: str, tags: dict, temp_path: str,
+             cover: str | None = None, replace: bool = False) -> None:
+    metadata_file = None
+    if replace or path.endswith(".opus"):
+        metadata_file = tagging.write_ffmetadata(f"{temp_path}.ffmeta", tags)
+        inputs = ["-f", "ffmetadata", "-i", metadata_file]
+        arguments = ["-map", "0:a", "-map_metadata", "1"]
+        if replace:
+            arguments += ["-map_metadata:s:a", "1:g"]
+    else:
+        inputs = []
+        arguments = ["-map", "0", *[argument for key, value in tags.items() for argument in ("-metadata", f"{key}={value}")]]
+    if cover is not None:
+        inputs += ["-i", cover]
+        arguments += ["-map", f"{inputs.count('-i')}:v", "-disposition:v", "attached_pic"]
+    if path.endswith(".mp3"):
+        arguments += ["-id3v2_version", "3"]
+    command = [
+        ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-i", path,
+        *inputs,
+        *arguments,
+        "-c", "copy",
+        temp_path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True)
+    finally:
+        if metadata_file is not None:
+            os.remove(metadata_file)
+    if result.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise RuntimeError(f"FFmpeg: {result.stderr.decode(errors='replace').strip()}")
+    os.replace(temp_path, path)
+
+
+# Devuelve la etapa de conversión compartida
+# Se crea la primera vez que se necesita con los valores de la configuración
+def get_transcoder(settings: dict) -> Transcoder:
+    global _transcoder
+    with _transcoder_lock:
+        if _transcoder is None:
+            workers = settings.get("transcode_workers") or os.cpu_count() or 1
+            _transcoder = Transcoder(
+                ffmpeg_executable(settings),
+                workers,
+                settings.get("transcode_queue_size") or workers * 2
+            )
+        return _transcoder
+
+
+# Detiene las conversiones en curso de la etapa compartida, si ya se creó (ver Transcoder.terminate)
+def terminate_transcoder() -> None:
+    with _transcoder_lock:
+        transcoder = _transcoder
+    if transcoder is not None:
+        transcoder.terminate()
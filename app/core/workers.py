@@ -0,0 +1,258 @@
+# Importación de módulos necesarios para el funcionamiento
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from app.core import metrics
+from app.core import progress
+
+
+# Métodos del bus de progreso que los procesos de trabajo reenvían al proceso principal
+PROGRESS_METHODS = ("start_album", "update", "finish_track", "finish_album")
+
+
+# Segundos que un proceso de trabajo tiene para detener sus conversiones antes de matarlo
+STOP_TIMEOUT = 5
+
+
+# El proceso de un trabajo terminó sin enviar su resultado (p. ej. un error fatal del intérprete)
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+# Bus de progreso de un proceso de trabajo
+# Guarda la última actualización de cada pista y las envía juntas al proceso principal a la frecuencia
+# del bus (progress_rate_hz); así yt_dlp puede informar muchas veces por segundo sin saturar la tubería
+class ProgressRelay:
+    def __init__(self, connection, rate_hz: float = 5) -> None:
+        self.connection = connection
+        self.interval = 1 / rate_hz
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.updates = {} # Última actualización de cada pista: (álbum, pista) -> (descargado, total)
+        self.thread = threading.Thread(target=self._run, name="progress-relay", daemon=True)
+        self.thread.start()
+
+    # Envía un mensaje al proceso principal (la conexión no admite envíos simultáneos)
+    def send(self, message: tuple) -> None:
+        with self.send_lock:
+            self.connection.send(message)
+
+    def start_album(self, job_key, album: str, artist: str, tracks: int) -> None:
+        self.send(("progress", [("start_album", (job_key, album, artist, tracks))]))
+
+    def update(self, job_key, track_key, downloaded: int, total: int) -> None:
+        with self.lock:
+            self.updates[(job_key, track_key)] = (downloaded, total)
+
+    def finish_track(self, job_key, track_key) -> None:
+        self.flush([("finish_track", (job_key, track_key))])
+
+    def finish_album(self, job_key) -> None:
+        self.flush([("finish_album", (job_key,))])
+
+    # Envía las actualizaciones pendientes (y los avisos indicados después de ellas)
+    def flush(self, calls: list | None = None) -> None:
+        with self.lock:
+            updates, self.updates = self.updates, {}
+        calls = [("update", (*key, *values)) for key, values in updates.items()] + (calls or [])
+        if calls:
+            self.send(("progress", calls))
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError: # El proceso principal cerró la conexión
+                return
+
+
+# Configuración de cada proceso de trabajo
+# Cada proceso tiene su propio pool de pistas y su propio conversor, así que los hilos se reparten entre los procesos
+# El archivo de Prometheus lo escribe el proceso principal con los datos de todos los procesos
+def worker_settings(settings: dict, processes: int) -> dict:
+    transcode_workers = settings.get("transcode_workers") or os.cpu_count() or 1
+    return {
+        **settings,
+        "track_workers": math.ceil(settings["track_workers"] / processes),
+        "transcode_workers": math.ceil(transcode_workers / processes),
+        "metrics_prometheus_path": "",
+    }
+
+
+# Espera el aviso de cierre del proceso principal (un trabajo cancelado o que falló)
+# Detiene los procesos de FFmpeg del conversor y elimina sus archivos a medias antes de terminar:
+# matar solo el proceso de trabajo dejaría a FFmpeg huérfano, escribiendo en .temp/converted
+def _watch_stop(stop) -> None:
+    stop.wait()
+    from app.core import transcoder
+
+    try:
+        transcoder.terminate_transcoder()
+    finally:
+        os._exit(1)
+
+
+# Bucle de un proceso de trabajo: recibe trabajos por la conexión y descarga un álbum a la vez
+# stop es el aviso de cierre (multiprocessing.Event, ver ProcessPool.stop)
+def _worker_main(connection, settings: dict, stop) -> None:
+    # La salida de los trabajos va a stderr, la salida estándar queda para el proceso principal
+    # (el modo sin interfaz imprime ahí el resumen)
+    sys.stdout = sys.stderr
+    threading.Thread(target=_watch_stop, args=(stop,), name="stop", daemon=True).start()
+    from app.core.downloader import AlbumDownloader
+
+    relay = ProgressRelay(connection, settings["progress_rate_hz"])
+    progress.set_progress_bus(relay)
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError: # El proceso principal terminó
+            return
+        if job is None:
+            return
+
+        downloader = AlbumDownloader(
+            job["url"], job["format"], job["genre"], job["save_as"], settings,
+            job_key=job["job_key"],
+            on_started=lambda album_info: relay.send(("started", album_info))
+        )
+        try:
+            result = downloader.run()
+            message = ("result", result, downloader.record)
+        except Exception as e:
+            print(e)
+            message = ("error", str(e), downloader.record)
+        relay.flush()
+        relay.send(message)
+
+
+# Procesos que descargan los álbumes fuera del proceso principal (worker_backend "process")
+# El análisis de los metadatos de yt_dlp (Python puro) no compite por el GIL con la interfaz gráfica
+# y un error fatal en un trabajo solo termina su proceso: el trabajo falla y el proceso se reemplaza
+# Los procesos se reutilizan entre trabajos (yt_dlp se importa una sola vez por proceso)
+class ProcessPool:
+    def __init__(self, settings: dict, processes: int) -> None:
+        self.settings = settings
+        self.processes = max(processes, 1)
+        self.context = multiprocessing.get_context("spawn") # Igual en Windows, Linux y macOS
+        self.condition = threading.Condition()
+        self.idle = [] # Procesos libres: (proceso, conexión, aviso de cierre)
+        self.started = 0 # Procesos creados y vivos
+
+    # Devuelve un proceso libre, crea uno nuevo si hay lugar o espera a que se libere uno
+    def _acquire(self) -> tuple:
+        with self.condition:
+            while not self.idle and self.started >= self.processes:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.started += 1
+        try:
+            connection, child_connection = self.context.Pipe()
+            stop = self.context.Event()
+            process = self.context.Process(
+                target=_worker_main, args=(child_connection, worker_settings(self.settings, self.processes), stop),
+                name="musicdl-worker", daemon=True
+            )
+            process.start()
+            child_connection.close() # Si el proceso termina, recv() del proceso principal lanza EOFError
+            return process, connection, stop
+        except Exception:
+            self._release(None, False)
+            raise
+
+    # Devuelve el proceso a la lista de libres (o lo descarta si terminó mal)
+    def _release(self, worker: tuple | None, reusable: bool) -> None:
+        with self.condition:
+            if reusable:
+                self.idle.append(worker)
+            else:
+                self.started -= 1
+            self.condition.notify()
+
+    # Cierra un proceso de trabajo que no se reutiliza: le pide que detenga sus conversiones y elimine los
+    # archivos a medias (ver _watch_stop) y, si no termina en STOP_TIMEOUT segundos, lo mata
+    @staticmethod
+    def stop(worker: tuple) -> None:
+        process, connection, stop = worker
+        stop.set()
+        process.join(timeout=STOP_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        connection.close()
+
+    # Descarga un álbum en un proceso de trabajo y devuelve su resultado (el mismo de AlbumDownloader.run)
+    # El progreso se aplica al bus del proceso principal y on_started recibe la información del álbum
+    # Si se activa cancelled (threading.Event) el proceso se termina y se lanza JobCancelled
+    def run(self, url: str, _format: str, genre: str, save_as: str, job_key, on_started=None,
+            cancelled: threading.Event | None = None) -> dict:
+        worker = self._acquire()
+        process, connection, _ = worker
+        progress_bus = progress.get_progress_bus(self.settings)
+        reusable = False
+        try:
+            connection.send({"url": url, "format": _format, "genre": genre, "save_as": save_as, "job_key": job_key})
+            while True:
+                if cancelled is not None:
+                    while not connection.poll(0.5):
+                        if cancelled.is_set():
+                            from app.core.downloader import JobCancelled
+                            raise JobCancelled("Trabajo cancelado")
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    process.join(timeout=5)
+                    raise WorkerCrashed(f"El proceso del trabajo terminó inesperadamente (código {process.exitcode})")
+
+                if message[0] == "progress":
+                    for method, arguments in message[1]:
+                        if method in PROGRESS_METHODS:
+                            getattr(progress_bus, method)(*arguments)
+                elif message[0] == "started":
+                    if on_started is not None:
+                        on_started(message[1])
+                else: # Resultado o error del trabajo
+                    _, payload, record = message
+                    reusable = True
+                    if record is not None:
+                        metrics.count_job(self.settings, record)
+                    if message[0] == "error":
+                        raise RuntimeError(payload)
+                    return payload
+        finally:
+            progress_bus.finish_album(job_key) # Un proceso que terminó mal no deja el álbum en el progreso
+            if not reusable:
+                self.stop(worker)
+            self._release(worker, reusable)
+
+    # Termina los procesos libres
+    def close(self) -> None:
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.started -= len(idle)
+        for process, connection, _ in idle:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            process.join(timeout=5)
+            connection.close()
+
+
+# Pool de procesos compartido
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+# Devuelve el pool de procesos compartido (processes = álbumes simultáneos)
+def get_process_pool(settings: dict, processes: int) -> ProcessPool:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPool(settings, processes)
+        return _process_pool
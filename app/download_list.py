@@ -0,0 +1,248 @@
+# Lista de descargas de la interfaz gráfica (modelo/vista de Qt)
+# La vista solo dibuja las filas visibles, así la lista se mantiene fluida con miles de álbumes
+from collections import OrderedDict
+from app.core import artwork
+from app.core import jobs
+from PyQt6.QtCore import (
+    Qt,
+    QAbstractListModel,
+    QModelIndex,
+    QObject,
+    QRect,
+    QRunnable,
+    QSize,
+    QThreadPool,
+    QTimer,
+    pyqtSignal
+)
+from PyQt6.QtGui import (
+    QColor,
+    QFont,
+    QImage,
+    QPixmap
+)
+from PyQt6.QtWidgets import (
+    QApplication,
+    QStyle,
+    QStyledItemDelegate,
+    QStyleOptionProgressBar
+)
+
+
+JOB_ROLE = Qt.ItemDataRole.UserRole + 1 # Datos completos del trabajo (diccionario)
+ROW_HEIGHT = 72 # Alto de cada fila en píxeles (todas las filas miden lo mismo)
+COVER_SIZE = 64 # Tamaño de la portada en la lista
+
+# Colores del estado de cada trabajo
+STATUS_COLORS = {
+    jobs.STATUS_FINISHED: "#2fa84f",
+    jobs.STATUS_ERROR: "#e42222",
+    jobs.STATUS_CANCELLED: "#8a8a8a",
+}
+
+
+# Trabajos de la cola de descargas
+# Los cambios (álbum iniciado, progreso, estado) se acumulan y se aplican juntos unas pocas veces
+# por segundo: por cada lote hay una sola inserción de filas y un solo aviso de cambio
+class DownloadListModel(QAbstractListModel):
+    def __init__(self, rate_hz: float = 5, parent=None) -> None:
+        super().__init__(parent)
+        self.rows = [] # Trabajos en el orden de la lista
+        self.positions = {} # Fila de cada trabajo por ID
+        self.pending = {} # Cambios sin aplicar por ID de trabajo
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / rate_hz))
+        self.timer.timeout.connect(self.apply_updates)
+        self.timer.start()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        job = self.rows[index.row()]
+        if role == JOB_ROLE:
+            return job
+        if role == Qt.ItemDataRole.DisplayRole:
+            return job.get("title") or job.get("url")
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return job.get("error") or job.get("save")
+        return None
+
+    # Carga los trabajos guardados en la cola (al abrir la aplicación)
+    def load(self, job_list: list[dict]) -> None:
+        self.beginResetModel()
+        self.rows = [{**job, "percentage": 100.0 if job["status"] == jobs.STATUS_FINISHED else 0.0} for job in job_list]
+        self.positions = {job["id"]: row for row, job in enumerate(self.rows)}
+        self.endResetModel()
+
+    # Guarda cambios de un trabajo para el próximo lote (un ID nuevo agrega una fila al final)
+    def queue_update(self, job_id: int, **fields) -> None:
+        self.pending.setdefault(job_id, {}).update(fields)
+
+    # Agrega un trabajo nuevo para el próximo lote
+    # No hace nada si el trabajo ya está en la lista (p. ej. el planificador ya lo reclamó)
+    def queue_insert(self, job_id: int, **fields) -> None:
+        if job_id not in self.positions and job_id not in self.pending:
+            self.pending[job_id] = fields
+
+    # Aplica los cambios acumulados
+    def apply_updates(self) -> None:
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+
+        new_jobs = [job_id for job_id in pending if job_id not in self.positions]
+        if new_jobs:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_jobs) - 1)
+            for job_id in new_jobs:
+                self.positions[job_id] = len(self.rows)
+                self.rows.append({"id": job_id, "percentage": 0.0, **pending.pop(job_id)})
+            self.endInsertRows()
+
+        if pending:
+            changed = []
+            for job_id, fields in pending.items():
+                row = self.positions[job_id]
+                self.rows[row].update(fields)
+                changed.append(row)
+            self.dataChanged.emit(self.index(min(changed)), self.index(max(changed)))
+
+
+# Descarga (caché de portadas en disco) y reduce una portada en un hilo del QThreadPool
+class CoverTask(QRunnable):
+    def __init__(self, covers: "CoverCache", url: str) -> None:
+        super().__init__()
+        self.covers = covers
+        self.url = url
+
+    def run(self) -> None:
+        image = QImage()
+        try:
+            path = artwork.get_artwork_cache(self.covers.settings).fetch(self.url)
+            if path is not None:
+                image = QImage(path)
+        except Exception as e:
+            print(f"No se pudo cargar la portada {self.url}: {e}")
+        if not image.isNull():
+            image = image.scaled(
+                self.covers.size, self.covers.size,
+                Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation
+            )
+        self.covers.decoded.emit(self.url, image)
+
+
+# Portadas de la lista en memoria
+# Las imágenes se decodifican y se reducen fuera del hilo de la interfaz (QImage); en el hilo
+# de la interfaz solo se convierten en QPixmap. Se guardan las últimas max_items portadas usadas
+class CoverCache(QObject):
+    decoded = pyqtSignal(str, QImage) # Portada decodificada en otro hilo
+    cover_ready = pyqtSignal(str) # Portada lista para dibujarse
+
+    def __init__(self, settings: dict, max_items: int, size: int, parent=None) -> None:
+        super().__init__(parent)
+        self.settings = settings
+        self.max_items = max_items
+        self.size = size
+        self.pixmaps = OrderedDict() # URL -> QPixmap, de la menos a la más usada
+        self.loading = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.decoded.connect(self.store)
+
+    # Devuelve la portada de una URL o None si aún no está cargada (y empieza a cargarla)
+    def pixmap(self, url: str | None) -> QPixmap | None:
+        if not url:
+            return None
+        pixmap = self.pixmaps.get(url)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(url)
+            return pixmap
+        if url not in self.loading:
+            self.loading.add(url)
+            self.pool.start(CoverTask(self, url))
+        return None
+
+    # Guarda una portada decodificada (una imagen vacía queda guardada para no reintentarla en cada dibujo)
+    def store(self, url: str, image: QImage) -> None:
+        self.loading.discard(url)
+        self.pixmaps[url] = QPixmap.fromImage(image)
+        while len(self.pixmaps) > self.max_items:
+            self.pixmaps.popitem(last=False)
+        self.cover_ready.emit(url)
+
+
+# Dibuja cada trabajo de la lista: portada, título, artista, estado y barra de progreso
+class DownloadDelegate(QStyledItemDelegate):
+    def __init__(self, covers: CoverCache, parent=None) -> None:
+        super().__init__(parent)
+        self.covers = covers
+
+    def sizeHint(self, option, index) -> QSize:
+        return QSize(option.rect.width(), ROW_HEIGHT)
+
+    def paint(self, painter, option, index) -> None:
+        job = index.data(JOB_ROLE)
+        painter.save()
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+
+        rect = option.rect.adjusted(4, 4, -4, -4)
+        cover_rect = QRect(rect.left(), rect.top(), COVER_SIZE, COVER_SIZE)
+        pixmap = self.covers.pixmap(job.get("cover"))
+        if pixmap is not None and not pixmap.isNull():
+            source = QRect(
+                (pixmap.width() - COVER_SIZE) // 2, (pixmap.height() - COVER_SIZE) // 2, COVER_SIZE, COVER_SIZE
+            )
+            painter.drawPixmap(cover_rect, pixmap, source)
+        else:
+            painter.fillRect(cover_rect, QColor("#2b2b2b"))
+
+        left = cover_rect.right() + 10
+        width = rect.right() - left
+        line_height = option.fontMetrics.height()
+
+        # Título
+        title_font = QFont(option.font)
+        title_font.setBold(True)
+        painter.setFont(title_font)
+        title = job.get("title") or job.get("url") or ""
+        painter.drawText(
+            QRect(left, rect.top(), width, line_height), Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            painter.fontMetrics().elidedText(title, Qt.TextElideMode.ElideRight, width)
+        )
+
+        # Artista, pistas y formato
+        painter.setFont(option.font)
+        details = [job.get("artists") or "", f"{job['count_music']} pistas" if job.get("count_music") else "",
+                   (job.get("format") or "").upper()]
+        painter.drawText(
+            QRect(left, rect.top() + line_height + 2, width, line_height), Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            option.fontMetrics.elidedText("  ·  ".join(detail for detail in details if detail), Qt.TextElideMode.ElideRight, width)
+        )
+
+        # Barra de progreso mientras se descarga, si no el estado (y el error)
+        status_rect = QRect(left, rect.top() + 2 * (line_height + 2), width, line_height + 2)
+        if job.get("status") == jobs.STATUS_DOWNLOADING:
+            bar = QStyleOptionProgressBar()
+            bar.rect = status_rect
+            bar.minimum = 0
+            bar.maximum = 100
+            bar.progress = int(job.get("percentage") or 0)
+            bar.text = f"{job.get('percentage') or 0:.0f}%"
+            bar.textVisible = True
+            bar.state = QStyle.StateFlag.State_Enabled | QStyle.StateFlag.State_Horizontal
+            QApplication.style().drawControl(QStyle.ControlElement.CE_ProgressBar, bar, painter)
+        else:
+            status = job.get("status") or ""
+            if job.get("error"):
+                status = f"{status}: {job['error']}"
+            if job.get("status") in STATUS_COLORS:
+                painter.setPen(QColor(STATUS_COLORS[job["status"]]))
+            painter.drawText(
+                status_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+                option.fontMetrics.elidedText(status, Qt.TextElideMode.ElideRight, width)
+            )
+        painter.restore()
@@ -0,0 +1,142 @@
+"""
+Prueba el servicio de descargas con varios trabajadores en un solo equipo (sin conexión a Internet)
+
+Levanta el servidor local de medios (media_server.py) y el servicio de descargas (JobService, sin
+trabajadores propios), agrega los álbumes por la API y arranca varios procesos trabajadores, cada uno
+con su propia carpeta de usuario (como si fueran equipos distintos). Con --kill-after se mata un
+trabajador (SIGKILL) en mitad de la descarga: su concesión vence y otro trabajador repite su trabajo.
+Se informa:
+    finished, errors, cancelled, reclaimed (trabajos concedidos más de una vez), jobs_per_worker, seconds
+
+Uso:
+    python benchmarks/cluster.py [--albums N] [--tracks N] [--workers N] [--jobs N] [--lease S]
+                                 [--kill-after S] [--cancel N] [--rate-kbps KBPS] [--codec opus]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Proceso trabajador: registra el extractor del servidor local y reclama trabajos del servicio
+def run_worker(args) -> int:
+    sys.path.insert(0, REPO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import media_server
+    from app import cli
+
+    media_server.install_extractor(args.media)
+    return cli.main([
+        "worker", "--server", args.worker_of, "--jobs", str(args.jobs), "--name", args.name,
+        "--out", os.path.join(os.environ["HOME"], "Output"), "--backend", "thread"
+    ])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Servicio de descargas con varios trabajadores en un solo equipo")
+    parser.add_argument("--albums", type=int, default=8, help="Álbumes agregados a la cola")
+    parser.add_argument("--tracks", type=int, default=4, help="Pistas por álbum")
+    parser.add_argument("--workers", type=int, default=3, help="Procesos trabajadores")
+    parser.add_argument("--jobs", type=int, default=2, help="Álbumes simultáneos por trabajador")
+    parser.add_argument("--lease", type=float, default=3, help="Segundos de concesión de cada trabajo")
+    parser.add_argument("--kill-after", type=float, default=1.5, help="Mata el primer trabajador a los S segundos (0 = no)")
+    parser.add_argument("--cancel", type=int, default=1, help="Trabajos que se cancelan por la API antes de empezar")
+    parser.add_argument("--rate-kbps", type=int, default=4000, help="Ancho de banda máximo por conexión del servidor local")
+    parser.add_argument("--codec", default="opus", help="Códec del audio servido")
+    parser.add_argument("--seconds", type=float, default=5, help="Duración del audio de cada pista")
+    parser.add_argument("--timeout", type=float, default=300, help="Tiempo máximo de la prueba")
+    parser.add_argument("--worker-of", help=argparse.SUPPRESS) # Proceso trabajador (URL del servicio)
+    parser.add_argument("--media", help=argparse.SUPPRESS)
+    parser.add_argument("--name", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker_of:
+        return run_worker(args)
+
+    workdir = tempfile.mkdtemp(prefix="musicdl-cluster-")
+    os.environ["HOME"] = os.environ["USERPROFILE"] = os.path.join(workdir, "service")
+    sys.path.insert(0, REPO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import media_server
+    from app.core import config
+    from app.core import jobs
+    from app.core import service
+
+    audio = media_server.generate_audio("ffmpeg", workdir, args.codec, args.seconds, 128)
+    server = media_server.MediaServer(audio, args.codec, args.rate_kbps).start()
+
+    with open(config.app_config(), "r") as config_file:
+        settings = json.load(config_file)
+    settings.update(lease_seconds=args.lease, worker_poll_seconds=0.5)
+    job_service = service.JobService(settings, "127.0.0.1", 0)
+    client = service.ServiceClient(job_service.url)
+    threading.Thread(target=job_service.serve, name="service", daemon=True).start()
+
+    started = time.perf_counter()
+    submitted = [
+        client.submit(server.album_url(f"c{index}", args.tracks), "mp3", "", os.path.join(workdir, "Output"))
+        for index in range(args.albums)
+    ]
+    cancelled = [job["id"] for job in submitted[-args.cancel:]] if args.cancel else []
+    for job_id in cancelled:
+        client.cancel(job_id)
+
+    processes = []
+    for index in range(args.workers):
+        home = os.path.join(workdir, f"worker{index}")
+        os.makedirs(home, exist_ok=True)
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker-of", job_service.url, "--media", server.base,
+             "--name", f"worker{index}", "--jobs", str(args.jobs)],
+            env=dict(os.environ, HOME=home, USERPROFILE=home), stdout=open(os.path.join(workdir, f"w{index}.log"), "w"), stderr=subprocess.STDOUT
+        ))
+
+    killed = False
+    finals = (jobs.STATUS_FINISHED, jobs.STATUS_ERROR, jobs.STATUS_CANCELLED)
+    while time.perf_counter() - started < args.timeout:
+        if args.kill_after and not killed and time.perf_counter() - started >= args.kill_after:
+            processes[0].send_signal(signal.SIGKILL)
+            killed = True
+        job_list = client.list_jobs()
+        if all(job["status"] in finals for job in job_list):
+            break
+        time.sleep(0.2)
+    elapsed = time.perf_counter() - started
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+    job_service.stop()
+    server.stop()
+
+    job_list = jobs.get_jobs(settings["db_music_list"])
+    jobs_per_worker = {}
+    for job in job_list:
+        if job["status"] == jobs.STATUS_FINISHED:
+            jobs_per_worker[job["worker"]] = jobs_per_worker.get(job["worker"], 0) + 1
+    print(json.dumps({
+        "albums": args.albums,
+        "workers": args.workers,
+        "killed_worker": "worker0" if killed else None,
+        "finished": sum(job["status"] == jobs.STATUS_FINISHED for job in job_list),
+        "errors": sum(job["status"] == jobs.STATUS_ERROR for job in job_list),
+        "cancelled": sum(job["status"] == jobs.STATUS_CANCELLED for job in job_list),
+        "pending": sum(job["status"] not in finals for job in job_list),
+        "reclaimed": sum(job["attempts"] > 1 for job in job_list), # Trabajos repetidos por otro trabajador
+        "jobs_per_worker": jobs_per_worker,
+        "seconds": round(elapsed, 3),
+        "server_requests": server.requests,
+    }, indent=2))
+    return 0 if all(job["status"] in (jobs.STATUS_FINISHED, jobs.STATUS_CANCELLED) for job in job_list) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+Servidor local que imita YouTube Music para las pruebas de rendimiento (sin conexión a Internet)
+
+Sirve álbumes sintéticos: cada álbum tiene su lista de pistas, sus miniaturas y un archivo de audio
+por pista generado con FFmpeg (tamaño según la duración y el bitrate). Un extractor de yt_dlp
+(StubIE) reconoce las URLs del servidor y devuelve los mismos metadatos que YouTube Music
+(entradas, artistas, fechas, miniaturas y formatos), así el motor de descargas recorre el mismo
+camino que con YouTube.
+
+URLs:
+    {base}/album/<id>-<pistas>   álbum con el número de pistas indicado
+    {base}/track/<id>            una sola pista
+    {base}/playlist?list=<id>-<pistas>
+                                 el mismo álbum con la forma de URL de YouTube
+    {base}/channel/<id>-<álbumes>-<pistas>
+                                 artista con el número de álbumes indicado (para la ingesta de discografías)
+    {base}/info/<tipo>/<id>      metadatos en JSON (para el extractor de otros procesos)
+"""
+
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+
+
+# Contenedor, códec y parámetros de FFmpeg del audio servido
+# YouTube sirve opus en webm y aac en m4a; wav sirve para medir sin coste de decodificación
+SOURCE_CODECS = {
+    "opus": ("webm", "opus", ["-c:a", "libopus"]),
+    "aac": ("m4a", "mp4a.40.2", ["-c:a", "aac"]),
+    "wav": ("wav", "pcm_s16le", ["-c:a", "pcm_s16le"]),
+}
+
+# Imagen JPEG mínima (1x1) para las miniaturas
+THUMBNAIL = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300" + "08" * 64 +
+    "ffc0000b080001000101011100ffc4001f0000010501010101010100000000000000000102030405060708090a0b"
+    "ffc400b5100002010303020403050504040000017d01020300041105122131410613516107227114328191a108"
+    "2342b1c11552d1f02433627282090a161718191a25262728292a3435363738393a434445464748494a5354555657"
+    "58595a636465666768696a737475767778797a838485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2"
+    "b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9fa"
+    "ffda0008010100003f00d2cf20ffd9"
+)
+
+
+# Genera el audio de prueba con FFmpeg (un tono de la duración y el bitrate indicados)
+def generate_audio(ffmpeg_path: str, folder: str, codec: str, seconds: float, bitrate_kbps: int) -> str:
+    extension, _, codec_args = SOURCE_CODECS[codec]
+    path = os.path.join(folder, f"source.{extension}")
+    command = [
+        ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate=48000",
+        "-ac", "2", *codec_args
+    ]
+    if codec != "wav":
+        command += ["-b:a", f"{bitrate_kbps}k"]
+    subprocess.run(command + [path], check=True, capture_output=True)
+    return path
+
+
+class MediaServer:
+    # audio_path: archivo servido para todas las pistas
+    # rate_kbps: ancho de banda máximo por conexión (0 = sin límite)
+    # fail_rate: probabilidad de que una petición de audio responda 503 (error temporal)
+    # broken_rate: proporción de pistas que siempre responden 404 (error permanente)
+    # resolve_ms: tiempo que tarda en resolverse cada pista de un álbum (como la página de cada video en YouTube)
+    def __init__(self, audio_path: str, codec: str, rate_kbps: int = 0, fail_rate: float = 0.0,
+                 broken_rate: float = 0.0, seed: int = 0, resolve_ms: int = 0) -> None:
+        with open(audio_path, "rb") as audio_file:
+            self.audio = audio_file.read()
+        self.extension, self.acodec, _ = SOURCE_CODECS[codec]
+        self.rate = rate_kbps * 1000 // 8
+        self.fail_rate = fail_rate
+        self.broken_rate = broken_rate
+        self.resolve_delay = resolve_ms / 1000
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.sent_bytes = 0
+        self.stats_lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="media-server", daemon=True)
+
+    def start(self) -> "MediaServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Una pista rota responde siempre 404 (se decide por su ID, igual en todas las ejecuciones)
+    def is_broken(self, track_id: str) -> bool:
+        digest = hashlib.sha1(track_id.encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 2 ** 32 < self.broken_rate
+
+    def should_fail(self) -> bool:
+        with self.random_lock:
+            return self.random.random() < self.fail_rate
+
+    def album_url(self, album_id: str, tracks: int) -> str:
+        return f"{self.base}/album/{album_id}-{tracks}"
+
+    def artist_url(self, artist_id: str, albums: int, tracks: int) -> str:
+        return f"{self.base}/channel/{artist_id}-{albums}-{tracks}"
+
+    # Metadatos de una pista con la misma forma que los de YouTube Music
+    def track_info(self, track_id: str) -> dict:
+        return {
+            "id": track_id,
+            "title": f"Track {track_id}",
+            "uploader": "Benchmark Artist - Topic",
+            "artists": ["Benchmark Artist"],
+            "release_year": 2024,
+            "upload_date": "20240101",
+            "webpage_url": f"{self.base}/track/{track_id}",
+            "formats": [{
+                "format_id": self.extension,
+                "url": f"{self.base}/audio/{track_id}.{self.extension}",
+                "ext": self.extension,
+                "acodec": self.acodec,
+                "vcodec": "none",
+                "filesize": len(self.audio),
+            }],
+        }
+
+    # Metadatos de un álbum (lista de reproducción) con la misma forma que los de YouTube Music
+    # Como en YouTube, las entradas son enlaces: yt_dlp resuelve cada pista con otra extracción
+    def album_info(self, album_id: str, tracks: int) -> dict:
+        return {
+            "_type": "playlist",
+            "id": f"{album_id}-{tracks}", # Igual que el parámetro list de la URL (clave del archivo de descargas)
+            "title": f"Album - Benchmark {album_id}",
+            "entries": [
+                {
+                    "_type": "url",
+                    "id": f"{album_id}t{index}",
+                    "url": f"{self.base}/track/{album_id}t{index}",
+                    "title": f"Track {album_id}t{index}",
+                }
+                for index in range(tracks)
+            ],
+            "playlist_count": tracks,
+            "modified_date": "20240101",
+            "thumbnails": [{"url": f"{self.base}/thumbnails/{album_id}-{size}.jpg"} for size in (60, 226, 544)],
+        }
+
+    # Metadatos de un artista: como la pestaña de lanzamientos de YouTube, las entradas son enlaces a sus álbumes
+    def artist_info(self, artist_id: str, albums: int, tracks: int) -> dict:
+        return {
+            "_type": "playlist",
+            "id": artist_id,
+            "title": f"Benchmark Artist {artist_id} - Releases",
+            "entries": [
+                {
+                    "_type": "url",
+                    "id": f"{artist_id}a{index}-{tracks}",
+                    "url": f"{self.base}/playlist?list={artist_id}a{index}-{tracks}",
+                    "title": f"Album - Benchmark {artist_id}a{index}",
+                }
+                for index in range(albums)
+            ],
+        }
+
+    # Metadatos de una URL del servidor (kind es "album", "track" o "channel")
+    def info(self, kind: str, item_id: str) -> dict:
+        if kind == "track":
+            time.sleep(self.resolve_delay)
+            return self.track_info(item_id)
+        if kind == "channel":
+            artist_id, albums, tracks = item_id.rsplit("-", 2)
+            return self.artist_info(artist_id, int(albums), int(tracks))
+        album_id, _, tracks = item_id.rpartition("-")
+        return self.album_info(album_id, int(tracks))
+
+    def _handler(self):
+        media_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                info_match = re.fullmatch(r"/info/(album|track|channel)/([\w-]+)", self.path)
+                if info_match: # Metadatos (no cuentan como peticiones de medios)
+                    info = media_server.info(*info_match.groups())
+                    return self.send_body(json.dumps(info).encode("utf-8"), "application/json")
+                with media_server.stats_lock:
+                    media_server.requests += 1
+                if self.path.startswith("/thumbnails/"):
+                    return self.send_body(THUMBNAIL, "image/jpeg")
+                match = re.fullmatch(r"/audio/([\w-]+)\.\w+", self.path)
+                if match is None:
+                    return self.send_error(404)
+                if media_server.is_broken(match.group(1)):
+                    return self.send_error(404)
+                if media_server.should_fail():
+                    with media_server.stats_lock:
+                        media_server.failures += 1
+                    return self.send_error(503)
+                self.send_body(media_server.audio, "application/octet-stream")
+
+            # Envía el cuerpo respetando Range (reanudación) y el límite de ancho de banda
+            def send_body(self, body: bytes, content_type: str) -> None:
+                start = 0
+                range_match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if range_match:
+                    start = int(range_match.group(1))
+                    end = int(range_match.group(2)) + 1 if range_match.group(2) else len(body)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(body)}")
+                    body = body[start:end]
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+
+                chunk_size = 64 * 1024
+                started = time.monotonic()
+                try:
+                    for offset in range(0, len(body), chunk_size):
+                        self.wfile.write(body[offset:offset + chunk_size])
+                        if media_server.rate: # Espera hasta que el envío vuelva al ritmo permitido
+                            ahead = (offset + chunk_size) / media_server.rate - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                with media_server.stats_lock:
+                    media_server.sent_bytes += len(body)
+
+        return Handler
+
+
+# Registra el extractor del servidor en yt_dlp
+# Se agrega antes que los demás en cada YoutubeDL para que las URLs locales no lleguen al extractor genérico
+# Con la URL base del servidor (en lugar del servidor) los metadatos se piden por HTTP; así el extractor
+# funciona en otros procesos, p. ej. los procesos de trabajo de --backend process
+def install_extractor(media_server: MediaServer | str) -> None:
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+
+    base = media_server if isinstance(media_server, str) else media_server.base
+
+    class StubIE(InfoExtractor):
+        IE_NAME = "MusicDLBenchmark"
+        _VALID_URL = re.escape(base) + r"/(?:(?P<kind>album|track|channel)/(?P<id>[\w-]+)|playlist\?list=(?P<list>[\w-]+))"
+
+        def _real_extract(self, url: str) -> dict:
+            kind, item_id, playlist_id = self._match_valid_url(url).group("kind", "id", "list")
+            if playlist_id:
+                kind, item_id = "album", playlist_id
+            if isinstance(media_server, str):
+                return self._download_json(f"{base}/info/{kind}/{item_id}", item_id)
+            return media_server.info(kind, item_id)
+
+    original_init = yt_dlp.YoutubeDL.__init__
+
+    def init(ydl, *args, **kwargs) -> None:
+        original_init(ydl, *args, **kwargs)
+        ydl._ies = {StubIE.ie_key(): StubIE, **ydl._ies}
+        ydl._ies_instances[StubIE.ie_key()] = StubIE(ydl)
+
+    yt_dlp.YoutubeDL.__init__ = init
@@ -0,0 +1,75 @@
+"""
+Mide el tiempo de arranque de la configuración (app_config + listas de formatos y géneros)
+
+Uso:
+    python benchmarks/startup.py [--repo RUTA] [--runs N]
+
+--repo permite medir otra copia del repositorio (p. ej. una versión anterior con git worktree)
+para comparar el antes y el después.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+# Código que se ejecuta en un proceso nuevo, igual que el arranque de la aplicación
+# Imprime los milisegundos de la importación y de la configuración por separado
+STARTUP_CODE = """
+import json, time
+started = time.perf_counter()
+from app.core import config
+imported = time.perf_counter()
+with open(config.app_config(), "r") as config_file:
+    app_config = json.load(config_file)
+config.get_formats_list(app_config["db_formats"])
+config.get_genres_list(app_config["db_genres"])
+config.get_genres_list(app_config["db_genres"]) # La segunda consulta de la interfaz (extract_genre)
+print((imported - started) * 1000, (time.perf_counter() - imported) * 1000)
+"""
+
+
+# Ejecuta un arranque en un proceso nuevo
+# Devuelve los milisegundos de la importación y los de la configuración
+def run_startup(repo: str, home: str) -> tuple[float, float]:
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_CODE],
+        cwd=repo, env=env, capture_output=True, text=True, check=True
+    )
+    import_ms, config_ms = result.stdout.strip().splitlines()[-1].split()
+    return float(import_ms), float(config_ms)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de app_config")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--runs", type=int, default=20, help="Arranques con la configuración ya creada")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        first_run = run_startup(args.repo, home) # Primer arranque: crea carpetas, bases de datos y configuración
+        config_file = os.path.join(home, "Music-DL", "Config", "app_config.json")
+        modified = os.stat(config_file).st_mtime_ns
+        warm_runs = [run_startup(args.repo, home) for _ in range(args.runs)]
+        rewritten = os.stat(config_file).st_mtime_ns != modified
+
+    warm_import = [import_ms for import_ms, _ in warm_runs]
+    warm_config = [config_ms for _, config_ms in warm_runs]
+    print(json.dumps({
+        "repo": args.repo,
+        "first_run_config_ms": round(first_run[1], 2),
+        "warm_import_median_ms": round(statistics.median(warm_import), 2),
+        "warm_config_median_ms": round(statistics.median(warm_config), 2),
+        "warm_config_min_ms": round(min(warm_config), 2),
+        "config_rewritten": rewritten # True si los arranques volvieron a escribir app_config.json
+    }, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Mide el rendimiento de las descargas sin conexión a Internet
+
+Sirve álbumes sintéticos desde un servidor local (media_server.py) y los descarga con el mismo
+motor que la interfaz gráfica y el modo sin interfaz, probando varias combinaciones de álbumes
+simultáneos (--jobs, max_threads en la interfaz), pistas simultáneas (--track-workers),
+conversiones simultáneas (--transcode-workers), hilos o procesos de trabajo (--backend, worker_backend)
+y núcleos disponibles (--cores, solo Linux). Cada combinación se ejecuta en un proceso nuevo
+con una carpeta de usuario vacía (sin cachés) y se informa:
+    albums_per_hour, tracks_per_second, first_track_seconds, peak_rss_mb, cpu_seconds, cpu_percent
+
+Con --resolve-ms cada pista tarda en resolverse (como la página de cada video en YouTube) y con --lazy
+se usa la extracción plana de la lista (lazy_playlist): first_track_seconds (media del tiempo hasta
+la primera pista terminada de cada álbum) deja de depender del número de pistas.
+
+Uso:
+    python benchmarks/throughput.py [--albums N] [--tracks N] [--jobs 1,3] [--track-workers 1,4]
+                                    [--transcode-workers 0] [--backend thread,process] [--cores 1,2,4]
+                                    [--codec opus] [--seconds S] [--bitrate KBPS]
+                                    [--rate-kbps KBPS] [--fail-rate P] [--broken-rate P] [--resolve-ms MS] [--lazy]
+                                    [--output resultados.json] [--baseline resultados.json] [--tolerance 0.15]
+
+Con --baseline se compara tracks_per_second con un resultado guardado antes con --output
+y el proceso termina con código 1 si alguna combinación es más lenta que la tolerancia.
+La memoria y la CPU se miden con el módulo resource (no disponible en Windows).
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Variable de entorno con la URL del servidor local para los procesos de trabajo
+SERVER_ENV = "MUSICDL_BENCHMARK_SERVER"
+
+# Los procesos de trabajo (--backend process) importan este archivo como módulo principal:
+# registran el extractor del servidor local antes de recibir trabajos
+if __name__ == "__mp_main__" and os.environ.get(SERVER_ENV):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import media_server
+    media_server.install_extractor(os.environ[SERVER_ENV])
+
+
+# Lee una lista de enteros separados por comas ("1,2,4")
+def int_list(text: str) -> list[int]:
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+# Lee una lista de textos separados por comas ("thread,process")
+def text_list(text: str) -> list[str]:
+    return [value.strip() for value in text.split(",") if value.strip()]
+
+
+# Memoria máxima (MB) del proceso y segundos de CPU del proceso y de sus hijos (FFmpeg y los procesos de trabajo)
+# La memoria de los hijos no se informa: en Linux conservan el máximo del proceso antes de exec
+def resource_usage() -> dict:
+    if resource is None:
+        return {"peak_rss_mb": None, "cpu_seconds": None}
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "peak_rss_mb": round(own.ru_maxrss / scale, 1),
+        "cpu_seconds": round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 3),
+    }
+
+
+# Ejecuta una combinación dentro del proceso hijo e imprime su resultado como JSON
+def run_child(args) -> int:
+    sys.path.insert(0, REPO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import media_server
+    from app import cli
+
+    if args.core_count: # Limita el proceso (y sus procesos hijos) a los primeros núcleos
+        os.sched_setaffinity(0, range(args.core_count))
+
+    server = media_server.MediaServer(
+        args.audio, args.codec, args.rate_kbps, args.fail_rate, args.broken_rate, resolve_ms=args.resolve_ms
+    ).start()
+    media_server.install_extractor(server)
+    os.environ[SERVER_ENV] = server.base
+
+    urls_path = os.path.join(args.workdir, "urls.txt")
+    with open(urls_path, "w", encoding="utf-8") as urls_file:
+        urls_file.write("\n".join(server.album_url(f"b{index}", args.tracks) for index in range(args.albums)))
+
+    # Sin un valor explícito, una conversión por núcleo disponible
+    transcode_workers = args.transcode_worker_count or args.core_count
+    output = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        cli.main([
+            "batch", urls_path, "--format", args.format, "--out", os.path.join(args.workdir, "Output"),
+            "--jobs", str(args.job_count), "--track-workers", str(args.track_worker_count),
+            "--transcode-workers", str(transcode_workers), "--backend", args.backend_name, "--no-sync",
+            "--lazy" if args.lazy else "--no-lazy"
+        ])
+    elapsed = time.perf_counter() - started
+    server.stop()
+
+    summary = json.loads(output.getvalue())
+    tracks = sum(album.get("tracks", 0) - len(album.get("failed", [])) for album in summary["albums"])
+    fast_path = sum(album.get("fast_path", 0) for album in summary["albums"])
+    first_tracks = [album["first_track_seconds"] for album in summary["albums"] if album.get("first_track_seconds") is not None]
+    phases = {}
+    for album in summary["albums"]:
+        for name, seconds in album.get("phases", {}).items():
+            phases[name] = round(phases.get(name, 0.0) + seconds, 3)
+
+    usage = resource_usage()
+    print(json.dumps({
+        "albums_ok": summary["ok"],
+        "albums_error": summary["errors"],
+        "tracks": tracks,
+        "seconds": round(elapsed, 3),
+        "albums_per_hour": round(summary["ok"] / elapsed * 3600, 1),
+        "tracks_per_second": round(tracks / elapsed, 3),
+        "first_track_seconds": round(sum(first_tracks) / len(first_tracks), 3) if first_tracks else None,
+        "fast_path_tracks": fast_path, # Pistas copiadas sin recodificar
+        **usage,
+        "cpu_percent": round(usage["cpu_seconds"] / elapsed * 100, 1) if usage["cpu_seconds"] is not None else None,
+        "phases": phases, # Suma de la duración de cada fase en todos los álbumes
+        "server_requests": server.requests,
+        "server_failures": server.failures,
+        "server_bytes": server.sent_bytes,
+    }))
+    return 0
+
+
+# Ejecuta una combinación en un proceso nuevo con una carpeta de usuario vacía
+def run_configuration(args, audio_path: str, backend: str, cores: int, jobs: int, track_workers: int,
+                      transcode_workers: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, HOME=workdir, USERPROFILE=workdir)
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child",
+            "--audio", audio_path, "--workdir", workdir, "--codec", args.codec, "--format", args.format,
+            "--albums", str(args.albums), "--tracks", str(args.tracks),
+            "--job-count", str(jobs), "--track-worker-count", str(track_workers),
+            "--transcode-worker-count", str(transcode_workers), "--backend-name", backend, "--core-count", str(cores),
+            "--rate-kbps", str(args.rate_kbps), "--fail-rate", str(args.fail_rate),
+            "--broken-rate", str(args.broken_rate), "--resolve-ms", str(args.resolve_ms),
+            *(["--lazy"] if args.lazy else []),
+        ]
+        result = subprocess.run(
+            command, cwd=REPO, env=env, stdout=subprocess.PIPE,
+            stderr=None if args.verbose else subprocess.DEVNULL, text=True, check=True
+        )
+    return {
+        "backend": backend, "cores": cores or os.cpu_count(),
+        "jobs": jobs, "track_workers": track_workers, "transcode_workers": transcode_workers,
+        **json.loads(result.stdout.strip().splitlines()[-1])
+    }
+
+
+# Compara con un resultado anterior; devuelve las combinaciones más lentas que la tolerancia
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    key = lambda result: (result.get("backend", "thread"), result.get("cores"),
+                          result["jobs"], result["track_workers"], result["transcode_workers"])
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is None or not before["tracks_per_second"]:
+            continue
+        change = result["tracks_per_second"] / before["tracks_per_second"] - 1
+        result["change"] = round(change, 3)
+        if change < -tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rendimiento de las descargas con un servidor local")
+    parser.add_argument("--albums", type=int, default=6, help="Álbumes por combinación")
+    parser.add_argument("--tracks", type=int, default=8, help="Pistas por álbum")
+    parser.add_argument("--jobs", type=int_list, default=[1, 3], help="Álbumes simultáneos (lista)")
+    parser.add_argument("--track-workers", type=int_list, default=[1, 4], help="Pistas simultáneas (lista)")
+    parser.add_argument("--transcode-workers", type=int_list, default=[0], help="Conversiones simultáneas, 0 = núcleos (lista)")
+    parser.add_argument("--backend", type=text_list, default=["thread"], help="Hilos o procesos de trabajo (lista: thread,process)")
+    parser.add_argument("--cores", type=int_list, default=[0], help="Núcleos disponibles, 0 = todos (lista, solo Linux)")
+    parser.add_argument("--format", default="mp3", help="Formato de salida")
+    parser.add_argument("--codec", default="opus", choices=["opus", "aac", "wav"], help="Códec del audio servido")
+    parser.add_argument("--seconds", type=float, default=30, help="Duración de cada pista")
+    parser.add_argument("--bitrate", type=int, default=160, help="Bitrate del audio servido (kbps)")
+    parser.add_argument("--rate-kbps", type=int, default=0, help="Ancho de banda por conexión (kbps, 0 = sin límite)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probabilidad de error 503 por petición de audio")
+    parser.add_argument("--broken-rate", type=float, default=0.0, help="Proporción de pistas que siempre fallan (404)")
+    parser.add_argument("--resolve-ms", type=int, default=0, help="Milisegundos que tarda en resolverse cada pista")
+    parser.add_argument("--lazy", action="store_true", help="Extracción plana de la lista (lazy_playlist)")
+    parser.add_argument("--output", help="Guarda los resultados en un archivo JSON")
+    parser.add_argument("--baseline", help="Resultados anteriores (--output) con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Pérdida de tracks_per_second permitida")
+    parser.add_argument("--verbose", action="store_true", help="Muestra la salida de los trabajos")
+    # Opciones internas del proceso hijo
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--audio", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--job-count", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--track-worker-count", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--transcode-worker-count", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--backend-name", help=argparse.SUPPRESS)
+    parser.add_argument("--core-count", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+    if any(args.cores) and not hasattr(os, "sched_setaffinity"):
+        parser.error("--cores solo está disponible en Linux")
+
+    sys.path.insert(0, REPO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import media_server
+    from app.core import transcoder
+
+    ffmpeg_path = transcoder.ffmpeg_executable({"ffmpeg_path": os.path.join(REPO, "app", "resources", "bin", "ffmpeg.exe")})
+    results = []
+    with tempfile.TemporaryDirectory() as audio_folder:
+        audio_path = media_server.generate_audio(ffmpeg_path, audio_folder, args.codec, args.seconds, args.bitrate)
+        configurations = itertools.product(args.backend, args.cores, args.jobs, args.track_workers, args.transcode_workers)
+        for backend, cores, jobs, track_workers, transcode_workers in configurations:
+            result = run_configuration(args, audio_path, backend, cores, jobs, track_workers, transcode_workers)
+            results.append(result)
+            sys.stderr.write(
+                f"backend={backend} cores={result['cores']} jobs={jobs} track_workers={track_workers} "
+                f"transcode_workers={transcode_workers}: "
+                f"{result['tracks_per_second']} pistas/s, {result['albums_per_hour']} álbumes/h, "
+                f"primera pista {result['first_track_seconds']} s, "
+                f"{result['peak_rss_mb']} MB, CPU {result['cpu_percent']}%\n"
+            )
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"], args.tolerance)
+
+    report = {
+        "settings": {
+            "albums": args.albums, "tracks": args.tracks, "format": args.format, "codec": args.codec,
+            "seconds": args.seconds, "bitrate": args.bitrate, "rate_kbps": args.rate_kbps,
+            "fail_rate": args.fail_rate, "broken_rate": args.broken_rate,
+            "resolve_ms": args.resolve_ms, "lazy": args.lazy,
+        },
+        "results": results,
+        "regressions": len(regressions),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=4)
+    print(json.dumps(report, indent=4))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,13 +3,17 @@ Music-DL v2
 """
 
 import sys
-import sqlite3
-import yt_dlp
 import json
-import os
-import re
-import requests
+import multiprocessing
+import threading
 from app.core import config
+from app.core import ingest
+from app.core import jobs
+from app.core import progress
+from app.core import service
+from app.core import workers
+from app.core.downloader import AlbumDownloader, JobCancelled, missing_error
+from app.download_list import COVER_SIZE, JOB_ROLE, CoverCache, DownloadDelegate, DownloadListModel
 from PyQt6.QtWidgets import (
     QMainWindow,
     QApplication,
@@ -19,6 +23,8 @@ from PyQt6.QtWidgets import (
     QLabel,
     QLineEdit,
     QComboBox,
+    QListView,
+    QMenu,
     QPushButton,
     QSpacerItem,
     QSizePolicy,
@@ -32,6 +38,7 @@ from PyQt6.QtCore import (
     Qt,
     QTimer,
     QThread,
+    QObject,
     pyqtSignal,
     QMutex
 )
@@ -41,162 +48,156 @@ with open(config.app_config(), "r") as config_file:
     app_config = json.load(config_file)
 
 class DownloadAlbum_Thread(QThread):
-    finished_thread = pyqtSignal()
-    progress_updated = pyqtSignal(str, float)  # Para actualizar el progreso
-    download_started = pyqtSignal(dict)  # Para informar inicio de descarga
+    finished_thread = pyqtSignal(int)  # ID del trabajo finalizado
+    failed_thread = pyqtSignal(int, str)  # ID del trabajo y mensaje de error
+    cancelled_thread = pyqtSignal(int)  # ID del trabajo cancelado
+    progress_updated = pyqtSignal(int, str, float)  # Progreso del álbum (ID del trabajo, titulo, porcentaje), agrupado por el bus de progreso
+    download_started = pyqtSignal(dict)  # Para informar inicio de descarga (información del álbum con el ID del trabajo)
 
-    def __init__(self, url: str, _format: str, genre: str, save_as: str) -> None:
+    def __init__(self, job_id: int, url: str, _format: str, genre: str, save_as: str) -> None:
         super().__init__()
+        self.job_id = job_id
         self.url = url
         self._format = _format
         self.genre = genre
         self.save_as = save_as.replace("\\", "/")
-
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-            if total > 0:
-                percentage = (d['downloaded_bytes'] / total) * 100
-                self.progress_updated.emit(d['filename'], percentage)
+        self.cancelled = threading.Event() # Se pidió cancelar la descarga (ver cancel)
 
     def run(self) -> None:
+        progress_bus = progress.get_progress_bus(app_config)
+        progress_bus.subscribe(self.publish_progress)
         try:
-            ydl_opts = { # opciones de yt_dlp
-                "quiet" : True, # Muestra solo advertencias importantes
-                'no_warnings': True,  # Suprime las advertencias
-            }
+            if app_config["worker_backend"] == "process": # El álbum se descarga en un proceso de trabajo
+                result = workers.get_process_pool(app_config, app_config["max_threads"]).run(
+                    self.url, self._format, self.genre, self.save_as,
+                    job_key=self.job_id, on_started=self.album_started, cancelled=self.cancelled
+                )
+            else:
+                downloader = AlbumDownloader(
+                    self.url, self._format, self.genre, self.save_as, app_config,
+                    job_key=self.job_id, # Identifica el álbum en el bus de progreso
+                    on_started=self.album_started # Información del álbum
+                )
+                downloader.cancelled = self.cancelled # El descargador ve la cancelación del hilo
+                result = downloader.run()
+            print(f"Llamadas al extractor: {result['extractor_calls']}")
+            if result["skipped"]:
+                print(f"Pistas ya descargadas (omitidas): {result['skipped']}")
+            if result["fast_path"]:
+                print(f"Pistas copiadas sin recodificar: {result['fast_path']}")
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ytd: # Descarga solo los metadatos de la URL
-                metadata = ytd.extract_info(self.url, download=False)
-            
-            # Obtiene su titulo, artista principal, artistas, año y fecha de creacion/modificacion de cada pista
-            playlist_entries = metadata.get("entries", [])
-            songs = [
-                {
-                    "id": entry.get("id"), # ID
-                    "title": entry.get("title", "Sin título"), # Titulo 
-                    "artist_principal": entry.get("uploader", "Artista desconocido").replace(" - Topic", ""), # Artista principal
-                    "artists": entry.get("artists", "Artistas desconocidos"), # Artistas
-                    "year": entry.get("release_year", ""), # Año de creacion/modificacion
-                    "date": entry.get("upload_date", "") # Fecha de creacion/modificacion
-                }
-                for entry in playlist_entries
-            ]
-
-            # Obtiene el nombre del canal
-            common_artists = set(songs[0]["artists"])
-            for song in songs[1:]:
-                common_artists.intersection_update(song["artists"])
-
-            if common_artists:
-                channel = next(iter(common_artists))
+            self.quit()
+
+            # Las pistas que agotaron sus reintentos quedan en el error del trabajo
+            if result["missing"]:
+                self.failed_thread.emit(self.job_id, missing_error(result["missing"]))
             else:
-                channel = metadata["entries"][0]["artists"][0]
+                self.finished_thread.emit(self.job_id)
 
-            # Obtiene la URL de la miniatura
-            thumbnail_url = metadata.get("thumbnails", [])[-2]["url"]
+        except JobCancelled:
+            self.cancelled_thread.emit(self.job_id)
 
-            # Obtiene el nombre del álbum
-            album = metadata.get("title").replace("Album - ", "")
-            _char_pattern = r'[\/\\*?"<>|:]' # caracteres que se reemplazaran
-            album_title = re.sub(_char_pattern, " -", album)
+        except Exception as e:
+            print(e)
+            self.failed_thread.emit(self.job_id, str(e))
 
-            # Obtiene el numero de pistas en el album
-            playlist_count = metadata.get("playlist_count")
+        finally:
+            progress_bus.unsubscribe(self.publish_progress)
 
-            # Obtiene la fecha de creacion/modificacion del album
-            date_album = metadata.get("modified_date")
+    # Cancela la descarga: las pistas en curso se detienen y las que faltan no empiezan
+    def cancel(self) -> None:
+        self.cancelled.set()
 
-            save_as = os.path.join(self.save_as, channel, album_title).replace("\\", "/")
-            os.makedirs(save_as, exist_ok=True)
+    # Recibe las fotos del bus de progreso y emite el progreso de este álbum
+    def publish_progress(self, snapshot: dict) -> None:
+        album = snapshot["albums"].get(self.job_id)
+        if album is not None:
+            self.progress_updated.emit(self.job_id, album["album"], album["percentage"])
+
+    # Informa el inicio de la descarga y guarda los datos del álbum en la cola
+    def album_started(self, album_info: dict) -> None:
+        self.download_started.emit({**album_info, "job_id": self.job_id})
+        jobs.update_job(
+            app_config["db_music_list"], self.job_id,
+            cover=album_info["thumbnail"],
+            title=album_info["album"],
+            count_music=album_info["tracks"],
+            artists=album_info["artist"]
+        )
 
-            # Crea la carpeta oculta temporal
-            save_as_temp = os.path.join(save_as, ".temp")
-            os.makedirs(save_as_temp, exist_ok=True)
-            os.system(f"attrib +h {save_as_temp}") # Ocualta la carpeta
-            
-            # Crea la carpeta para los metadatos
-            save_as_metadata = os.path.join(save_as_temp, "metadata")
-            os.makedirs(save_as_metadata, exist_ok=True)
-
-            # Crea la carpeta para los archivos descargados sin metadatos
-            save_as_files = os.path.join(save_as_temp, "files")
-            os.makedirs(save_as_files, exist_ok=True)
-
-
-            album_metadata = {
-                "id": metadata["id"], # ID
-                "channel": channel, # Canal del creador
-                "thumbnail_url": thumbnail_url, # URL de la miniatura
-                "album_title": album_title, # Titulo del album
-                "playlist_count": playlist_count, # Numero de pistas del album
-                "date": date_album, # Fecha de creacion/modificacion
-                "year": date_album[:4], # Año de creacion/modificacion
-                "genre": self.genre, # Genero musical
-                "songs_metadata": songs, # Entidades (canciones)
-                "save_as": save_as # Guardar como
-            }
-            
-            # Guarda los metadatos extraidos en un archivo JSON
-            with open(f"{save_as_metadata}/metadata_url.json", "w", encoding="utf-8") as data:
-                json.dump(metadata, data, indent=4)
-
-            # Guarda los metadatos necesario para el album en un archivo JSON
-            with open(f"{save_as_metadata}/metadata_album.json", "w", encoding="utf-8") as data:
-                json.dump(album_metadata, data, indent=4)
-
-            self.download_thumbnail(thumbnail_url, save_as_metadata, "thumbnail")
-
-            # Formatos compatible la configuración
-            supported_formats = ["flac", "mp3", "wav", "aac", "opus"]
-
-            # Emitir señal con información del álbum
-            album_info = {
-                'thumbnail': thumbnail_url,
-                'album': album_title,
-                'artist': channel,
-                'tracks': playlist_count,
-                'save_as': save_as
-            }
-            self.download_started.emit(album_info)
-
-            # Cuando el formato se encuentra en la lista de formatos permitidos
-            if self._format in supported_formats:
-                postprocessor = {
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': self._format,  # Usa el formato de salida elegido
-                    'preferredquality': '0'  # Calidad máxima (sin pérdida)
-                }
-
-                ydl_opts = {
-                    'ffmpeg_location': config["ffmpeg_path"],  # cambia esto a la ubicación correcta
-                    'format' : "bestaudio/best",
-                    'quiet': True,  # Suprime la salida
-                    'no_warnings': True,  # Suprime las advertencias
-                    'ignoreerrors': True,  # ignora los errores
-                    'postprocessors': [postprocessor],
-                    'progress_hooks': [self.progress_hook],  # Agregar hook de progreso
-                    'outtmpl': fr"{save_as_files}/%(title)s.%(ext)s"  # ruta de destino por defecto
-                }
-
-                with yt_dlp.YoutubeDL(ydl_opts) as ytd:
-                    ytd.download([self.url])
 
-            self.quit()
 
-            self.finished_thread.emit()
+# Recorre un artista, un canal o un archivo de URLs y agrega sus álbumes a la cola a medida que se descubren
+class IngestAlbums_Thread(QThread):
+    album_queued = pyqtSignal(dict)  # Trabajo agregado a la cola (con su ID)
+    finished_ingest = pyqtSignal(dict)  # Álbumes por resultado (agregados, ya en la cola, ya descargados)
 
+    def __init__(self, source: str, _format: str, genre: str, save_as: str, priority: int) -> None:
+        super().__init__()
+        self.source = source
+        self._format = _format
+        self.genre = genre
+        self.save_as = save_as.replace("\\", "/")
+        self.priority = priority
+
+    def run(self) -> None:
+        counts = {ingest.QUEUED: 0, ingest.IN_QUEUE: 0, ingest.PRESENT: 0}
+        try:
+            for album in ingest.enqueue_albums(self.source, self.save_as, self.genre, self._format, app_config, self.priority):
+                counts[album["status"]] += 1
+                if album["status"] == ingest.QUEUED:
+                    self.album_queued.emit({
+                        "id": album["job_id"], "url": album["url"], "save": self.save_as, "genre": self.genre,
+                        "format": self._format, "priority": self.priority, "status": jobs.STATUS_PENDING
+                    })
         except Exception as e:
             print(e)
+        self.finished_ingest.emit(counts)
+
+
+# Lleva las fotos del bus de progreso (publicadas en otro hilo) al hilo de la interfaz
+class ProgressBridge(QObject):
+    snapshot_ready = pyqtSignal(dict)
 
-    # Descarga la miniatura
-    def download_thumbnail(self, thumbnail_url: str, save_as: str, file_name: str) -> str:
-        _response = requests.get(thumbnail_url)
-        if (_response.status_code == 200):
-            save = os.path.join(save_as, f"{file_name}.jpg")
-            with open(save, "wb") as save_thumbnail:
-                save_thumbnail.write(_response.content)
 
+# Sigue la cola de un servicio de descargas (modo cliente): pide los eventos posteriores al último visto
+# y el progreso de los álbumes en curso. Al empezar, o si se perdió eventos, recarga la lista completa
+class ServicePoller(QThread):
+    jobs_loaded = pyqtSignal(list)  # Lista completa de trabajos
+    jobs_changed = pyqtSignal(list)  # Eventos nuevos ({"sequence", "id", "fields"})
+    snapshot_ready = pyqtSignal(dict)  # Progreso de los álbumes en curso (misma forma que el bus de progreso)
+    connection_failed = pyqtSignal(str)  # El servicio no responde (mensaje de error)
+
+    def __init__(self, client: service.ServiceClient, interval: float) -> None:
+        super().__init__()
+        self.client = client
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self) -> None:
+        sequence = None
+        while not self.stopping.is_set():
+            try:
+                if sequence is None:
+                    sequence = self.client.events_after(0)["sequence"] # Antes de la lista: no se pierde ningún cambio
+                    self.jobs_loaded.emit(self.client.list_jobs())
+                result = self.client.events_after(sequence)
+                if result["reset"]:
+                    sequence = None
+                    continue
+                if result["events"]:
+                    self.jobs_changed.emit(result["events"])
+                sequence = result["sequence"]
+                self.snapshot_ready.emit(self.client.progress())
+            except Exception as e:
+                self.connection_failed.emit(str(e))
+                self.stopping.wait(5)
+                continue
+            self.stopping.wait(self.interval)
+
+    def stop(self) -> None:
+        self.stopping.set()
+        self.wait()
 
 
 class PopupAddGenre(QDialog):
@@ -243,10 +244,22 @@ class MainWidget(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        self.max_threads = 3 # Hilos maximos creados
+        self.max_threads = app_config["max_threads"] # Hilos maximos creados
         self.active_threads = 0 # Contador de los hilos creados
         self.mutex = QMutex() # Controla los accesos a los hilos creados
-        self.workers = []
+        self.workers = {} # Hilos activos por ID de trabajo
+        self.ingest_threads = [] # Hilos que recorren discografías
+
+        # Con service_url la cola es la del servicio de descargas y la ventana es solo un cliente
+        self.service = None
+        if app_config["service_url"]:
+            self.service = service.ServiceClient(app_config["service_url"], app_config["service_token"])
+
+        # Los trabajos que quedaron a medias al cerrar la aplicación vuelven a la cola
+        if self.service is None:
+            recovered = jobs.reset_interrupted_jobs(app_config["db_music_list"])
+            if recovered:
+                print(f"Trabajos recuperados: {recovered}")
 
         # self.setStyleSheet("border: 1px solid red")
         self.setWindowTitle(app_config["app_name"]) # titulo de la ventana
@@ -257,6 +270,22 @@ class MainWidget(QMainWindow):
 
         self.showMaximized() # maximiza la ventana
 
+        if self.service is not None: # Lista y progreso desde el servicio
+            self.service_poller = ServicePoller(self.service, 1 / app_config["progress_rate_hz"])
+            self.service_poller.jobs_loaded.connect(self.download_model.load)
+            self.service_poller.jobs_changed.connect(self.jobs_changed)
+            self.service_poller.snapshot_ready.connect(self.service_progress)
+            self.service_poller.connection_failed.connect(self.service_failed)
+            self.service_poller.start()
+            return
+
+        # Progreso global de las descargas (agrupado y publicado unas pocas veces por segundo)
+        self.progress_bridge = ProgressBridge()
+        self.progress_bridge.snapshot_ready.connect(self.update_progress)
+        progress.get_progress_bus(app_config).subscribe(self.progress_bridge.snapshot_ready.emit)
+
+        QTimer.singleShot(0, self.schedule_jobs) # reanuda los trabajos pendientes
+
     def load_UI(self):
         # Widget principal
         main_widget = QWidget() # widget principal que muestra el contenido de la ventana
@@ -288,6 +317,8 @@ class MainWidget(QMainWindow):
         self.form_entry_genre = QComboBox() # entrada del género
         form_title_save = QLabel() # titulo del guardado
         self.form_entry_save_as = QLineEdit() # entrada del guardado
+        form_title_priority = QLabel() # titulo de la prioridad
+        self.form_entry_priority = QComboBox() # entrada de la prioridad
         self.info_text = QLabel() # texto de informacion
         add_music_btn = QPushButton() # boton de agregar musica
 
@@ -310,8 +341,9 @@ class MainWidget(QMainWindow):
         form_title_url.setMinimumSize(400, 35)
         form_grid.addWidget(form_title_url, 3, 1, 1, 2)
 
-        # entrada de la url
+        # entrada de la url (álbum, artista, canal o ruta de un archivo con una URL por línea)
         self.form_entry_url.setPlaceholderText("https://music.youtube.com/playlist?list=0000000000")
+        self.form_entry_url.setToolTip("URL de un álbum, de un artista o canal (toda su discografía) o ruta de un archivo de URLs")
         self.form_entry_url.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         self.form_entry_url.setMaximumSize(400, 35)
         self.form_entry_url.setMinimumSize(400, 35)
@@ -372,6 +404,23 @@ class MainWidget(QMainWindow):
         self.form_entry_save_as.setMinimumSize(400, 35)
         form_grid.addWidget(self.form_entry_save_as, 8, 1, 1, 2)
 
+        # titulo de la prioridad
+        form_title_priority.setText("Prioridad")
+        form_title_priority.setAlignment(Qt.AlignmentFlag.AlignBottom)
+        form_title_priority.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        form_title_priority.setMaximumSize(150, 35)
+        form_title_priority.setMinimumSize(150, 35)
+        form_grid.addWidget(form_title_priority, 9, 1, Qt.AlignmentFlag.AlignCenter)
+
+        # entrada de la prioridad
+        self.form_entry_priority.addItems(list(jobs.PRIORITIES))
+        self.form_entry_priority.setCurrentText("Normal")
+        self.form_entry_priority.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.form_entry_priority.setMaximumSize(150, 35)
+        self.form_entry_priority.setMinimumSize(150, 35)
+        self.form_entry_priority.setStyleSheet("padding-left: 10px")
+        form_grid.addWidget(self.form_entry_priority, 10, 1, Qt.AlignmentFlag.AlignCenter)
+
         # texto informativo
         self.info_text.setText("")
         self.info_text.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
@@ -379,7 +428,7 @@ class MainWidget(QMainWindow):
         self.info_text.setMinimumWidth(400)
         self.info_text.setWordWrap(True)
         self.info_text.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop)
-        form_grid.addWidget(self.info_text, 9, 1, 1, 2)
+        form_grid.addWidget(self.info_text, 11, 1, 1, 2)
 
         # Boton de agregar musica
         add_music_btn.setText("Agregar")
@@ -404,8 +453,86 @@ class MainWidget(QMainWindow):
         content_title.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         content_grid.addWidget(content_title, 1, 1)
 
+        # Progreso global de las descargas
+        self.progress_text = QLabel()
+        self.progress_text.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop)
+        content_grid.addWidget(self.progress_text, 2, 1)
+
+        # Lista de descargas (modelo/vista: solo se dibujan las filas visibles)
+        self.download_model = DownloadListModel(app_config["progress_rate_hz"])
+        if self.service is None: # En modo cliente la lista llega del servicio
+            self.download_model.load(jobs.get_jobs(app_config["db_music_list"]))
+        self.cover_cache = CoverCache(app_config, app_config["cover_cache_items"], COVER_SIZE, self)
+        self.download_list = QListView()
+        self.download_list.setModel(self.download_model)
+        self.download_list.setItemDelegate(DownloadDelegate(self.cover_cache, self.download_list))
+        self.download_list.setUniformItemSizes(True) # Todas las filas miden lo mismo
+        self.download_list.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.cover_cache.cover_ready.connect(lambda url: self.download_list.viewport().update())
+        self.download_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.download_list.customContextMenuRequested.connect(self.job_menu)
+        content_grid.addWidget(self.download_list, 3, 1)
+
         return content_grid
 
+    # Muestra el progreso global con la última foto del bus de progreso
+    def update_progress(self, snapshot):
+        total = snapshot["global"]
+        if not total["albums"]:
+            self.progress_text.setText("")
+            return
+        speed = total["speed"] / (1024 * 1024)
+        eta = f"{int(total['eta']) // 60:02d}:{int(total['eta']) % 60:02d}" if total["eta"] is not None else "--:--"
+        self.progress_text.setText(f"Álbumes en descarga: {total['albums']}  ·  {speed:.1f} MB/s  ·  ETA {eta}")
+
+    # Progreso recibido del servicio: el global y el porcentaje de cada álbum (las claves llegan como texto en JSON)
+    def service_progress(self, snapshot):
+        for job_id, album in snapshot["albums"].items():
+            self.download_model.queue_update(int(job_id), percentage=album["percentage"])
+        self.update_progress(snapshot)
+
+    # Aplica los cambios de los trabajos informados por el servicio
+    def jobs_changed(self, events):
+        for event in events:
+            fields = event["fields"]
+            if fields.get("status") == jobs.STATUS_FINISHED:
+                fields["percentage"] = 100.0
+            self.download_model.queue_update(event["id"], **fields)
+
+    def service_failed(self, error):
+        self.info_text.setText(f"Sin conexión con el servicio: {error}")
+        self.info_text.setStyleSheet("color: #e42222") # Letra roja
+        QTimer.singleShot(5000, self.none)
+
+    # Menú de un trabajo de la lista (clic derecho)
+    def job_menu(self, position):
+        index = self.download_list.indexAt(position)
+        if not index.isValid():
+            return
+        job = index.data(JOB_ROLE)
+        menu = QMenu(self)
+        cancel_action = menu.addAction("Cancelar")
+        cancel_action.setEnabled(job.get("status") in (jobs.STATUS_PENDING, jobs.STATUS_DOWNLOADING))
+        if menu.exec(self.download_list.viewport().mapToGlobal(position)) == cancel_action:
+            self.cancel_job(job["id"])
+
+    # Cancela un trabajo pendiente o en descarga (la descarga en curso se detiene en su hilo)
+    def cancel_job(self, job_id):
+        try:
+            if self.service is not None:
+                cancelled = self.service.cancel(job_id)
+            else:
+                cancelled = jobs.cancel_job(app_config["db_music_list"], job_id)
+        except Exception as e:
+            self.service_failed(str(e))
+            return
+        if not cancelled: # Ya había terminado
+            return
+        self.download_model.queue_update(job_id, status=jobs.STATUS_CANCELLED)
+        worker_thread = self.workers.get(job_id)
+        if worker_thread is not None:
+            worker_thread.cancel()
+
     def action_button(self):
         if self.form_entry_url.text() and self.form_entry_save_as.text(): # Cuando la URL y Guardar Como tienen valor
             
@@ -429,12 +556,22 @@ class MainWidget(QMainWindow):
                 else:
                     self.form_entry_genre.setCurrentIndex(1)
 
+            elif ingest.url_kind(self.form_entry_url.text().strip()) != "album": # Artista, canal o archivo de URLs
+                self.start_ingest(
+                    self.form_entry_url.text().strip(), # URL o archivo
+                    self.form_entry_format.currentText().lower(), # Formato
+                    self.form_entry_genre.currentText(), # Genero
+                    self.form_entry_save_as.text().replace("\\", "/"), # Guardar Como y reemplaza "\" por "/"
+                    jobs.PRIORITIES[self.form_entry_priority.currentText()] # Prioridad
+                )
+
             else: # Ejecuta un hilo nuevo
                 self.start_thread(
                     self.form_entry_url.text(), # URL
                     self.form_entry_format.currentText().lower(), # Formato
                     self.form_entry_genre.currentText(), # Genero
-                    self.form_entry_save_as.text().replace("\\", "/") # Guardar Como y reemplaza "\" por "/"
+                    self.form_entry_save_as.text().replace("\\", "/"), # Guardar Como y reemplaza "\" por "/"
+                    jobs.PRIORITIES[self.form_entry_priority.currentText()] # Prioridad
                 )
 
         else: # Cuando la entrada no contiene ningun dato
@@ -460,64 +597,133 @@ class MainWidget(QMainWindow):
 
     def insert_genre(self, genre):
         if genre:
-            conn = sqlite3.connect(app_config["db_genres"])
-            cur = conn.cursor()
-            cur.execute("INSERT OR IGNORE INTO genres (genre) VALUES (?)", (genre.title(),))
-            conn.commit()
-            conn.close()
+            config.add_genre(app_config["db_genres"], genre)
     
     def extract_format(self):
         format_list = config.get_formats_list(app_config["db_formats"])
 
         return format_list
     
-    # def add_music_list(self, url, save, genre, _format):
-    #     conn = sqlite3.connect("resources/data/music_list.db3")
-    #     cur = conn.cursor()
-    #     cur.execute("INSERT INTO music_list(url, cover, save, title, count_music, artists, genre, format, status, date_music) VALUES (?,?,?,?,?,?,?,?,?,?)", (
-    #         url,
-    #         None,
-    #         save.replace("\\", "/"),
-    #         None,
-    #         None,
-    #         None,
-    #         genre,
-    #         _format,
-    #         "Pendiente",
-    #         datetime.now().strftime("%d-%m-%Y, %H:%M:%S")
-    #     ))
-    #     conn.commit()
-    #     conn.close()
-
-    #     sleep(1)
-
-    def start_thread(self, url, _format, genre, save_as):
+    # Agrega el álbum a la cola persistente y ejecuta el planificador
+    # En modo cliente el álbum se agrega en el servicio y llega a la lista con sus eventos
+    def start_thread(self, url, _format, genre, save_as, priority=0):
+        if self.service is not None:
+            try:
+                job = self.service.submit(url, _format, genre, save_as, priority)
+                print(f"Álbum agregado a la cola del servicio: {job['id']}")
+            except Exception as e:
+                self.service_failed(str(e))
+            return
+        job_id = jobs.add_music_list(app_config["db_music_list"], url, save_as, genre, _format, priority)
+        print(f"Álbum agregado a la cola: {job_id}")
+        self.download_model.queue_update(
+            job_id, url=url, save=save_as, genre=genre, format=_format, priority=priority, status=jobs.STATUS_PENDING
+        )
+        self.schedule_jobs()
+
+    # Recorre la discografía en otro hilo; cada álbum nuevo entra a la cola y a la lista en cuanto se descubre
+    def start_ingest(self, source, _format, genre, save_as, priority=0):
+        if self.service is not None: # El servicio recorre la discografía y agrega los álbumes
+            try:
+                self.service.ingest(source, _format, genre, save_as, priority)
+                self.info_text.setText("Buscando álbumes en el servicio...")
+                QTimer.singleShot(10000, self.none)
+            except Exception as e:
+                self.service_failed(str(e))
+            return
+        ingest_thread = IngestAlbums_Thread(source, _format, genre, save_as, priority)
+        ingest_thread.album_queued.connect(self.album_queued)
+        ingest_thread.finished_ingest.connect(lambda counts: self.ingest_finished(ingest_thread, counts))
+        self.ingest_threads.append(ingest_thread)
+        self.info_text.setText("Buscando álbumes...")
+        ingest_thread.start()
+
+    def album_queued(self, job):
+        self.download_model.queue_insert(job.pop("id"), **job)
+        self.schedule_jobs()
+
+    def ingest_finished(self, ingest_thread, counts):
+        self.info_text.setText(
+            f"Álbumes agregados: {counts[ingest.QUEUED]}  ·  ya en la cola: {counts[ingest.IN_QUEUE]}"
+            f"  ·  ya descargados: {counts[ingest.PRESENT]}"
+        )
+        QTimer.singleShot(10000, self.none)
+        ingest_thread.wait()
+        self.ingest_threads.remove(ingest_thread)
+        ingest_thread.deleteLater()
+
+    # Reparte los trabajos pendientes entre los hilos disponibles
+    # Mientras haya hilos libres, reclama el siguiente trabajo de la cola
+    def schedule_jobs(self):
+        if self.service is not None: # Los trabajadores del servicio descargan la cola
+            return
         self.mutex.lock()
-        if self.active_threads < self.max_threads:
-            worker_thread = DownloadAlbum_Thread(url, _format, genre, save_as)
+        while self.active_threads < self.max_threads:
+            job = jobs.claim_next_job(app_config["db_music_list"])
+            if job is None: # No hay trabajos pendientes
+                break
+            worker_thread = DownloadAlbum_Thread(job["id"], job["url"], job["format"], job["genre"], job["save"])
             worker_thread.finished_thread.connect(self.thread_finished)
+            worker_thread.failed_thread.connect(self.thread_failed)
+            worker_thread.cancelled_thread.connect(self.thread_cancelled)
+            worker_thread.download_started.connect(self.album_started)
+            worker_thread.progress_updated.connect(self.album_progress)
+            self.download_model.queue_update(job["id"], **{**job, "error": None}) # Estado "Descargando"
             worker_thread.start()
-            self.workers.append(worker_thread)
+            self.workers[job["id"]] = worker_thread
             self.active_threads += 1
             print(f"Número de hilos activos: {self.active_threads}")
-        else:
-            print("Has alcanzado el número maximo de hilos, espera que terminen los demas")
         self.mutex.unlock()
 
-    def thread_finished(self):
+    # Muestra los datos del álbum en la lista de descargas
+    def album_started(self, album_info):
+        self.download_model.queue_update(
+            album_info["job_id"], title=album_info["album"], artists=album_info["artist"],
+            count_music=album_info["tracks"], cover=album_info["thumbnail"]
+        )
+
+    def album_progress(self, job_id, album, percentage):
+        self.download_model.queue_update(job_id, percentage=percentage)
+
+    # El estado solo cambia si el trabajo sigue en descarga: un trabajo cancelado durante la
+    # finalización queda como "Cancelado"
+    def thread_finished(self, job_id):
+        if jobs.update_job(app_config["db_music_list"], job_id, jobs.STATUS_FINISHED, expected=jobs.STATUS_DOWNLOADING):
+            self.download_model.queue_update(job_id, status=jobs.STATUS_FINISHED, percentage=100.0)
+            print("Descarga finalizada")
+        self.release_worker(job_id)
+
+    def thread_failed(self, job_id, error):
+        if jobs.update_job(app_config["db_music_list"], job_id, jobs.STATUS_ERROR, expected=jobs.STATUS_DOWNLOADING, error=error):
+            self.download_model.queue_update(job_id, status=jobs.STATUS_ERROR, error=error)
+            print(f"Descarga fallida: {error}")
+        self.release_worker(job_id)
+
+    # Deja de seguir al servicio al cerrar la ventana
+    def closeEvent(self, event):
+        if self.service is not None:
+            self.service_poller.stop()
+        super().closeEvent(event)
+
+    # El trabajo ya quedó cancelado en la cola (cancel_job); solo se libera su hilo
+    def thread_cancelled(self, job_id):
+        self.release_worker(job_id)
+        print("Descarga cancelada")
+
+    # Libera el hilo del trabajo terminado y pasa al siguiente de la cola
+    def release_worker(self, job_id):
         self.mutex.lock()
+        worker_thread = self.workers.pop(job_id, None)
+        if worker_thread is not None:
+            worker_thread.wait() # Espera a que el hilo termine de cerrarse
+            worker_thread.deleteLater()
         self.active_threads -= 1
-        print("Descarga finalizada")
         self.mutex.unlock()
-
-    def music_card(self, thumbnail = None, album_name = None,
-                   artist = None, tracks = None, save_as = None):
-        if not self.findChild(QWidget, album_name):
-            target = QWidget()
-            
+        self.schedule_jobs()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Procesos de trabajo en el ejecutable de Windows
     app = QApplication(sys.argv)
     window = MainWidget()
     window.show()
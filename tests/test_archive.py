@@ -0,0 +1,46 @@
+# Pruebas del archivo de descargas: la sincronización incremental solo descarga las pistas nuevas o cambiadas
+from app.core import archive
+
+
+def song(video_id: str, date: str = "20240101") -> dict:
+    return {"id": video_id, "title": video_id, "date": date}
+
+
+def test_pending_songs_skips_archived_tracks(tmp_path):
+    database_path = archive.create_database_archive(str(tmp_path / "archive.db"))
+    root = str(tmp_path / "music")
+    for video_id in ("a", "b", "c"):
+        path = tmp_path / f"{video_id}.flac"
+        if video_id != "c": # El archivo de "c" se borró del disco
+            path.write_bytes(b"audio")
+        archive.add_track(database_path, root, "flac", video_id, "OLAK5uy_x", "20240101", str(path))
+
+    archived = archive.get_album_tracks(database_path, root, "flac", "OLAK5uy_x")
+    songs = [song("a"), song("b", date="20240301"), song("c"), song("d")]
+    assert [item["id"] for item in archive.pending_songs(songs, archived)] == ["b", "c", "d"]
+
+
+def test_archive_is_per_destination_and_format(tmp_path):
+    database_path = archive.create_database_archive(str(tmp_path / "archive.db"))
+    path = tmp_path / "a.flac"
+    path.write_bytes(b"audio")
+    archive.add_track(database_path, "music", "flac", "a", "OLAK5uy_x", "20240101", str(path))
+    assert archive.get_album_tracks(database_path, "music", "mp3", "OLAK5uy_x") == {}
+    assert archive.get_album_tracks(database_path, "other", "flac", "OLAK5uy_x") == {}
+    assert archive.pending_songs([song("a")], archive.get_album_tracks(database_path, "music", "mp3", "OLAK5uy_x"))
+
+
+def test_album_date(tmp_path):
+    database_path = archive.create_database_archive(str(tmp_path / "archive.db"))
+    assert archive.get_album_date(database_path, "music", "flac", "OLAK5uy_x") is None
+    archive.set_album_date(database_path, "music", "flac", "OLAK5uy_x", "20240101")
+    archive.set_album_date(database_path, "music", "flac", "OLAK5uy_x", "20240301") # Se reemplaza
+    assert archive.get_album_date(database_path, "music", "flac", "OLAK5uy_x") == "20240301"
+    assert archive.get_album_date(database_path, "music", "mp3", "OLAK5uy_x") is None
+
+
+def test_update_track_paths(tmp_path):
+    database_path = archive.create_database_archive(str(tmp_path / "archive.db"))
+    archive.add_track(database_path, "music", "flac", "a", "OLAK5uy_x", "20240101", "music/Album/.temp/converted/a.flac")
+    archive.update_track_paths(database_path, "music", "flac", {"a": "music/Album/a.flac"})
+    assert archive.get_album_tracks(database_path, "music", "flac", "OLAK5uy_x")["a"]["path"] == "music/Album/a.flac"
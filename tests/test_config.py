@@ -0,0 +1,70 @@
+# Pruebas del arranque: las carpetas y las bases de datos solo se crean la primera vez o al cambiar un esquema
+import json
+import os
+import pytest
+from app.core import archive
+from app.core import config
+from app.core import jobs
+from app.core import library
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "get_user_profile", lambda: str(tmp_path))
+    return tmp_path / "Music-DL"
+
+
+def read_settings(json_path: str) -> dict:
+    with open(json_path, "r") as config_file:
+        return json.load(config_file)
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("el arranque no debe crear carpetas ni abrir bases de datos")
+
+
+def block_setup(monkeypatch) -> None:
+    monkeypatch.setattr(config, "create_directory", fail)
+    monkeypatch.setattr(config, "create_database_catalog", fail)
+    monkeypatch.setattr(jobs, "create_database_music_list", fail)
+    monkeypatch.setattr(archive, "create_database_archive", fail)
+    monkeypatch.setattr(library, "create_database_library", fail)
+
+
+def test_first_run_creates_databases(home):
+    json_path = config.app_config()
+    settings = read_settings(json_path)
+    assert sorted(os.listdir(home)) == ["Config", "Databases"]
+    for key in ("db_formats", "db_music_list", "db_archive", "db_library"):
+        assert os.path.exists(settings[key])
+    assert settings["schema_versions"]["music_list"] == jobs.SCHEMA_VERSION
+    assert "Pop" in config.get_genres_list(settings["db_genres"])
+
+
+def test_warm_start_has_no_side_effects(home, monkeypatch):
+    json_path = config.app_config()
+    modified = os.stat(json_path).st_mtime_ns
+    block_setup(monkeypatch)
+    assert config.app_config() == json_path
+    assert os.stat(json_path).st_mtime_ns == modified
+
+
+def test_outdated_schema_runs_setup(home, monkeypatch):
+    json_path = config.app_config()
+    settings = read_settings(json_path)
+    settings["schema_versions"]["music_list"] = jobs.SCHEMA_VERSION - 1
+    with open(json_path, "w") as config_file:
+        json.dump(settings, config_file)
+    created = []
+    monkeypatch.setattr(jobs, "create_database_music_list", lambda path: created.append(path) or path)
+    config.app_config()
+    assert created == [settings["db_music_list"]]
+    assert read_settings(json_path)["schema_versions"]["music_list"] == jobs.SCHEMA_VERSION
+
+
+def test_missing_database_runs_setup(home):
+    json_path = config.app_config()
+    settings = read_settings(json_path)
+    os.remove(settings["db_archive"])
+    config.app_config()
+    assert os.path.exists(settings["db_archive"])
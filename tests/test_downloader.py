@@ -0,0 +1,86 @@
+# Pruebas del descargador: una pista enlazada desde otro álbum lleva las etiquetas y la portada de su álbum
+import os
+import shutil
+import subprocess
+import pytest
+from app.core import downloader
+from app.core import tagging
+
+
+FFMPEG = shutil.which("ffmpeg")
+pytestmark = pytest.mark.skipif(FFMPEG is None, reason="FFmpeg no está instalado")
+
+
+def ffmpeg(*arguments: str) -> bytes:
+    return subprocess.run([FFMPEG, "-hide_banner", "-loglevel", "error", "-y", *arguments], capture_output=True, check=True).stdout
+
+
+# Etiquetas de texto de un archivo (las de la pista de audio en opus, las globales en los demás formatos)
+def read_tags(path: str) -> dict:
+    source = ["-map_metadata", "0:s:a:0"] if path.endswith(".opus") else []
+    lines = ffmpeg("-i", path, *source, "-f", "ffmetadata", "-").decode("utf-8").splitlines()
+    tags = dict(line.split("=", 1) for line in lines[1:] if "=" in line)
+    tags.pop("encoder", None)
+    return {key.lower(): value for key, value in tags.items()}
+
+
+def read_cover(path: str) -> bytes:
+    return ffmpeg("-i", path, "-map", "0:v", "-c", "copy", "-f", "image2", "-")
+
+
+def make_cover(path: str, color: str) -> str:
+    ffmpeg("-f", "lavfi", "-i", f"color={color}:s=32x32", "-frames:v", "1", path)
+    return path
+
+
+# Pista del primer álbum con sus etiquetas y su portada (como pista de imagen o como etiqueta en opus)
+def make_track(path: str, tags: dict, cover: str) -> str:
+    if path.endswith(".opus"):
+        tags = {**tags, "METADATA_BLOCK_PICTURE": tagging.picture_block(cover)}
+        metadata = tagging.write_ffmetadata(f"{path}.ffmeta", tags)
+        ffmpeg("-f", "lavfi", "-i", "sine=d=1", "-i", metadata, "-map_metadata:s:a", "1:g", "-c:a", "libopus", path)
+    else:
+        metadata = tagging.write_ffmetadata(f"{path}.ffmeta", tags)
+        ffmpeg(
+            "-f", "lavfi", "-i", "sine=d=1", "-i", metadata, "-i", cover,
+            "-map", "0:a", "-map", "2:v", "-map_metadata", "1", "-c:v", "copy", "-disposition:v", "attached_pic", path
+        )
+    os.remove(metadata)
+    return path
+
+
+FIRST_ALBUM = {"title": "Canción", "album": "Primer álbum", "album_artist": "Artista A", "genre": "Rock", "track": "3/10", "disc": "2"}
+SECOND_ALBUM = {"title": "Canción", "album": "Recopilatorio", "album_artist": "Varios", "genre": "Pop", "track": "7/12"}
+
+
+@pytest.mark.parametrize("extension", ["flac", "mp3", "opus"])
+def test_linked_track_gets_album_tags(tmp_path, extension):
+    first_cover = make_cover(str(tmp_path / "first.jpg"), "red")
+    second_cover = make_cover(str(tmp_path / "second.jpg"), "blue")
+    os.makedirs(tmp_path / "first")
+    os.makedirs(tmp_path / "second")
+    source = make_track(str(tmp_path / "first" / f"track.{extension}"), FIRST_ALBUM, first_cover)
+    source_data = open(source, "rb").read()
+
+    # Como en Downloader.track_tagging: opus lleva la portada como etiqueta, los demás como pista de imagen
+    tags, cover = dict(SECOND_ALBUM), second_cover
+    if extension == "opus":
+        tags["METADATA_BLOCK_PICTURE"] = tagging.picture_block(second_cover)
+        cover = None
+    target = downloader.link_track(FFMPEG, source, str(tmp_path / "second" / f"track.{extension}"), tags, cover)
+
+    # FFmpeg lee la portada de opus (METADATA_BLOCK_PICTURE) como una pista de imagen, igual que en los demás
+    assert read_tags(target) == SECOND_ALBUM
+    assert read_cover(target) == open(second_cover, "rb").read()
+
+    # El archivo del primer álbum no cambia (el enlace duro se reemplaza, no se reescribe)
+    assert open(source, "rb").read() == source_data
+    assert read_tags(source)["album"] == "Primer álbum"
+    assert not os.path.samefile(source, target)
+
+
+def test_linked_track_without_tags(tmp_path):
+    cover = make_cover(str(tmp_path / "cover.jpg"), "red")
+    source = make_track(str(tmp_path / "source.flac"), FIRST_ALBUM, cover)
+    target = downloader.link_track(FFMPEG, source, str(tmp_path / "target.flac"), None, None)
+    assert read_tags(target) == read_tags(source)
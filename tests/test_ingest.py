@@ -0,0 +1,68 @@
+# Pruebas de la ingesta: un álbum de YouTube Music ya archivado no se vuelve a agregar a la cola
+import sys
+import types
+from app.core import archive
+from app.core import ingest
+from app.core import jobs
+from app.core.downloader import format_root, parse_formats
+
+
+BROWSE_URL = "https://music.youtube.com/browse/MPREb_abc123"
+PLAYLIST_ID = "OLAK5uy_abc123"
+
+
+# yt_dlp falso: la página del álbum redirige a su lista de reproducción (igual que YoutubeTab)
+def fake_yt_dlp(requested: list) -> types.ModuleType:
+    class YoutubeDL:
+        def __init__(self, options: dict) -> None:
+            pass
+
+        def extract_info(self, url: str, download: bool = True, process: bool = True) -> dict:
+            requested.append(url)
+            return {"_type": "url", "url": f"https://music.youtube.com/playlist?list={PLAYLIST_ID}"}
+
+        def close(self) -> None:
+            pass
+
+    return types.SimpleNamespace(YoutubeDL=YoutubeDL)
+
+
+def make_settings(tmp_path) -> dict:
+    return {
+        "db_archive": archive.create_database_archive(str(tmp_path / "archive.db")),
+        "db_music_list": jobs.create_database_music_list(str(tmp_path / "music_list.db")),
+    }
+
+
+def test_browse_url_resolves_to_playlist(monkeypatch):
+    requested = []
+    monkeypatch.setitem(sys.modules, "yt_dlp", fake_yt_dlp(requested))
+    assert list(ingest.iter_album_urls(BROWSE_URL)) == [f"https://music.youtube.com/playlist?list={PLAYLIST_ID}"]
+    assert requested == [BROWSE_URL]
+
+
+def test_archived_browse_url_is_present(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, "yt_dlp", fake_yt_dlp([]))
+    settings = make_settings(tmp_path)
+    save = str(tmp_path / "music").replace("\\", "/")
+    _format = "mp3,flac"
+
+    # El descargador archiva el álbum con el ID de la lista de reproducción (metadata["id"])
+    formats = parse_formats(_format)
+    for item in formats:
+        archive.set_album_date(settings["db_archive"], format_root(save, formats, item), item, PLAYLIST_ID, "20240101")
+
+    albums = list(ingest.enqueue_albums(BROWSE_URL, save, "", _format, settings))
+    assert [album["status"] for album in albums] == [ingest.PRESENT]
+    assert jobs.get_jobs(settings["db_music_list"]) == []
+
+
+def test_queued_browse_url_is_found(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, "yt_dlp", fake_yt_dlp([]))
+    settings = make_settings(tmp_path)
+    save = str(tmp_path / "music").replace("\\", "/")
+
+    first = list(ingest.enqueue_albums(BROWSE_URL, save, "", "mp3", settings))
+    second = list(ingest.enqueue_albums(f"https://music.youtube.com/playlist?list={PLAYLIST_ID}", save, "", "mp3", settings))
+    assert [album["status"] for album in first] == [ingest.QUEUED]
+    assert second == [{"url": second[0]["url"], "status": ingest.IN_QUEUE, "job_id": first[0]["job_id"]}]
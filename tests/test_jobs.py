@@ -0,0 +1,131 @@
+# Pruebas de la cola: cancelación, concesiones de los trabajadores y reclamos simultáneos
+import sqlite3
+import threading
+import time
+from app.core import jobs
+
+
+def test_cancelled_job_keeps_status(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    job_id = jobs.add_music_list(database_path, "https://music.youtube.com/playlist?list=OLAK5uy_abc123", "music", "", "mp3")
+    assert jobs.claim_next_job(database_path)["id"] == job_id
+    assert jobs.cancel_job(database_path, job_id)
+
+    assert not jobs.update_job(database_path, job_id, jobs.STATUS_FINISHED, expected=jobs.STATUS_DOWNLOADING)
+    assert not jobs.update_job(database_path, job_id, jobs.STATUS_ERROR, expected=jobs.STATUS_DOWNLOADING, error="x")
+    job = jobs.get_job(database_path, job_id)
+    assert job["status"] == jobs.STATUS_CANCELLED
+    assert job["error"] is None
+
+
+def test_downloading_job_finishes(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    job_id = jobs.add_music_list(database_path, "https://music.youtube.com/playlist?list=OLAK5uy_abc123", "music", "", "mp3")
+    jobs.claim_next_job(database_path)
+
+    assert jobs.update_job(database_path, job_id, jobs.STATUS_FINISHED, expected=jobs.STATUS_DOWNLOADING)
+    assert jobs.get_job(database_path, job_id)["status"] == jobs.STATUS_FINISHED
+
+
+def add_jobs(database_path: str, count: int) -> list[int]:
+    return [
+        jobs.add_music_list(database_path, f"https://music.youtube.com/playlist?list=OLAK5uy_{index}", "music", "", "mp3")
+        for index in range(count)
+    ]
+
+
+def expire_lease(database_path: str, job_id: int) -> None:
+    conn = sqlite3.connect(database_path)
+    conn.execute("UPDATE music_list SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+    conn.commit()
+    conn.close()
+
+
+def test_expired_lease_goes_to_another_worker(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    job_id, = add_jobs(database_path, 1)
+    assert jobs.claim_next_job(database_path, "node-a", 60)["id"] == job_id
+    assert jobs.reclaim_expired_jobs(database_path, 3) == [] # La concesión sigue vigente
+
+    expire_lease(database_path, job_id)
+    assert jobs.reclaim_expired_jobs(database_path, 3) == [{"id": job_id, "status": jobs.STATUS_PENDING, "error": None}]
+    job = jobs.claim_next_job(database_path, "node-b", 60)
+    assert (job["id"], job["worker"], job["attempts"]) == (job_id, "node-b", 2)
+
+    # El trabajador anterior ya no puede renovar, actualizar, terminar ni devolver el trabajo
+    assert not jobs.renew_lease(database_path, job_id, "node-a", 60)
+    assert not jobs.update_job(database_path, job_id, title="Álbum", worker="node-a")
+    assert not jobs.update_job(database_path, job_id, jobs.STATUS_FINISHED, worker="node-a")
+    assert not jobs.release_job(database_path, job_id, "node-a")
+    assert jobs.update_job(database_path, job_id, jobs.STATUS_FINISHED, worker="node-b")
+    assert jobs.get_job(database_path, job_id)["status"] == jobs.STATUS_FINISHED
+
+
+def test_renew_lease_after_expiry(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    job_id, = add_jobs(database_path, 1)
+    jobs.claim_next_job(database_path, "node-a", 60)
+
+    # Vencida pero aún no recuperada: nadie más tiene el trabajo, el latido tardío lo conserva
+    expire_lease(database_path, job_id)
+    assert jobs.renew_lease(database_path, job_id, "node-a", 60)
+    assert jobs.reclaim_expired_jobs(database_path, 3) == []
+
+    # Recuperada: el latido ya no la renueva y el trabajador debe abandonar el trabajo
+    expire_lease(database_path, job_id)
+    jobs.reclaim_expired_jobs(database_path, 3)
+    assert not jobs.renew_lease(database_path, job_id, "node-a", 60)
+    assert jobs.get_job(database_path, job_id)["status"] == jobs.STATUS_PENDING
+
+
+def test_reclaim_gives_up_after_max_attempts(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    job_id, = add_jobs(database_path, 1)
+    for attempt in range(2):
+        jobs.claim_next_job(database_path, f"node-{attempt}", 60)
+        expire_lease(database_path, job_id)
+        reclaimed, = jobs.reclaim_expired_jobs(database_path, 2)
+    assert reclaimed["status"] == jobs.STATUS_ERROR
+    assert jobs.claim_next_job(database_path, "node-c", 60) is None
+
+
+def test_release_job(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    job_id, = add_jobs(database_path, 1)
+    jobs.claim_next_job(database_path, "node-a", 60)
+    assert not jobs.release_job(database_path, job_id, "node-b")
+    assert jobs.release_job(database_path, job_id, "node-a")
+    job = jobs.get_job(database_path, job_id)
+    assert (job["status"], job["worker"], job["lease_until"]) == (jobs.STATUS_PENDING, None, None)
+    assert not jobs.release_job(database_path, job_id, "node-a") # Ya no es suyo
+    assert jobs.claim_next_job(database_path, "node-b", 60)["id"] == job_id
+
+
+def test_reset_interrupted_jobs_keeps_leased_jobs(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    local_job, leased_job = add_jobs(database_path, 2)
+    jobs.claim_next_job(database_path) # Descarga de la propia interfaz, sin concesión
+    jobs.claim_next_job(database_path, "node-a", 60)
+    assert jobs.reset_interrupted_jobs(database_path) == 1
+    assert jobs.get_job(database_path, local_job)["status"] == jobs.STATUS_PENDING
+    assert jobs.get_job(database_path, leased_job)["status"] == jobs.STATUS_DOWNLOADING
+
+
+# Varios nodos que reclaman a la vez (cada uno con su conexión) nunca reciben el mismo álbum
+def test_concurrent_claims_are_exclusive(tmp_path):
+    database_path = jobs.create_database_music_list(str(tmp_path / "music_list.db"))
+    job_ids = add_jobs(database_path, 20)
+    claimed = []
+    start = threading.Barrier(8)
+
+    def worker(name: str) -> None:
+        start.wait()
+        while (job := jobs.claim_next_job(database_path, name, 60)) is not None:
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker, args=(f"node-{index}",)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == job_ids
@@ -0,0 +1,96 @@
+# Pruebas de la biblioteca local: búsqueda FTS5, pistas repetidas y reconstrucción incremental
+import json
+import os
+from app.core import library
+
+
+def album(album_id: str, title: str, songs: list[tuple[str, str]], genre: str = "Rock") -> dict:
+    return {
+        "id": album_id, "album_title": title, "genre": genre, "year": "2024",
+        "songs_metadata": [{"id": video_id, "title": song_title, "artist_principal": "Los Planetas"}
+                           for video_id, song_title in songs],
+    }
+
+
+def add(database_path: str, metadata: dict, folder: str, _format: str = "flac") -> None:
+    files = {song["id"]: f"{folder}/{song['title']}.{_format}" for song in metadata["songs_metadata"]}
+    library.add_album(database_path, metadata, files, _format)
+
+
+def test_search_prefix_and_diacritics(tmp_path):
+    database_path = library.create_database_library(str(tmp_path / "library.db"))
+    add(database_path, album("A", "Una semana en el motor de un autobús", [("1", "Segundo premio"), ("2", "Cumpleaños total")]), "music/A")
+    assert [track["title"] for track in library.search(database_path, "cumpleanos")] == ["Cumpleaños total"]
+    assert [track["title"] for track in library.search(database_path, "segu prem")] == ["Segundo premio"]
+    assert len(library.search(database_path, "autobus planetas")) == 2
+    assert library.search(database_path, "  ¿? ") == []
+
+
+def test_search_bm25_cutoff(tmp_path, monkeypatch):
+    database_path = library.create_database_library(str(tmp_path / "library.db"))
+    add(database_path, album("A", "Rock", [("1", "Rock rock rock"), ("2", "Otra canción")]), "music/A")
+    add(database_path, album("B", "Varios", [("3", "Canción nueva")], genre="Rock"), "music/B")
+
+    # Pocas coincidencias: primero la más relevante (bm25)
+    assert library.search(database_path, "rock")[0]["video_id"] == "1"
+    # Más coincidencias que RANK_LIMIT: no se calcula la relevancia, primero las más recientes
+    monkeypatch.setattr(library, "RANK_LIMIT", 2)
+    assert [track["video_id"] for track in library.search(database_path, "rock")] == ["3", "2", "1"]
+    assert len(library.search(database_path, "rock", limit=1)) == 1
+
+
+def test_duplicates(tmp_path):
+    database_path = library.create_database_library(str(tmp_path / "library.db"))
+    add(database_path, album("A", "Primer álbum", [("1", "Canción"), ("2", "Otra")]), "music/A")
+    add(database_path, album("A", "Primer álbum", [("1", "Canción")]), "music/A", _format="mp3") # Mismo álbum
+    assert library.duplicates(database_path) == {}
+    add(database_path, album("B", "Recopilatorio", [("1", "Canción")]), "music/B")
+    assert sorted(library.duplicates(database_path)["1"]) == ["music/A/Canción.flac", "music/A/Canción.mp3", "music/B/Canción.flac"]
+
+
+def test_find_track_needs_file_on_disk(tmp_path):
+    database_path = library.create_database_library(str(tmp_path / "library.db"))
+    folder = str(tmp_path / "A").replace("\\", "/")
+    add(database_path, album("A", "Primer álbum", [("1", "Canción")]), folder)
+    assert library.find_track(database_path, "1", "flac") is None
+    os.makedirs(folder)
+    open(f"{folder}/Canción.flac", "wb").close()
+    assert library.find_track(database_path, "1", "flac") == f"{folder}/Canción.flac"
+    assert library.find_track(database_path, "1", "mp3") is None
+
+
+# Álbum en el disco como lo deja el descargador: archivos en la carpeta y metadatos en .metadata
+def write_album(root: str, metadata: dict) -> str:
+    folder = os.path.join(root, metadata["album_title"])
+    os.makedirs(os.path.join(folder, ".metadata"))
+    for song in metadata["songs_metadata"]:
+        open(os.path.join(folder, f"{song['title']}.flac"), "wb").close()
+    metadata_path = os.path.join(folder, ".metadata", "metadata_album.json")
+    with open(metadata_path, "w", encoding="utf-8") as data:
+        json.dump(metadata, data)
+    return metadata_path
+
+
+def test_rebuild_is_incremental(tmp_path):
+    database_path = library.create_database_library(str(tmp_path / "library.db"))
+    root = str(tmp_path / "music").replace("\\", "/")
+    first = write_album(root, album("A", "Primero", [("1", "Uno"), ("2", "Dos")]))
+    write_album(root, album("B", "Segundo", [("3", "Tres")]))
+    assert library.rebuild(database_path, root) == {"albums": 2, "removed": 0}
+    assert len(library.search(database_path, "planetas")) == 3
+
+    # Sin cambios en los metadatos: no se vuelve a leer ningún álbum
+    assert library.rebuild(database_path, root) == {"albums": 0, "removed": 0}
+
+    # Metadatos modificados: solo se lee ese álbum
+    with open(first, "w", encoding="utf-8") as data:
+        json.dump(album("A", "Primero", [("1", "Uno"), ("2", "Dos")], genre="Indie"), data)
+    stat = os.stat(first)
+    os.utime(first, (stat.st_atime, stat.st_mtime + 10))
+    assert library.rebuild(database_path, root) == {"albums": 1, "removed": 0}
+    assert len(library.search(database_path, "indie")) == 2
+
+    # Un archivo borrado del disco sale de la biblioteca
+    os.remove(os.path.join(root, "Segundo", "Tres.flac"))
+    assert library.rebuild(database_path, root) == {"albums": 0, "removed": 1}
+    assert library.search(database_path, "tres") == []
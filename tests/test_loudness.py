@@ -0,0 +1,99 @@
+# Pruebas del medidor de sonoridad con las señales de EBU Tech 3341 (sonoridad integrada y compuertas),
+# el pico real y las etiquetas ReplayGain
+import io
+import pytest
+from app.core import loudness
+
+np = pytest.importorskip("numpy")
+
+RATE = loudness.RATE
+
+
+# Seno estéreo de 1 kHz con el mismo nivel de pico (dBFS) en los dos canales
+def sine(dbfs: float, seconds: float, frequency: float = 1000.0, phase: float = 0.0):
+    time = np.arange(round(seconds * RATE)) / RATE
+    wave = 10 ** (dbfs / 20) * np.sin(2 * np.pi * frequency * time + phase)
+    return np.repeat(wave[:, None], 2, axis=1).astype(np.float32)
+
+
+# Mide una señal entregándola en bloques del tamaño indicado (como measure_stream)
+def measure(samples, block: int = loudness.BLOCK_SAMPLES) -> dict:
+    meter = loudness.LoudnessMeter()
+    for start in range(0, len(samples), block):
+        meter.add(samples[start:start + block])
+    return meter.result()
+
+
+def sequence(*segments: tuple[float, float]):
+    return np.concatenate([sine(dbfs, seconds) for dbfs, seconds in segments])
+
+
+# EBU Tech 3341, tabla 1: casos 1 a 5 (tolerancia ±0.1 LU)
+@pytest.mark.parametrize("segments, expected", [
+    ([(-23, 20)], -23.0), # 1: seno a -23 dBFS
+    ([(-33, 20)], -33.0), # 2: seno a -33 dBFS
+    ([(-36, 10), (-23, 60), (-36, 10)], -23.0), # 3: compuerta relativa
+    ([(-72, 10), (-36, 10), (-23, 60), (-36, 10), (-72, 10)], -23.0), # 4: compuertas absoluta y relativa
+    ([(-26, 20), (-20, 20.1), (-26, 20)], -23.0), # 5: niveles distintos por encima de la compuerta
+])
+def test_tech_3341_integrated(segments, expected):
+    assert measure(sequence(*segments))["integrated"] == pytest.approx(expected, abs=0.1)
+
+
+# El resultado no depende de cómo se parte el audio en bloques (cola del filtro, bloques de 100 ms)
+def test_block_size_does_not_change_result():
+    samples = sequence((-36, 3), (-23, 6), (-30, 3))
+    reference = measure(samples)
+    for block in (1000, 4800, 19200 + 7, 200000):
+        result = measure(samples, block)
+        assert result["integrated"] == pytest.approx(reference["integrated"], abs=0.01)
+        assert result["peak"] == pytest.approx(reference["peak"], rel=1e-4)
+
+
+def test_silence_has_no_loudness():
+    assert measure(np.zeros((RATE * 5, 2), dtype=np.float32))["integrated"] is None
+    assert measure(sine(-80, 5))["integrated"] is None # Por debajo de la compuerta absoluta (-70 LUFS)
+
+
+# Seno a fs/4 desfasado 45°: las muestras valen ±0.707 del pico, el pico real está entre muestras
+def test_true_peak_between_samples():
+    samples = sine(-6, 2, frequency=RATE / 4, phase=np.pi / 4)
+    assert np.abs(samples).max() == pytest.approx(10 ** (-6 / 20) * np.sqrt(0.5), rel=1e-3)
+    peak_db = 20 * np.log10(measure(samples)["peak"])
+    assert -6.5 < peak_db < -5.8 # Tolerancia de EBU Tech 3341 para el pico real: +0.2/-0.4 dB
+
+
+def test_true_peak_of_low_frequency_sine():
+    assert 20 * np.log10(measure(sine(-6, 2))["peak"]) == pytest.approx(-6, abs=0.05)
+
+
+def test_measure_stream_reads_pcm():
+    samples = sequence((-23, 10))
+    stream = io.BytesIO(samples.astype("<f4").tobytes() + b"\x00\x00") # Un resto que no completa una muestra
+    assert loudness.measure_stream(stream)["integrated"] == pytest.approx(-23.0, abs=0.1)
+
+
+def test_album_measurement():
+    quiet = measure(sequence((-26, 10)))
+    loud = measure(sequence((-20, 10)))
+    album = loudness.album_measurement([quiet, loud])
+    # Las dos pistas duran lo mismo: la potencia media está 10·log10((10^-2.6 + 10^-2.0) / 2) por encima
+    expected = 10 * np.log10((10 ** -2.6 + 10 ** -2.0) / 2)
+    assert album["integrated"] == pytest.approx(expected, abs=0.1)
+    assert album["peak"] == max(quiet["peak"], loud["peak"])
+    assert loudness.album_measurement([quiet, quiet])["integrated"] == quiet["integrated"]
+
+
+def test_replaygain_tags():
+    track = {"integrated": -14.0, "peak": 0.891251}
+    album = {"integrated": -16.5, "peak": 0.95}
+    assert loudness.replaygain_tags(track, album, "flac") == {
+        "REPLAYGAIN_TRACK_GAIN": "-4.00 dB",
+        "REPLAYGAIN_TRACK_PEAK": "0.891251",
+        "REPLAYGAIN_ALBUM_GAIN": "-1.50 dB",
+        "REPLAYGAIN_ALBUM_PEAK": "0.950000",
+    }
+    # opus: ganancia respecto a -23 LUFS en Q7.8 (RFC 7845)
+    assert loudness.replaygain_tags(track, album, "opus") == {"R128_TRACK_GAIN": "-2304", "R128_ALBUM_GAIN": "-1664"}
+    assert loudness.replaygain_tags({"integrated": -200.0, "peak": 0.0}, album, "opus")["R128_TRACK_GAIN"] == "32767"
+    assert loudness.replaygain_tags({"integrated": None, "peak": 0.0}, album, "mp3") == {}
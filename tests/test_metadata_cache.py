@@ -0,0 +1,38 @@
+# Pruebas del caché de metadatos: varios hilos que guardan el mismo álbum no dejan un archivo a medias
+import os
+import threading
+from app.core import metadata_cache
+
+
+URL = "https://music.youtube.com/playlist?list=OLAK5uy_abc123"
+
+
+def test_cache_key_uses_playlist_id():
+    assert metadata_cache.cache_key(URL) == "OLAK5uy_abc123"
+    assert metadata_cache.cache_key("https://www.youtube.com/playlist?list=OLAK5uy_abc123&si=x") == "OLAK5uy_abc123"
+
+
+def test_concurrent_saves_of_the_same_album(tmp_path):
+    cache_path = str(tmp_path)
+    metadatas = [{"id": "OLAK5uy_abc123", "title": f"Álbum {index}", "entries": [{"id": str(track)} for track in range(2000)]}
+                 for index in range(8)]
+    start = threading.Barrier(len(metadatas))
+    errors = []
+
+    def save(metadata: dict) -> None:
+        start.wait()
+        try:
+            for _ in range(5):
+                metadata_cache.save_metadata(cache_path, URL, metadata)
+        except Exception as e: # Con un archivo temporal compartido, os.replace falla o publica uno a medias
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(metadata,)) for metadata in metadatas]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert metadata_cache.load_metadata(cache_path, URL, ttl=60) in metadatas
+    assert os.listdir(cache_path) == ["OLAK5uy_abc123.json.gz"] # No quedan archivos temporales
@@ -0,0 +1,138 @@
+# Pruebas de los reintentos: espera con retroceso, reintento, pistas perdidas y cancelación
+import random
+import threading
+import time
+import types
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
+import pytest
+from app.core import retry
+from app.core.downloader import AlbumDownloader
+
+
+def test_backoff_delay_bounds():
+    random.seed(1)
+    for attempt in range(12):
+        limit = min(60, 2 * 2 ** attempt)
+        delays = [retry.backoff_delay(attempt, 2, 60) for _ in range(200)]
+        assert all(0 <= delay <= limit for delay in delays)
+    assert max(retry.backoff_delay(20, 2, 60) for _ in range(200)) > 30 # La espera máxima no se reduce
+
+
+def test_backoff_delay_cap(monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda low, high: high)
+    assert retry.backoff_delay(0, 2, 60) == 2
+    assert retry.backoff_delay(3, 2, 60) == 16
+    assert retry.backoff_delay(10, 2, 60) == 60
+
+
+def test_schedule_waits_and_returns_result():
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        started = time.monotonic()
+        future = retry.get_retry_queue().schedule(0.05, pool, lambda value: value * 2, 21)
+        assert future.result(timeout=5) == 42
+        assert time.monotonic() - started >= 0.05
+
+
+def test_schedule_passes_error():
+    def failing():
+        raise OSError("sin conexión")
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = retry.get_retry_queue().schedule(0, pool, failing)
+        with pytest.raises(OSError):
+            future.result(timeout=5)
+
+
+def test_cancel_while_waiting():
+    calls = []
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = retry.get_retry_queue().schedule(0.2, pool, calls.append, 1)
+        assert future.cancel()
+        assert wait([future], timeout=0.1).done == {future} # El descargador deja de esperarlo en seguida
+        time.sleep(0.3)
+    assert calls == []
+
+
+def test_cancel_before_pool_starts_function():
+    calls = []
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(release.wait) # Ocupa el único hilo del pool
+        future = retry.get_retry_queue().schedule(0, pool, calls.append, 1)
+        time.sleep(0.1) # El reintento ya pasó al pool y espera un hilo
+        assert future.cancel()
+        release.set()
+    assert calls == []
+
+
+# Un Future del pool cancelado (p. ej. el pool se cerró) resuelve el reintento en lugar de dejarlo pendiente
+def test_cancelled_inner_future_resolves_retry():
+    inner = Future()
+    pool = types.SimpleNamespace(submit=lambda function, *args: inner)
+    future = retry.get_retry_queue().schedule(0, pool, print)
+    time.sleep(0.1)
+    inner.cancel()
+    done, _ = wait([future], timeout=5)
+    assert done == {future}
+    with pytest.raises(CancelledError):
+        future.result()
+
+
+# Descargador mínimo para probar download_tracks sin red: download_track se reemplaza en cada prueba
+def make_downloader(download_track, retries: int = 2) -> AlbumDownloader:
+    downloader = AlbumDownloader.__new__(AlbumDownloader)
+    downloader.settings = {"track_workers": 2, "track_retries": retries, "retry_base_delay": 0.01, "retry_max_delay": 0.02}
+    downloader.cancelled = threading.Event()
+    downloader.metrics = types.SimpleNamespace(track=lambda *args, **kwargs: None)
+    downloader.converted = []
+    downloader.track_converted = lambda song, _format, future: downloader.converted.append((song["id"], _format))
+    downloader.download_track = types.MethodType(download_track, downloader)
+    return downloader
+
+
+def converted_track(path: str) -> tuple[None, dict]:
+    conversion = Future()
+    conversion.set_result(path)
+    return None, {"mp3": conversion}
+
+
+def test_track_is_retried_until_it_succeeds():
+    calls = []
+
+    def download_track(self, song, formats, submitted):
+        calls.append(song["id"])
+        if len(calls) < 3:
+            raise OSError("HTTP 503")
+        return converted_track("track.mp3")
+
+    downloader = make_downloader(download_track)
+    missing = downloader.download_tracks([{"id": "a", "title": "A"}], {"a": ["mp3"]})
+    assert missing == {}
+    assert calls == ["a", "a", "a"]
+    assert downloader.converted == [("a", "mp3")]
+
+
+def test_track_gives_up_after_retries():
+    def download_track(self, song, formats, submitted):
+        raise OSError("HTTP 404")
+
+    downloader = make_downloader(download_track, retries=2)
+    needed = {"a": ["mp3"]}
+    missing = downloader.download_tracks([{"id": "a", "title": "A"}], needed)
+    assert missing["a"]["attempts"] == 3
+    assert missing["a"]["formats"] == ["mp3"]
+    assert "HTTP 404" in missing["a"]["error"]
+
+
+def test_cancelled_job_is_not_retried():
+    calls = []
+
+    def download_track(self, song, formats, submitted):
+        calls.append(song["id"])
+        self.cancelled.set()
+        raise OSError("HTTP 503")
+
+    downloader = make_downloader(download_track)
+    missing = downloader.download_tracks([{"id": "a", "title": "A"}], {"a": ["mp3"]})
+    assert missing == {}
+    assert calls == ["a"]
@@ -0,0 +1,72 @@
+# Pruebas del servicio de descargas: registro de eventos, clave de la API y concesiones a través del servicio
+import pytest
+from app.core import jobs
+from app.core.service import JobService
+
+
+@pytest.fixture
+def service(tmp_path):
+    settings = {
+        "db_music_list": jobs.create_database_music_list(str(tmp_path / "music_list.db")),
+        "app_output_path": str(tmp_path / "Output"),
+        "lease_seconds": 60,
+        "service_token": "secreto",
+        "service_events": 3,
+        "progress_rate_hz": 5,
+    }
+    service = JobService(settings, "127.0.0.1", 0)
+    yield service
+    service.server.server_close()
+
+
+def test_events_after(service):
+    for job_id in range(1, 3):
+        service.record(job_id, status=jobs.STATUS_PENDING)
+    result = service.events_after(0)
+    assert (result["sequence"], result["reset"]) == (2, False)
+    assert [event["id"] for event in result["events"]] == [1, 2]
+    assert service.events_after(2) == {"sequence": 2, "events": [], "reset": False}
+
+
+def test_events_after_buffer_reset(service):
+    for job_id in range(1, 6): # El registro guarda solo los 3 últimos eventos
+        service.record(job_id, status=jobs.STATUS_PENDING)
+    assert service.events_after(1)["reset"] # Se perdió el evento 2: el cliente recarga la lista
+    result = service.events_after(2) # El siguiente evento que necesita (3) sigue en el registro
+    assert not result["reset"]
+    assert [event["sequence"] for event in result["events"]] == [3, 4, 5]
+
+
+def test_events_after_restarted_service(service):
+    service.record(1, status=jobs.STATUS_PENDING)
+    result = service.events_after(40) # Número de un servicio anterior (el registro empieza de nuevo)
+    assert result["reset"]
+    assert result["sequence"] == 1
+
+
+def test_authorized(service):
+    assert service.authorized("Bearer secreto")
+    assert not service.authorized("Bearer secret")
+    assert not service.authorized("Bearer secretos")
+    assert not service.authorized("Bearer señal") # Caracteres fuera de ASCII no rompen la comparación
+    assert not service.authorized(None)
+    service.token = ""
+    assert service.authorized(None)
+
+
+# Un nodo cuya concesión venció no puede terminar el trabajo que ya tiene otro nodo
+def test_stale_worker_cannot_finish(service):
+    status, job = service.dispatch("POST", "/jobs", {}, {"url": "https://music.youtube.com/playlist?list=OLAK5uy_a"})
+    assert status == 201
+    assert service.claim("node-a")["id"] == job["id"]
+    service.lease_seconds = -1 # La siguiente concesión ya nace vencida
+    assert service.heartbeat(job["id"], "node-a")
+    assert jobs.reclaim_expired_jobs(service.database_path, 3)[0]["status"] == jobs.STATUS_PENDING
+    service.lease_seconds = 60
+
+    assert service.claim("node-b")["id"] == job["id"]
+    assert not service.heartbeat(job["id"], "node-a")
+    assert service.dispatch("POST", f"/jobs/{job['id']}/finish", {}, {"worker": "node-a", "status": jobs.STATUS_FINISHED}) \
+        == (200, {"ok": False})
+    assert service.finish(job["id"], "node-b", jobs.STATUS_FINISHED)
+    assert jobs.get_job(service.database_path, job["id"])["worker"] == "node-b"
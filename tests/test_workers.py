@@ -0,0 +1,74 @@
+# Pruebas de los procesos de trabajo: al cerrar un proceso no quedan procesos de FFmpeg huérfanos
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import pytest
+from app.core import transcoder
+from app.core import workers
+
+
+# Proceso que simula una conversión larga: escribe su archivo de salida y espera
+SLOW_CONVERSION = "import sys, time; open(sys.argv[1], 'w').write('a medias'); time.sleep(60)"
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+# Proceso de trabajo mínimo: el mismo aviso de cierre que _worker_main y una conversión en curso
+def fake_worker(connection, stop, target: str) -> None:
+    threading.Thread(target=workers._watch_stop, args=(stop,), daemon=True).start()
+    stage = transcoder.get_transcoder({"ffmpeg_path": "", "transcode_workers": 1})
+    process = stage.start_process([sys.executable, "-c", SLOW_CONVERSION, target], target)
+    connection.send(process.pid)
+    time.sleep(60)
+
+
+def test_terminate_stops_running_conversions(tmp_path):
+    stage = transcoder.Transcoder("", 1, 1)
+    target = str(tmp_path / "track.flac")
+    process = stage.start_process([sys.executable, "-c", SLOW_CONVERSION, target], target)
+    assert wait_for(lambda: os.path.exists(target))
+    open(f"{target}.ffmeta", "w").close()
+
+    stage.terminate()
+    assert process.poll() is not None
+    assert not os.path.exists(target)
+    assert not os.path.exists(f"{target}.ffmeta")
+    with pytest.raises(RuntimeError): # Las conversiones en cola ya no empiezan
+        stage.start_process([sys.executable, "-c", ""], None)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="os.kill(pid, 0) no comprueba procesos en Windows")
+def test_stopped_worker_leaves_no_orphans(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    connection, child_connection = context.Pipe()
+    stop = context.Event()
+    target = str(tmp_path / "track.flac")
+    process = context.Process(target=fake_worker, args=(child_connection, stop, target), daemon=True)
+    process.start()
+    child_connection.close()
+    ffmpeg_pid = connection.recv()
+    assert wait_for(lambda: os.path.exists(target))
+
+    started = time.monotonic()
+    workers.ProcessPool.stop((process, connection, stop))
+    assert time.monotonic() - started < workers.STOP_TIMEOUT # Terminó por el aviso, no hubo que matarlo
+    assert process.exitcode == 1
+    assert wait_for(lambda: not alive(ffmpeg_pid))
+    assert not os.path.exists(target)